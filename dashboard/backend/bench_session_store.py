@@ -0,0 +1,68 @@
+# File: bench_session_store.py
+"""Write latency of the session store as the number of stored sessions grows.
+
+Fills a scratch store with sessions one chat turn at a time, as /process/message does, and
+reports write and read latency percentiles over a window of writes at each checkpoint.
+
+Usage: python bench_session_store.py [--backend sqlite|json] [--sessions 100000] [--window 1000]
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+from services.session_store import SqliteStore, Store
+
+def session_value(turn: int) -> dict:
+    return {
+        "chatHistory": [
+            {"role": "user", "content": f"Is the company affected by the new e-invoicing mandate? ({turn})"},
+            {"role": "assistant", "content": "Basierend auf der Analyse ist das Unternehmen nicht betroffen. " * 8}
+        ],
+        "timestamp": time.time()
+    }
+
+def percentile(values: List[float], p: int) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark session store write latency against store size")
+    parser.add_argument("--backend", choices=("sqlite", "json"), default="sqlite")
+    parser.add_argument("--sessions", type=int, default=100000, help="Sessions stored by the end of the run")
+    parser.add_argument("--window", type=int, default=1000, help="Writes timed at each checkpoint")
+    args = parser.parse_args()
+
+    checkpoints = sorted({n for n in (1000, 10000, 25000, 50000, 75000, 100000) if n <= args.sessions} | {args.sessions})
+    with tempfile.TemporaryDirectory() as scratch:
+        if args.backend == "sqlite":
+            store = SqliteStore(Path(scratch) / "sessions.db", legacy_path=None)
+        else:
+            store = Store(Path(scratch) / "sessions.json")
+        print(f"{'sessions':>10} {'write p50 ms':>13} {'write p99 ms':>13} {'write mean ms':>14} {'read p50 ms':>12}")
+        stored = 0
+        for checkpoint in checkpoints:
+            # Untimed fill up to the checkpoint, then a timed window of new sessions
+            while stored < checkpoint - args.window:
+                store.set(f"sessions.bench_{stored}", session_value(stored))
+                stored += 1
+            writes, reads = [], []
+            while stored < checkpoint:
+                start_time = time.perf_counter()
+                store.set(f"sessions.bench_{stored}", session_value(stored))
+                writes.append((time.perf_counter() - start_time) * 1000)
+                start_time = time.perf_counter()
+                store.get(f"sessions.bench_{stored // 2}")
+                reads.append((time.perf_counter() - start_time) * 1000)
+                stored += 1
+            print(
+                f"{checkpoint:>10} {percentile(writes, 50):>13.3f} {percentile(writes, 99):>13.3f} "
+                f"{statistics.mean(writes):>14.3f} {percentile(reads, 50):>12.3f}",
+                flush=True
+            )
+        if args.backend == "sqlite":
+            store.close()
+
+if __name__ == "__main__":
+    main()
@@ -4,5 +4,76 @@ from pathlib import Path
 SYSTEM_PROMPT = """1. CORE IDENTITY & PERSONA\n\nYou are \"Juris-Diction(AI)ry\", a highly specialized AI assistant designed for tax professionals. [...]"""  # Full prompt here (truncated for brevity)
 MASTER_PROMPT = ""  # Fixed spacing; populate if needed
 SESSION_FILE = Path("/app/data/sessions.json")  # Absolute path for Docker persistence
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")  # sqlite (workers on one host), redis (workers on any node), or json for the legacy single-process store
+SESSION_DB = Path(os.getenv("SESSION_DB", "/app/data/sessions.db"))  # SQLite session database; SESSION_FILE is migrated into it on first use
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))  # Sessions idle longer than this are evicted; 0 keeps them forever
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "100000"))  # Least recently used sessions beyond this are evicted; 0 for no limit
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "300"))  # Seconds between session eviction sweeps
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "1.0"))  # Seconds between batched writes of changed sessions, the most a crash can lose; 0 writes each update at once
+SESSION_FLUSH_MAX_BATCH = int(os.getenv("SESSION_FLUSH_MAX_BATCH", "500"))  # Changed sessions that trigger a write before the interval is up
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")  # Used when SESSION_BACKEND is redis
+SESSION_REDIS_PREFIX = os.getenv("SESSION_REDIS_PREFIX", "juris:")  # Key prefix, so several deployments can share one Redis
 MOCK_DATA_CSV = Path("mock_data.csv")  # Path to CSV file containing mock data
-DWANI_API_BASE_URL = os.getenv('DWANI_API_BASE_URL')
\ No newline at end of file
+DWANI_API_BASE_URL = os.getenv('DWANI_API_BASE_URL')
+EXTRACTION_CACHE_DIR = Path(os.getenv("EXTRACTION_CACHE_DIR", "/app/data/extraction_cache"))  # On-disk cache of PDF extraction results
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))  # LRU eviction above this size
+EXTRACTION_PROMPT_VERSION = os.getenv("EXTRACTION_PROMPT_VERSION", "2")  # Bump when the page extraction prompt changes
+DOCUMENT_REGISTRY_DIR = Path(os.getenv("DOCUMENT_REGISTRY_DIR", "/app/data/documents"))  # Extraction results chat turns refer to by documentId
+DOCUMENT_REGISTRY_MAX_BYTES = int(os.getenv("DOCUMENT_REGISTRY_MAX_BYTES", str(1024 * 1024 * 1024)))  # LRU eviction above this size
+DOCUMENT_MEMORY_ENTRIES = int(os.getenv("DOCUMENT_MEMORY_ENTRIES", "32"))  # Recently used documents kept parsed in memory per process
+
+TEXT_LAYER_ENABLED = os.getenv("TEXT_LAYER_ENABLED", "true").lower() == "true"  # Use the PDF text layer before vision extraction
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", "40"))  # Fewer non-whitespace chars means a scanned/image page
+TEXT_LAYER_MIN_ALNUM_RATIO = float(os.getenv("TEXT_LAYER_MIN_ALNUM_RATIO", "0.5"))  # Below this the text layer is treated as junk
+TEXT_LAYER_SCAN_MIN_COVERAGE = float(os.getenv("TEXT_LAYER_SCAN_MIN_COVERAGE", "0.5"))  # A page this much covered by one image is a scan; its text layer is OCR output
+RENDER_WINDOW_PAGES = int(os.getenv("RENDER_WINDOW_PAGES", "20"))  # Max rendered pages held in memory per document
+# Every uvicorn worker has its own render pool, so by default the cores are split between the WEB_CONCURRENCY workers
+RENDER_POOL_WORKERS = int(os.getenv("RENDER_POOL_WORKERS", str(max(1, (os.cpu_count() or 1) // int(os.getenv("WEB_CONCURRENCY", "1"))))))  # Processes for PDF rendering and JPEG/base64 encoding per uvicorn worker
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "8"))  # Concurrent LLM calls per healthy replica of a model backend
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "200"))  # Queued LLM calls per backend before new requests get 429
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "32"))  # Connection pool size per model backend
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "16"))  # Idle connections kept open per model backend
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "120"))  # Seconds before an idle connection is closed
+LLM_MAX_MODEL_LEN = int(os.getenv("LLM_MAX_MODEL_LEN", "8192"))  # Must match vLLM --max-model-len
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "4096"))  # Upper bound for max_tokens on extraction calls
+MAX_PAGES_PER_BATCH = int(os.getenv("MAX_PAGES_PER_BATCH", "8"))  # Hard cap on pages packed into one extraction call
+OUTPUT_TOKENS_PER_FULL_PAGE = int(os.getenv("OUTPUT_TOKENS_PER_FULL_PAGE", "1000"))  # Expected output for a densely printed page
+SCRATCH_DIR = os.getenv("SCRATCH_DIR") or ("/dev/shm" if os.access("/dev/shm", os.W_OK) else None)  # Per-request upload staging; tmpfs keeps rendering off disk
+INGEST_CHUNK_BYTES = int(os.getenv("INGEST_CHUNK_BYTES", str(1024 * 1024)))  # Read size when streaming uploads into scratch space
+RENDER_PROFILES = {  # Named page rendering settings; max_long_edge None keeps the rendered size
+    "fidelity": {"dpi": 200, "grayscale": False, "max_long_edge": None, "autocrop": False, "format": "JPEG", "quality": 85},  # The pre-profile rendering
+    "standard": {"dpi": 150, "grayscale": False, "max_long_edge": 1600, "autocrop": True, "format": "JPEG", "quality": 85},
+    "compact": {"dpi": 120, "grayscale": True, "max_long_edge": 1024, "autocrop": True, "format": "WEBP", "quality": 75},
+}
+DEFAULT_RENDER_PROFILE = os.getenv("DEFAULT_RENDER_PROFILE", "fidelity")  # Used when neither the request nor the model picks one; smaller profiles are opt-in
+MODEL_RENDER_PROFILES = {  # Per-model default render profile
+    "gemma3": os.getenv("GEMMA3_RENDER_PROFILE", DEFAULT_RENDER_PROFILE),  # "compact" suits it: SigLIP downsamples to 896x896 anyway
+    "gpt-oss": os.getenv("GPT_OSS_RENDER_PROFILE", DEFAULT_RENDER_PROFILE),
+}
+BLANK_PAGE_MAX_STDDEV = float(os.getenv("BLANK_PAGE_MAX_STDDEV", "2.0"))  # Grayscale pixel std-dev at or below which a page is blank
+DUPLICATE_PAGE_MAX_HAMMING = int(os.getenv("DUPLICATE_PAGE_MAX_HAMMING", "16"))  # Max differing bits of the 256-bit page hash
+DUPLICATE_PAGE_MAX_PIXEL_DIFF = float(os.getenv("DUPLICATE_PAGE_MAX_PIXEL_DIFF", "2.0"))  # Max mean 64x64 thumbnail difference for duplicates
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # Background extraction jobs run at once per process
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))  # Waiting jobs before POST /jobs answers 429
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))  # Finished jobs stay readable this long
+JOB_PUBLISH_INTERVAL = float(os.getenv("JOB_PUBLISH_INTERVAL", "1.0"))  # Seconds between progress writes of running jobs to the shared session store
+MODEL_IMAGE_TOKENS = {  # Vision token estimate per image: one token per patch_pixels² block, capped at max_tokens
+    "gemma3": {"patch_pixels": 28, "max_tokens": 256},  # SigLIP resizes every image to a fixed 256-token grid
+    "gpt-oss": {"patch_pixels": 28, "max_tokens": 16384},
+}
+LLM_RETRY_MAX_ATTEMPTS = int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "4"))  # Tries per extraction call on transport errors (connection, timeout, 429, 5xx)
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))  # Seconds; backoff ceiling doubles per attempt, actual delay is jittered below it
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))  # Cap on a single backoff delay
+RETRY_BUDGET_PER_PAGE = float(os.getenv("RETRY_BUDGET_PER_PAGE", "0.75"))  # Extra extraction calls a document may spend on recovery, per vision page
+RETRY_BUDGET_MIN_CALLS = int(os.getenv("RETRY_BUDGET_MIN_CALLS", "8"))  # Floor of the recovery budget for short documents
+GUIDED_DECODING_ENABLED = os.getenv("GUIDED_DECODING_ENABLED", "true").lower() == "true"  # Send a JSON schema of the expected page keys with extraction calls
+MODEL_ENDPOINTS = {  # Comma-separated OpenAI-compatible base URLs per model; calls are spread over every replica listed
+    "gemma3": os.getenv("GEMMA3_ENDPOINTS", f"{DWANI_API_BASE_URL}/v1"),
+    "gpt-oss": os.getenv("GPT_OSS_ENDPOINTS", f"{DWANI_API_BASE_URL}/v1"),
+}
+POOL_PROBE_INTERVAL = float(os.getenv("POOL_PROBE_INTERVAL", "10"))  # Seconds between health probes of each replica
+POOL_PROBE_TIMEOUT = float(os.getenv("POOL_PROBE_TIMEOUT", "3"))  # A probe slower than this counts as a failure
+POOL_EJECT_AFTER_FAILURES = int(os.getenv("POOL_EJECT_AFTER_FAILURES", "3"))  # Consecutive connection/5xx errors or failed probes that eject a replica
+PORTFOLIO_MAX_CONCURRENCY = int(os.getenv("PORTFOLIO_MAX_CONCURRENCY", "4"))  # Pair analyses one bulk portfolio request runs at once
+PORTFOLIO_MAX_PAIRS = int(os.getenv("PORTFOLIO_MAX_PAIRS", "500"))  # Company x country pairs accepted per bulk request
+PORTFOLIO_MAX_PROFILE_BYTES = int(os.getenv("PORTFOLIO_MAX_PROFILE_BYTES", str(64 * 1024)))  # Larger profiles would not fit the model context in pairs
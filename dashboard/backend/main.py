@@ -3,8 +3,12 @@ import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from middleware import TimingMiddleware
-from routers import clients, process
+from routers import admin, clients, jobs, process
 from database import startup_event
+from services.render_pool import render_pool
+from services.ai_client import client_registry
+from services.job_manager import job_manager
+from services.session_store import session_store, session_sweeper
 
 from logging_config import logger  # Import logger from the config module
 
@@ -22,10 +26,26 @@ app.add_middleware(TimingMiddleware)
 
 app.include_router(clients.router)
 app.include_router(process.router)
+app.include_router(jobs.router)
+app.include_router(admin.router)
 
 @app.on_event("startup")
 async def startup():
     await startup_event()
+    render_pool.start()
+    client_registry.start()
+    job_manager.start()
+    session_store.start()
+    session_sweeper.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await session_sweeper.stop()
+    await job_manager.stop()
+    # After the jobs, whose answers also update sessions
+    await session_store.stop()
+    render_pool.stop()
+    await client_registry.close()
 
 @app.get("/health")
 async def health_check():
@@ -0,0 +1,69 @@
+# File: routers/admin.py
+import asyncio
+from fastapi import APIRouter
+from services.extraction_cache import extraction_cache
+from services.render_pool import render_pool
+from services.llm_scheduler import llm_scheduler
+from services.job_manager import job_manager
+from services.json_salvage import parse_stats
+from services.ai_client import client_registry
+from services.single_flight import extraction_flights, answer_flights
+from services.session_store import session_store, session_sweeper
+from services.document_registry import document_registry
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+@router.get("/extraction-cache")
+async def get_extraction_cache_stats():
+    """Report size and hit/miss counters of the PDF extraction cache."""
+    return await asyncio.to_thread(extraction_cache.stats)
+
+@router.delete("/extraction-cache")
+async def purge_extraction_cache():
+    """Remove every cached PDF extraction result."""
+    removed = await asyncio.to_thread(extraction_cache.purge)
+    logger.info(f"Purged {removed} extraction cache entries")
+    return {"removed": removed}
+
+@router.get("/render-pool")
+async def get_render_pool_stats():
+    """Report render pool size and queue depth."""
+    return render_pool.stats()
+
+@router.get("/llm-scheduler")
+async def get_llm_scheduler_stats():
+    """Report in-flight and queued LLM calls per model backend."""
+    return llm_scheduler.stats()
+
+@router.get("/jobs")
+async def get_job_stats():
+    """Report background job counts by status."""
+    return job_manager.stats()
+
+@router.get("/json-salvage")
+async def get_json_salvage_stats():
+    """Report how extraction answers were parsed and how many pages salvaging saved from retry."""
+    return parse_stats.report()
+
+@router.get("/backends")
+async def get_backend_stats():
+    """Report health, outstanding requests and latency of every model replica."""
+    return client_registry.stats()
+
+@router.get("/single-flight")
+async def get_single_flight_stats():
+    """Report how many extractions and answers were shared between concurrent identical requests."""
+    return {"extraction": extraction_flights.stats(), "answer": answer_flights.stats()}
+
+@router.get("/sessions")
+async def get_session_stats():
+    """Report live sessions, how many were evicted as idle or least recently used, and write-behind lag."""
+    return {**(await asyncio.to_thread(session_sweeper.stats)), "write_behind": session_store.stats()}
+
+@router.get("/documents")
+async def get_document_registry_stats():
+    """Report stored documents and how often chat turns found them in memory or on disk."""
+    return await asyncio.to_thread(document_registry.stats)
@@ -8,10 +8,11 @@ from typing import List
 from pydantic import Field  # If using explicit Fields in schemas
 
 import os
-from openai import OpenAI
 import json
 from sqlalchemy import text
 from typing import Any, Dict
+from services.ai_client import get_openai_client
+from services.llm_scheduler import llm_scheduler
 
 
 router = APIRouter(prefix="/api/clients", tags=["clients"])
@@ -98,7 +99,6 @@ async def delete_client(
 # File: routers/clients.py (corrected query_database function)
 
 import os
-from openai import OpenAI
 import json
 from sqlalchemy import text
 from typing import Any, Dict
@@ -124,8 +124,6 @@ def query_database(sql_query: str, db: Session) -> str:
         return f"Error executing query: {str(e)}"
 
 
-DWANI_API_BASE_URL = os.getenv('DWANI_API_BASE_URL')
-
 @router.post("/natural-query", response_model=Dict[str, Any])
 async def natural_query(
     query_data: Dict[str, str],  # e.g., {"user_query": "Show me all pending clients from USA"}
@@ -139,11 +137,8 @@ async def natural_query(
     if not user_query:
         raise HTTPException(status_code=400, detail="Missing 'user_query' in request body")
     
-    # Initialize OpenAI-compatible client for DashScope
-    client = OpenAI(
-        api_key="asdasd",
-        base_url= f"{DWANI_API_BASE_URL}/v1",
-    )
+    # Shared OpenAI-compatible client for the model backend
+    client = get_openai_client("gemma3")
 
     # Define the tool for database querying
     tools = [
@@ -176,12 +171,13 @@ async def natural_query(
     ]
 
     # Make the initial API call
-    response = client.chat.completions.create(
-        model="gemma3",  # Use Qwen3-VL model; adjust if exact name differs (e.g., qwen-vl-max)
-        messages=messages,
-        tools=tools,
-        tool_choice="auto",
-    )
+    async with llm_scheduler.slot("gemma3"):
+        response = await client.chat.completions.create(
+            model="gemma3",  # Use Qwen3-VL model; adjust if exact name differs (e.g., qwen-vl-max)
+            messages=messages,
+            tools=tools,
+            tool_choice="auto",
+        )
 
     assistant_message = response.choices[0].message
     messages.append(assistant_message)
@@ -202,12 +198,13 @@ async def natural_query(
                 print(f"Tool result: {tool_result}")  # For debugging; remove in production
 
         # Make follow-up API call with tool results
-        response = client.chat.completions.create(
-            model="gemma3",
-            messages=messages,
-            tools=tools,
-            tool_choice="auto",
-        )
+        async with llm_scheduler.slot("gemma3"):
+            response = await client.chat.completions.create(
+                model="gemma3",
+                messages=messages,
+                tools=tools,
+                tool_choice="auto",
+            )
         assistant_message = response.choices[0].message
         messages.append(assistant_message)
 
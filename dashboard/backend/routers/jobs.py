@@ -0,0 +1,97 @@
+# File: routers/jobs.py
+from fastapi import APIRouter, Form, File, UploadFile, HTTPException
+import asyncio
+import time
+from uuid import uuid4
+from constants import SYSTEM_PROMPT
+from services.ai_client import get_openai_client
+from services.pdf_processor import extract_text_from_pdf, resolve_render_profile
+from services.ingestion import stage_upload
+from services.job_manager import job_manager
+from services.llm_scheduler import llm_scheduler
+from services.document_registry import document_registry
+from routers.process import answer_prompt, read_text_upload
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+@router.post("", status_code=202)
+async def create_job(
+    file: UploadFile = File(...),
+    prompt: str = Form(...),
+    sessionId: str = Form(None),
+    model: str = Form(default="gemma3"),
+    is_extraction: bool = Form(False),
+    system_prompt: str = Form(default=SYSTEM_PROMPT),
+    render_profile: str = Form(None)
+):
+    """Queue a file for background processing; poll GET /jobs/{jobId} for progress and the result."""
+    if not file:
+        raise HTTPException(status_code=400, detail="Please upload a file")
+    if not prompt.strip():
+        raise HTTPException(status_code=400, detail="Please provide a non-empty prompt")
+
+    try:
+        get_openai_client(model)
+    except ValueError as e:
+        logger.error(f"Invalid model: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    llm_scheduler.admit(model)
+    session_id = sessionId if sessionId else f"session_{int(time.time())}_{str(uuid4())}"
+
+    filename = file.filename.lower()
+    file_ext = filename.split('.')[-1] if '.' in filename else ''
+    document = None
+    text_content = None
+    if file_ext == 'pdf':
+        resolve_render_profile(model, render_profile)
+        # The upload is closed when this handler returns, so the job works from the scratch copy
+        try:
+            document = await stage_upload(file)
+        finally:
+            file.file.close()
+    else:
+        text_content = await read_text_upload(file)
+
+    async def work(job):
+        all_results, skipped_pages, extraction_info = {"content": text_content}, [], {}
+        if document:
+            all_results, skipped_pages, extraction_info = await extract_text_from_pdf(
+                document, filename, model, render_profile, job.progress
+            )
+        if is_extraction:
+            return {
+                "extracted_text": all_results,
+                "skipped_pages": skipped_pages,
+                **extraction_info,
+                "documentId": (await asyncio.to_thread(document_registry.register, all_results, filename)).id,
+                "sessionId": session_id
+            }
+        return await answer_prompt(model, prompt, system_prompt, session_id, all_results, skipped_pages, extraction_info, filename)
+
+    try:
+        job = await job_manager.submit(work, cleanup=document.cleanup if document else None, filename=filename, model=model)
+    except HTTPException:
+        if document:
+            document.cleanup()
+        raise
+    return {"jobId": job.id, "status": job.status, "sessionId": session_id}
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """Status, per-page progress and partial or final results of a job, whichever worker runs it."""
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job, whichever worker runs it."""
+    job = await job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return {"jobId": job["jobId"], "status": job["status"]}
@@ -1,20 +1,90 @@
 # File: routers/process.py
 from fastapi import APIRouter, Form, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
 import time
 from uuid import uuid4
 import json
-from typing import Dict, List
-from constants import SYSTEM_PROMPT
+import hashlib
+from typing import Dict, List, Optional
+from constants import SYSTEM_PROMPT, PORTFOLIO_MAX_CONCURRENCY, PORTFOLIO_MAX_PROFILE_BYTES
 from services.ai_client import get_openai_client
-from services.pdf_processor import extract_text_from_pdf
-from services.session_store import session_store
+from services.pdf_processor import ExtractionProgress, extract_text_from_pdf, resolve_render_profile
+from services.ingestion import stage_upload
+from services.session_store import append_turns, session_store
+from services.llm_scheduler import llm_scheduler, llm_flow
+from services.single_flight import answer_flights
+from services.document_registry import document_registry
+from services.llm_retry import RetryBudget
+from services.portfolio import PORTFOLIO_PROMPT, PortfolioSummary, analyze_pair, plan_pairs, read_archive, read_profile
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/process", tags=["process"])
 
+async def read_text_upload(file: UploadFile) -> str:
+    """Read a non-PDF upload as text."""
+    content = await file.read()
+    file.file.close()
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        return content.decode('latin-1', errors='ignore')
+
+async def answer_prompt(
+    model: str,
+    prompt: str,
+    system_prompt: str,
+    session_id: str,
+    all_results: Dict,
+    skipped_pages: List[int],
+    extraction_info: Dict,
+    filename: Optional[str] = None
+) -> Dict:
+    """Answer the prompt over the extracted text and record the exchange in the session."""
+    try:
+        document = await asyncio.to_thread(document_registry.register, all_results, filename)
+        results_str = document.text
+    except Exception as e:
+        logger.error(f"Failed to serialize all_results: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to serialize extracted text: {str(e)}")
+
+    # Recorded together with the answer, as one update of whatever the session holds by then
+    question = {"role": "user", "content": prompt}
+
+    async def complete():
+        client = get_openai_client(model)
+        async with llm_scheduler.slot(model):
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": [{"type": "text", "text": f"User prompt: {prompt}\nExtracted text: {results_str}"}]}
+                ],
+                temperature=0.3,
+                max_tokens=2048
+            )
+        return response.choices[0].message.content
+
+    # Identical questions over identical text share one completion; each caller still records it in its own session
+    flight_key = hashlib.sha256("\0".join([model, system_prompt, prompt, results_str]).encode()).hexdigest()
+    try:
+        generated_response, _ = await answer_flights.run(flight_key, complete)
+        session_store.update(f"sessions.{session_id}", append_turns(question, {"role": "assistant", "content": generated_response}))
+        return {
+            "response": generated_response,
+            "extracted_text": all_results,
+            "skipped_pages": skipped_pages,
+            **extraction_info,
+            "documentId": document.id,
+            "sessionId": session_id
+        }
+    except Exception as e:
+        logger.error(f"Final API request failed: {str(e)}")
+        session_store.update(f"sessions.{session_id}", append_turns(question, {"role": "assistant", "content": f"⚠️ Error processing question: {str(e)}"}))
+        raise HTTPException(status_code=500, detail=f"Final API request failed: {str(e)}")
+
 @router.post("/file")
 async def process_file(
     file: UploadFile = File(...),
@@ -22,7 +92,8 @@ async def process_file(
     sessionId: str = Form(None),
     model: str = Form(default="gemma3"),
     is_extraction: bool = Form(False),
-    system_prompt: str = Form(default=SYSTEM_PROMPT)
+    system_prompt: str = Form(default=SYSTEM_PROMPT),
+    render_profile: str = Form(None)
 ):
     """Endpoint to process file and extract text based on prompt."""
     if not file:
@@ -30,25 +101,28 @@ async def process_file(
     if not prompt.strip():
         raise HTTPException(status_code=400, detail="Please provide a non-empty prompt")
 
+    llm_scheduler.admit(model)
+    llm_flow.set(str(uuid4()))
+
     filename = file.filename.lower()
-    content = await file.read()
-    file.file.close()  # Explicit close
 
     all_results = {}
     skipped_pages = []
+    extraction_info = {}
 
     # Handle non-PDF files as text
     file_ext = filename.split('.')[-1] if '.' in filename else ''
     if file_ext != 'pdf':
-        try:
-            content_str = content.decode('utf-8')
-        except UnicodeDecodeError:
-            content_str = content.decode('latin-1', errors='ignore')
-        all_results = {"content": content_str}
+        all_results = {"content": await read_text_upload(file)}
         skipped_pages = []
     else:
-        # PDF extraction
-        all_results, skipped_pages = await extract_text_from_pdf(content, filename, model)
+        # PDF extraction renders from a private scratch copy of the spooled upload
+        try:
+            document = await stage_upload(file)
+        finally:
+            file.file.close()
+        with document:
+            all_results, skipped_pages, extraction_info = await extract_text_from_pdf(document, filename, model, render_profile)
 
     session_id = sessionId if sessionId else f"session_{int(time.time())}_{str(uuid4())}"
 
@@ -56,64 +130,106 @@ async def process_file(
         return {
             "extracted_text": all_results,
             "skipped_pages": skipped_pages,
+            **extraction_info,
+            "documentId": (await asyncio.to_thread(document_registry.register, all_results, filename)).id,
             "sessionId": session_id
         }
 
-    try:
-        results_str = json.dumps(all_results)
-    except Exception as e:
-        logger.error(f"Failed to serialize all_results: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to serialize extracted text: {str(e)}")
+    return await answer_prompt(model, prompt, system_prompt, session_id, all_results, skipped_pages, extraction_info, filename)
 
-    session_data = session_store.get(f"sessions.{session_id}", {"chatHistory": []})
-    chat_history = session_data.get("chatHistory", [])
-    chat_history.append({"role": "user", "content": prompt})
+@router.post("/file/stream")
+async def process_file_stream(
+    file: UploadFile = File(...),
+    sessionId: str = Form(None),
+    model: str = Form(default="gemma3"),
+    render_profile: str = Form(None)
+):
+    """Extract a PDF, sending a Server-Sent Event as each batch or page retry completes."""
+    if not file:
+        raise HTTPException(status_code=400, detail="Please upload a file")
+    filename = file.filename.lower()
+    if not filename.endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files can be streamed")
 
     try:
-        client = get_openai_client(model)
-        response = await client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": [{"type": "text", "text": f"User prompt: {prompt}\nExtracted text: {results_str}"}]}
-            ],
-            temperature=0.3,
-            max_tokens=2048
-        )
-        generated_response = response.choices[0].message.content
-        chat_history.append({"role": "assistant", "content": generated_response})
-        session_store.set(f"sessions.{session_id}", {
-            "chatHistory": chat_history,
-            "timestamp": time.time()
-        })
-        return {
-            "response": generated_response,
-            "extracted_text": all_results,
-            "skipped_pages": skipped_pages,
-            "sessionId": session_id
-        }
-    except Exception as e:
-        logger.error(f"Final API request failed: {str(e)}")
-        chat_history.append({"role": "assistant", "content": f"⚠️ Error processing question: {str(e)}"})
-        session_store.set(f"sessions.{session_id}", {
-            "chatHistory": chat_history,
-            "timestamp": time.time()
-        })
-        raise HTTPException(status_code=500, detail=f"Final API request failed: {str(e)}")
+        get_openai_client(model)
+    except ValueError as e:
+        logger.error(f"Invalid model: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    llm_scheduler.admit(model)
+    llm_flow.set(str(uuid4()))
+    resolve_render_profile(model, render_profile)
+    session_id = sessionId if sessionId else f"session_{int(time.time())}_{str(uuid4())}"
+    try:
+        document = await stage_upload(file)
+    finally:
+        file.file.close()
+    progress = ExtractionProgress()
+    events = progress.subscribe()
+
+    async def run():
+        try:
+            all_results, skipped_pages, extraction_info = await extract_text_from_pdf(
+                document, filename, model, render_profile, progress
+            )
+            document_id = (await asyncio.to_thread(document_registry.register, all_results, filename)).id
+            progress.emit("done", extracted_text=all_results, **extraction_info, documentId=document_id, sessionId=session_id)
+        except HTTPException as e:
+            progress.emit("error", detail=e.detail)
+        except Exception as e:
+            logger.error(f"Streaming extraction failed for {filename}: {str(e)}")
+            progress.emit("error", detail=str(e))
+        finally:
+            document.cleanup()
+
+    task = asyncio.create_task(run())
+
+    async def event_stream():
+        try:
+            while True:
+                event, data = await events.get()
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event in ("done", "error"):
+                    break
+        finally:
+            # The client went away; stop spending GPU on pages nobody will read
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.post("/message")
 async def process_message(
     prompt: str = Form(...),
-    extracted_text: str = Form(...),
+    extracted_text: str = Form(None),
+    documentId: List[str] = Form(None),
     sessionId: str = Form(None),
     model: str = Form(default="gemma3"),
-    system_prompt: str = Form(default=SYSTEM_PROMPT)
+    system_prompt: str = Form(default=SYSTEM_PROMPT),
+    stream: bool = Form(False)
 ):
-    """Endpoint to process a query using extracted text, with session support for Electron app."""
+    """Endpoint to process a query using extracted text, with session support for Electron app.
+
+    The text is either sent as extracted_text or referred to by the documentId returned from
+    extraction; repeat documentId to ask about several documents. Either way the response
+    carries documentIds for the next turn, and echoes extracted_text only if it was sent.
+
+    With stream=true the answer is relayed as Server-Sent Events: "token" events carry each delta
+    as the model produces it, then "done" carries the full response, or "error".
+    """
     if not prompt.strip():
         raise HTTPException(status_code=400, detail="Please provide a non-empty prompt")
-    if not extracted_text.strip():
-        raise HTTPException(status_code=400, detail="Please provide non-empty extracted text")
+    by_reference = bool(documentId and any(document_id.strip() for document_id in documentId))
+    if not by_reference and not (extracted_text and extracted_text.strip()):
+        raise HTTPException(status_code=400, detail="Please provide a documentId or non-empty extracted text")
+
+    llm_scheduler.admit(model)
+    llm_flow.set(str(uuid4()))
 
     try:
         client = get_openai_client(model)
@@ -121,51 +237,204 @@ async def process_message(
         logger.error(f"Invalid model: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
-    all_results = {}
-    text_for_analysis = extracted_text
-    try:
-        all_results = json.loads(extracted_text)
-        if isinstance(all_results, dict):
-            text_for_analysis = json.dumps(all_results)
-        else:
-            logger.warning(f"Extracted text is not a JSON object: {extracted_text}")
-            all_results = {}
-    except json.JSONDecodeError as e:
-        logger.warning(f"Invalid extracted text format, using as plain text: {str(e)}")
-        all_results = {"content": extracted_text}
+    if by_reference:
+        all_results, text_for_analysis, document_ids = await asyncio.to_thread(document_registry.resolve, documentId)
+    else:
+        all_results = {}
+        text_for_analysis = extracted_text
+        # Registered so the next turn can send the ID instead
+        document = None
+        try:
+            all_results = json.loads(extracted_text)
+            if isinstance(all_results, dict):
+                document = await asyncio.to_thread(document_registry.register, all_results)
+                text_for_analysis = document.text
+            else:
+                logger.warning(f"Extracted text is not a JSON object: {extracted_text}")
+                all_results = {}
+        except json.JSONDecodeError as e:
+            logger.warning(f"Invalid extracted text format, using as plain text: {str(e)}")
+            all_results = {"content": extracted_text}
+            document = await asyncio.to_thread(document_registry.register, all_results)
+        document_ids = [document.id] if document else []
+    echoed_text = {} if by_reference else {"extracted_text": all_results}
 
     session_id = sessionId if sessionId else f"session_{int(time.time())}_{str(uuid4())}"
-    session_data = session_store.get(f"sessions.{session_id}", {"chatHistory": []})
-    chat_history = session_data.get("chatHistory", [])
-    chat_history.append({"role": "user", "content": prompt})
+    # Recorded together with the answer, as one update of whatever the session holds by then
+    question = {"role": "user", "content": prompt}
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": [{"type": "text", "text": f"User prompt: {prompt}\nExtracted text: {text_for_analysis}"}]}
+    ]
 
-    try:
-        response = await client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": [{"type": "text", "text": f"User prompt: {prompt}\nExtracted text: {text_for_analysis}"}]}
-            ],
-            temperature=0.3,
-            max_tokens=2048
+    if stream:
+        async def event_stream():
+            start_time = time.monotonic()
+            ttft = None
+            chunks = []
+            try:
+                async with llm_scheduler.slot(model):
+                    # Leaving the block closes the upstream stream, however the relay ends
+                    stream = await client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=0.3,
+                        max_tokens=2048,
+                        stream=True
+                    )
+                    async with stream as response:
+                        async for chunk in response:
+                            delta = chunk.choices[0].delta.content if chunk.choices else None
+                            if not delta:
+                                continue
+                            if ttft is None:
+                                ttft = time.monotonic() - start_time
+                                llm_scheduler.record_ttft(model, ttft)
+                            chunks.append(delta)
+                            yield f"event: token\ndata: {json.dumps({'delta': delta})}\n\n"
+            except Exception as e:
+                logger.error(f"Streamed API request failed for session {session_id}: {str(e)}")
+                session_store.update(f"sessions.{session_id}", append_turns(question, {"role": "assistant", "content": f"⚠️ Error processing question: {str(e)}"}))
+                yield f"event: error\ndata: {json.dumps({'detail': f'Final API request failed: {str(e)}', 'sessionId': session_id})}\n\n"
+                return
+
+            # Only a completed answer reaches the session; a client that disconnects mid-stream cancels this generator first
+            generated_response = "".join(chunks)
+            session_store.update(f"sessions.{session_id}", append_turns(question, {"role": "assistant", "content": generated_response}))
+            logger.info(f"Streamed answer for session {session_id}: first token {ttft or 0:.2f}s, total {time.monotonic() - start_time:.2f}s")
+            done = {
+                "response": generated_response,
+                **echoed_text,
+                "skipped_pages": [],
+                "documentIds": document_ids,
+                "sessionId": session_id,
+                "ttft": round(ttft, 3) if ttft is not None else None
+            }
+            yield f"event: done\ndata: {json.dumps(done)}\n\n"
+
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
         )
+
+    try:
+        async with llm_scheduler.slot(model):
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=2048
+            )
         generated_response = response.choices[0].message.content
-        chat_history.append({"role": "assistant", "content": generated_response})
-        session_store.set(f"sessions.{session_id}", {
-            "chatHistory": chat_history,
-            "timestamp": time.time()
-        })
+        session_store.update(f"sessions.{session_id}", append_turns(question, {"role": "assistant", "content": generated_response}))
         return {
             "response": generated_response,
-            "extracted_text": all_results,
+            **echoed_text,
             "skipped_pages": [],
+            "documentIds": document_ids,
             "sessionId": session_id
         }
     except Exception as e:
         logger.error(f"Final API request failed for session {session_id}: {str(e)}")
-        chat_history.append({"role": "assistant", "content": f"⚠️ Error processing question: {str(e)}"})
-        session_store.set(f"sessions.{session_id}", {
-            "chatHistory": chat_history,
-            "timestamp": time.time()
-        })
-        raise HTTPException(status_code=500, detail=f"Final API request failed: {str(e)}")
\ No newline at end of file
+        session_store.update(f"sessions.{session_id}", append_turns(question, {"role": "assistant", "content": f"⚠️ Error processing question: {str(e)}"}))
+        raise HTTPException(status_code=500, detail=f"Final API request failed: {str(e)}")
+
+async def read_profile_uploads(files: List[UploadFile], kind: str) -> List:
+    profiles = []
+    for file in files:
+        try:
+            data = await file.read(PORTFOLIO_MAX_PROFILE_BYTES + 1)
+        finally:
+            file.file.close()
+        profiles.append(read_profile(file.filename, data, kind))
+    return profiles
+
+@router.post("/portfolio")
+async def process_portfolio(
+    archive: UploadFile = File(None),
+    company_profiles: List[UploadFile] = File(None),
+    country_profiles: List[UploadFile] = File(None),
+    prompt: str = Form(default=PORTFOLIO_PROMPT),
+    model: str = Form(default="gemma3"),
+    system_prompt: str = Form(default=SYSTEM_PROMPT)
+):
+    """Analyse every company profile against every country profile, streaming NDJSON as pairs finish.
+
+    Profiles come as a zip archive, recognised by their Unternehmensprofil/Landesprofil root
+    element, and/or as company_profiles and country_profiles uploads. The stream opens with a
+    "start" line, has one "result" line per pair in completion order and ends with a "summary"
+    line of the verdict (affected, unaffected, undetermined or failed) of every pair.
+    """
+    if not prompt.strip():
+        raise HTTPException(status_code=400, detail="Please provide a non-empty prompt")
+
+    try:
+        client = get_openai_client(model)
+    except ValueError as e:
+        logger.error(f"Invalid model: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    llm_scheduler.admit(model)
+    # The whole portfolio is one flow, so it takes its fair share of the backend rather than one share per pair
+    llm_flow.set(str(uuid4()))
+
+    companies = await read_profile_uploads(company_profiles or [], "company")
+    countries = await read_profile_uploads(country_profiles or [], "country")
+    ignored = []
+    if archive:
+        try:
+            await archive.seek(0)
+            profiles, ignored = await asyncio.to_thread(read_archive, archive.file)
+        finally:
+            archive.file.close()
+        companies += [profile for profile in profiles if profile.kind == "company"]
+        countries += [profile for profile in profiles if profile.kind == "country"]
+    pairs = plan_pairs(companies, countries)
+    logger.info(f"Portfolio of {len(companies)} companies x {len(countries)} countries, {len(ignored)} files ignored")
+
+    results = asyncio.Queue()
+    budget = RetryBudget(len(pairs))
+
+    async def run():
+        # Bounds this request's queued LLM calls so a large portfolio cannot fill the backend queue on its own
+        semaphore = asyncio.Semaphore(PORTFOLIO_MAX_CONCURRENCY)
+
+        async def analyze(company, country):
+            async with semaphore:
+                results.put_nowait(await analyze_pair(client, model, prompt, system_prompt, company, country, budget))
+
+        tasks = [asyncio.create_task(analyze(company, country)) for company, country in pairs]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    task = asyncio.create_task(run())
+
+    async def ndjson_stream():
+        summary = PortfolioSummary(len(pairs))
+        try:
+            yield json.dumps({
+                "type": "start",
+                "pairs": len(pairs),
+                "companies": [profile.describe() for profile in companies],
+                "countries": [profile.describe() for profile in countries],
+                "ignored": ignored
+            }) + "\n"
+            for _ in pairs:
+                record = await results.get()
+                summary.add(record)
+                yield json.dumps({"type": "result", **record}) + "\n"
+            yield json.dumps({"type": "summary", **summary.report(), "recovery": budget.report()}) + "\n"
+        finally:
+            # The client went away; stop analysing pairs nobody will read
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        ndjson_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
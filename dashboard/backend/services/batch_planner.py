@@ -0,0 +1,80 @@
+# File: services/batch_planner.py
+import math
+from typing import Dict, List, Optional
+import logging
+from constants import (
+    LLM_MAX_MODEL_LEN, LLM_MAX_OUTPUT_TOKENS, MAX_PAGES_PER_BATCH,
+    OUTPUT_TOKENS_PER_FULL_PAGE, MODEL_IMAGE_TOKENS
+)
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TOKENS = 150  # Extraction instruction plus chat template overhead
+CONTEXT_MARGIN_TOKENS = 64  # Slack for estimation error in the chat template
+OUTPUT_SAFETY_FACTOR = 1.25  # JSON quoting and escaping inflate the extracted text
+FULL_PAGE_INK_RATIO = 0.12  # Share of dark pixels on a densely printed page
+
+class BatchPlanner:
+    """Packs rendered pages into extraction batches that fit the model's context and output limits."""
+
+    def __init__(self, model: str):
+        image_tokens = MODEL_IMAGE_TOKENS.get(model, {"patch_pixels": 28, "max_tokens": 16384})
+        self.patch_pixels = image_tokens["patch_pixels"]
+        self.image_max_tokens = image_tokens["max_tokens"]
+        self.context = LLM_MAX_MODEL_LEN
+        self.max_output = LLM_MAX_OUTPUT_TOKENS
+        self.max_pages = MAX_PAGES_PER_BATCH
+        self.current: Optional[Dict] = None
+
+    def estimate(self, page: Dict) -> tuple[int, int]:
+        """Estimate (image tokens, expected output tokens) from pixel size and ink density."""
+        image_tokens = min(
+            math.ceil(page["width"] / self.patch_pixels) * math.ceil(page["height"] / self.patch_pixels),
+            self.image_max_tokens
+        )
+        density = min(page["ink_ratio"] / FULL_PAGE_INK_RATIO, 1.0)
+        output_tokens = math.ceil((20 + density * OUTPUT_TOKENS_PER_FULL_PAGE) * OUTPUT_SAFETY_FACTOR)
+        return image_tokens, output_tokens
+
+    def _fits(self, image_tokens: int, output_tokens: int) -> bool:
+        batch = self.current
+        if len(batch["pages"]) >= self.max_pages:
+            return False
+        input_tokens = PROMPT_TOKENS + batch["image_tokens"] + image_tokens
+        expected_output = batch["expected_output_tokens"] + output_tokens
+        return expected_output <= self.max_output and input_tokens + expected_output <= self.context - CONTEXT_MARGIN_TOKENS
+
+    def _close(self) -> Dict:
+        batch = self.current
+        self.current = None
+        input_tokens = PROMPT_TOKENS + batch["image_tokens"]
+        batch["max_tokens"] = max(256, min(self.max_output, self.context - input_tokens - CONTEXT_MARGIN_TOKENS))
+        return batch
+
+    def add(self, page_num: int, page: Dict) -> List[Dict]:
+        """Add a rendered page; returns the batches that are now complete."""
+        image_tokens, output_tokens = self.estimate(page)
+        ready = []
+        if self.current is not None and not self._fits(image_tokens, output_tokens):
+            ready.append(self._close())
+        if self.current is None:
+            self.current = {"pages": [], "images": {}, "image_tokens": 0, "expected_output_tokens": 0}
+        self.current["pages"].append(page_num)
+        self.current["images"][page_num] = page["image_url"]
+        self.current["image_tokens"] += image_tokens
+        self.current["expected_output_tokens"] += output_tokens
+        if len(self.current["pages"]) >= self.max_pages:
+            ready.append(self._close())
+        return ready
+
+    def flush(self) -> List[Dict]:
+        return [self._close()] if self.current is not None else []
+
+def describe_batch(batch: Dict) -> Dict:
+    """Batch plan entry reported in extraction responses."""
+    return {
+        "pages": batch["pages"],
+        "image_tokens": batch["image_tokens"],
+        "expected_output_tokens": batch["expected_output_tokens"],
+        "max_tokens": batch["max_tokens"]
+    }
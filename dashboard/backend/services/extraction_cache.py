@@ -0,0 +1,122 @@
+# File: services/extraction_cache.py
+import hashlib
+import json
+import os
+import time
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import logging
+from constants import EXTRACTION_CACHE_DIR, EXTRACTION_CACHE_MAX_BYTES, EXTRACTION_PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+
+class ExtractionCache:
+    """Content-addressed on-disk cache of PDF extraction results with LRU eviction.
+
+    Every method reads, writes or scans files; call them from a worker thread, not the event loop.
+    """
+
+    def __init__(self, cache_dir: Path = EXTRACTION_CACHE_DIR, max_bytes: int = EXTRACTION_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def make_key(self, digest: str, model: str, render_profile: str) -> str:
+        """Key on document SHA-256 (hex), model, render profile and extraction-prompt version."""
+        return hashlib.sha256(f"{digest}:{model}:{render_profile}:{EXTRACTION_PROMPT_VERSION}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Tuple[Dict, List[int], Dict]]:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text())
+            os.utime(path)  # Refresh mtime so eviction is least-recently-used
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except (json.JSONDecodeError, IOError) as e:
+            logger.error(f"Failed to read extraction cache entry {key}: {str(e)}")
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry["extracted_text"], entry.get("skipped_pages", []), entry.get("extraction_info", {})
+
+    def set(self, key: str, extracted_text: Dict, skipped_pages: List[int], extraction_info: Dict):
+        path = self._path(key)
+        tmp_path = self.cache_dir / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            tmp_path.write_text(json.dumps({
+                "extracted_text": extracted_text,
+                "skipped_pages": skipped_pages,
+                "extraction_info": extraction_info,
+                "created": time.time()
+            }))
+            os.replace(tmp_path, path)
+        except IOError as e:
+            logger.error(f"Failed to write extraction cache entry {key}: {str(e)}")
+            return
+        self.evict()
+
+    def _entries(self) -> List[Tuple[str, os.stat_result]]:
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".json"):
+                try:
+                    entries.append((entry.path, entry.stat()))
+                except FileNotFoundError:
+                    continue
+        return entries
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = self._entries()
+            total = sum(st.st_size for _, st in entries)
+            if total <= self.max_bytes:
+                return
+            for path, st in sorted(entries, key=lambda e: e[1].st_mtime):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= st.st_size
+                self.evictions += 1
+                if total <= self.max_bytes:
+                    break
+
+    def purge(self) -> int:
+        with self._lock:
+            removed = 0
+            for path, _ in self._entries():
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+            return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._entries()
+            return {
+                "entries": len(entries),
+                "size_bytes": sum(st.st_size for _, st in entries),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "prompt_version": EXTRACTION_PROMPT_VERSION
+            }
+
+# Global instance
+extraction_cache = ExtractionCache()
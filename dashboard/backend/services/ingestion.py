@@ -0,0 +1,80 @@
+# File: services/ingestion.py
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, Optional
+from fastapi import UploadFile
+import logging
+from constants import SCRATCH_DIR, INGEST_CHUNK_BYTES
+
+logger = logging.getLogger(__name__)
+
+class StagedDocument:
+    """An uploaded document written once into its own scratch directory, with its SHA-256."""
+
+    def __init__(self, scratch: str, path: str, sha256: str, size: int):
+        self.scratch = scratch
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.refs = 1
+
+    def retain(self):
+        """Keep the scratch copy for another user; it is removed once every holder has called cleanup()."""
+        self.refs += 1
+
+    def cleanup(self):
+        self.refs -= 1
+        if self.refs <= 0:
+            shutil.rmtree(self.scratch, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+def _copy_into_scratch(source: BinaryIO, suffix: str, scratch_root: Optional[str]) -> StagedDocument:
+    # mkdtemp is 0700 and unique per call, so concurrent uploads never share a path
+    scratch = tempfile.mkdtemp(prefix="ingest-", dir=scratch_root)
+    path = os.path.join(scratch, f"document{suffix}")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while True:
+                chunk = source.read(INGEST_CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+    return StagedDocument(scratch, path, digest.hexdigest(), size)
+
+def _stage(source: BinaryIO, suffix: str) -> StagedDocument:
+    try:
+        return _copy_into_scratch(source, suffix, SCRATCH_DIR)
+    except OSError as e:
+        if SCRATCH_DIR is None or not source.seekable():
+            raise
+        # tmpfs is small by default in containers; fall back to the regular temp dir when it fills up
+        logger.warning(f"Staging in {SCRATCH_DIR} failed ({str(e)}), falling back to {tempfile.gettempdir()}")
+        source.seek(0)
+        return _copy_into_scratch(source, suffix, None)
+
+async def stage_upload(upload: UploadFile, suffix: str = ".pdf") -> StagedDocument:
+    """Stream an upload's spooled file into per-request scratch space, hashing it on the way."""
+    await upload.seek(0)
+    return await asyncio.to_thread(_stage, upload.file, suffix)
+
+async def stage_file(path: str, suffix: str = ".pdf") -> StagedDocument:
+    """Copy a local file into per-request scratch space, as stage_upload does for uploads."""
+    def stage() -> StagedDocument:
+        with open(path, "rb") as source:
+            return _stage(source, suffix)
+    return await asyncio.to_thread(stage)
@@ -0,0 +1,84 @@
+# File: services/json_salvage.py
+import json
+from typing import Dict, Optional
+
+_WHITESPACE = " \t\n\r"
+# Models often put raw newlines inside strings, which strict JSON rejects
+_decoder = json.JSONDecoder(strict=False)
+
+def _skip(text: str, idx: int, chars: str) -> int:
+    while idx < len(text) and text[idx] in chars:
+        idx += 1
+    return idx
+
+def salvage_json_object(text: str) -> tuple[Dict, bool]:
+    """Every complete key/value pair of a JSON object, tolerating truncation and stray commas.
+
+    Returns the pairs and whether the object was closed. Scanning stops at the first pair
+    that is cut off or malformed; everything before it is kept.
+    """
+    pairs = {}
+    idx = text.find("{")
+    if idx < 0:
+        return pairs, False
+    idx += 1
+    while True:
+        # Commas are skipped wherever they appear, so trailing and doubled commas are harmless
+        idx = _skip(text, idx, _WHITESPACE + ",")
+        if idx >= len(text):
+            return pairs, False
+        if text[idx] == "}":
+            return pairs, True
+        if text[idx] != '"':
+            return pairs, False
+        try:
+            key, idx = json.decoder.scanstring(text, idx + 1, False)
+        except ValueError:
+            return pairs, False
+        idx = _skip(text, idx, _WHITESPACE)
+        if idx >= len(text) or text[idx] != ":":
+            return pairs, False
+        idx = _skip(text, idx + 1, _WHITESPACE)
+        try:
+            value, idx = _decoder.raw_decode(text, idx)
+        except ValueError:
+            return pairs, False
+        # A number or literal at the very end may itself be cut off; a closed string cannot be
+        if not isinstance(value, str) and _skip(text, idx, _WHITESPACE) >= len(text):
+            return pairs, False
+        pairs[key] = value
+
+class ParseStats:
+    """Counts how extraction answers were parsed: cleanly, salvaged from broken JSON, or not at all."""
+
+    def __init__(self, parent: Optional["ParseStats"] = None):
+        self.parent = parent
+        self.responses = 0
+        self.clean = 0
+        self.salvaged = 0
+        self.failed = 0
+        self.pages_salvaged = 0  # Pages kept from answers json.loads rejected, i.e. retries avoided
+        self.pages_missing = 0  # Requested pages absent from the answer, sent on to recovery
+
+    def record(self, outcome: str, pages_found: int, pages_missing: int):
+        """Record one answer; outcome is "clean", "salvaged" or "failed"."""
+        self.responses += 1
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        if outcome == "salvaged":
+            self.pages_salvaged += pages_found
+        self.pages_missing += pages_missing
+        if self.parent is not None:
+            self.parent.record(outcome, pages_found, pages_missing)
+
+    def report(self) -> Dict:
+        return {
+            "responses": self.responses,
+            "clean": self.clean,
+            "salvaged": self.salvaged,
+            "failed": self.failed,
+            "pages_salvaged": self.pages_salvaged,
+            "pages_missing": self.pages_missing
+        }
+
+# Global instance
+parse_stats = ParseStats()
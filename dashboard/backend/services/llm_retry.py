@@ -0,0 +1,58 @@
+# File: services/llm_retry.py
+import asyncio
+import math
+import random
+from typing import Any, Awaitable, Callable, Dict
+import openai
+import logging
+from constants import (
+    LLM_RETRY_MAX_ATTEMPTS, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY,
+    RETRY_BUDGET_PER_PAGE, RETRY_BUDGET_MIN_CALLS
+)
+from services.llm_scheduler import llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Worth retrying the same request; APITimeoutError is an APIConnectionError
+TRANSIENT_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+class RetryBudget:
+    """Extra LLM calls one document may spend on backoff retries and batch bisection."""
+
+    def __init__(self, pages: int):
+        self.limit = max(RETRY_BUDGET_MIN_CALLS, math.ceil(pages * RETRY_BUDGET_PER_PAGE))
+        self.spent = 0
+        self.denied = 0
+
+    def take(self) -> bool:
+        """Spend one call from the budget; False once it is used up."""
+        if self.spent >= self.limit:
+            if not self.denied:
+                logger.warning(f"Retry budget of {self.limit} calls exhausted, giving up on remaining failed pages")
+            self.denied += 1
+            return False
+        self.spent += 1
+        return True
+
+    def report(self) -> Dict:
+        return {"limit": self.limit, "spent": self.spent, "denied": self.denied}
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given 0-based retry attempt."""
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+async def call_with_backoff(model: str, call: Callable[[], Awaitable[Any]], budget: RetryBudget, label: str) -> Any:
+    """Run call() in a scheduler slot, retrying transport errors with backoff while the budget lasts."""
+    attempt = 0
+    while True:
+        try:
+            async with llm_scheduler.slot(model):
+                return await call()
+        except TRANSIENT_ERRORS as e:
+            if attempt + 1 >= LLM_RETRY_MAX_ATTEMPTS or not budget.take():
+                raise
+            # Sleep outside the slot so other requests can use the backend meanwhile
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logger.warning(f"Transient error for {label} ({str(e)}), retry {attempt} in {delay:.1f}s")
+            await asyncio.sleep(delay)
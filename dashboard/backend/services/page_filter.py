@@ -0,0 +1,72 @@
+# File: services/page_filter.py
+from typing import Dict, List, Optional
+from PIL import Image, ImageChops, ImageStat
+import logging
+from constants import BLANK_PAGE_MAX_STDDEV, DUPLICATE_PAGE_MAX_HAMMING, DUPLICATE_PAGE_MAX_PIXEL_DIFF
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 16  # 16x16 difference hash, 256 bits
+THUMB_SIZE = (64, 64)  # Grayscale thumbnail used to confirm hash matches
+
+def page_fingerprint(image) -> Dict:
+    """Pixel spread, difference hash and thumbnail of a page. Runs in a render pool worker process."""
+    gray = image.convert("L")
+    small = gray.copy()
+    small.thumbnail((256, 256))
+    stddev = ImageStat.Stat(small).stddev[0]
+
+    pixels = gray.resize((HASH_SIZE + 1, HASH_SIZE)).tobytes()
+    dhash = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            dhash = (dhash << 1) | (left > right)
+    return {"stddev": stddev, "dhash": dhash, "thumb": gray.resize(THUMB_SIZE).tobytes()}
+
+def _thumb_diff(a: bytes, b: bytes) -> float:
+    """Mean absolute pixel difference between two thumbnails."""
+    diff = ImageChops.difference(Image.frombytes("L", THUMB_SIZE, a), Image.frombytes("L", THUMB_SIZE, b))
+    return ImageStat.Stat(diff).mean[0]
+
+class PageFilter:
+    """Drops blank pages and routes near-identical pages to one extraction."""
+
+    def __init__(self):
+        self.blank_pages: List[int] = []
+        self.duplicates: Dict[int, int] = {}  # duplicate page -> page it was extracted from
+        self.originals: List[tuple] = []  # (page, fingerprint) of every page sent for extraction
+
+    def check(self, page_num: int, fingerprint: Dict) -> Optional[str]:
+        """Return "blank" or "duplicate" when the page should not be sent, else None."""
+        if fingerprint["stddev"] <= BLANK_PAGE_MAX_STDDEV:
+            self.blank_pages.append(page_num)
+            return "blank"
+        for original, seen in self.originals:
+            if (fingerprint["dhash"] ^ seen["dhash"]).bit_count() > DUPLICATE_PAGE_MAX_HAMMING:
+                continue
+            # Hash collisions between pages with the same layout are confirmed on pixels
+            if _thumb_diff(fingerprint["thumb"], seen["thumb"]) <= DUPLICATE_PAGE_MAX_PIXEL_DIFF:
+                self.duplicates[page_num] = original
+                return "duplicate"
+        self.originals.append((page_num, fingerprint))
+        return None
+
+    def apply(self, results: Dict) -> List[int]:
+        """Copy each original's text to its duplicates; returns duplicates whose original failed."""
+        failed = []
+        for page_num, original in self.duplicates.items():
+            if str(original) in results:
+                results[str(page_num)] = results[str(original)]
+            else:
+                failed.append(page_num)
+        if self.blank_pages or self.duplicates:
+            logger.info(f"Skipped {len(self.blank_pages)} blank and {len(self.duplicates)} duplicate pages")
+        return failed
+
+    def report(self) -> Dict:
+        return {
+            "blank_pages": sorted(self.blank_pages),
+            "duplicate_pages": {str(page_num): original for page_num, original in sorted(self.duplicates.items())}
+        }
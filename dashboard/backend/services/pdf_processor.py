@@ -1,119 +1,527 @@
 # File: services/pdf_processor.py
 import asyncio
-from typing import List, Dict
+import re
+import time
+from typing import List, Dict, Optional
 from io import BytesIO
 import base64
-import tempfile
-import os
-from fastapi import UploadFile, HTTPException
-from pdf2image import convert_from_path
+from fastapi import HTTPException
+from PIL import features
+from pdf2image import convert_from_path, pdfinfo_from_path
 from services.ai_client import get_openai_client, clean_response
+from services.extraction_cache import extraction_cache
+from services.render_pool import render_pool
+from services.llm_retry import RetryBudget, call_with_backoff
+from services.json_salvage import ParseStats, parse_stats, salvage_json_object
+from services.single_flight import extraction_flights
+from services.batch_planner import BatchPlanner, describe_batch
+from services.ingestion import StagedDocument
+from services.page_filter import PageFilter, page_fingerprint
+from constants import (
+    TEXT_LAYER_ENABLED, TEXT_LAYER_MIN_CHARS, TEXT_LAYER_MIN_ALNUM_RATIO, TEXT_LAYER_SCAN_MIN_COVERAGE, RENDER_WINDOW_PAGES,
+    RENDER_PROFILES, DEFAULT_RENDER_PROFILE, MODEL_RENDER_PROFILES, GUIDED_DECODING_ENABLED
+)
 import json
+import openai
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def process_single_batch(client, model, batch_messages, page_start, page_end):
-    """Process a single batch of pages asynchronously."""
-    try:
-        response = await client.chat.completions.create(
+# Models whose backend rejected response_format; their extraction calls rely on the prompt alone
+guided_decoding_unsupported = set()
+
+# Phrases a 400 carries when the backend cannot honour response_format, as opposed to a bad batch
+RESPONSE_FORMAT_ERRORS = ("response_format", "json_schema", "guided", "structured output")
+
+def rejects_response_format(error: Exception) -> bool:
+    """Whether a rejected request was rejected for its response_format rather than its content."""
+    message = str(error).lower()
+    return any(phrase in message for phrase in RESPONSE_FORMAT_ERRORS)
+
+def page_response_format(page_numbers: List[int]) -> Dict:
+    """JSON schema that allows exactly the given page-number keys, each with a text value."""
+    keys = [str(p) for p in page_numbers]
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "page_text",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {key: {"type": "string"} for key in keys},
+                "required": keys,
+                "additionalProperties": False
+            }
+        }
+    }
+
+def page_messages(images: Dict[int, str], page_numbers: List[int]) -> List[Dict]:
+    """Image parts plus the extraction instruction for one call over the given pages."""
+    messages = [{"type": "image_url", "image_url": {"url": images[page_num]}} for page_num in page_numbers]
+    if len(page_numbers) == 1:
+        page_idx = page_numbers[0]
+        text = (
+            f"Extract plain text from this single PDF page (page number {page_idx}). "
+            "Return the result as a valid JSON object where the key is the page number "
+            f"({page_idx}) and the value is the extracted text. "
+            "Ensure the response is strictly JSON-formatted and does not include markdown code blocks."
+        )
+    else:
+        page_list = ", ".join(str(p) for p in page_numbers)
+        text = (
+            f"Extract plain text from these {len(page_numbers)} PDF pages (pages {page_list}). "
+            "Return the results as a valid JSON object where keys are page numbers "
+            f"({page_list}, in the order the images are given) and values are the extracted text for each page. "
+            "Ensure the response is strictly JSON-formatted."
+        )
+    messages.append({"type": "text", "text": text})
+    return messages
+
+async def process_single_batch(client, model, batch_messages, page_numbers, max_tokens, budget: RetryBudget, stats: ParseStats):
+    """Process a single batch of pages; returns (results, failed pages).
+
+    Transport errors are retried with backoff and re-raised once retries or the budget run out.
+    """
+    page_start, page_end = page_numbers[0], page_numbers[-1]
+    label = f"batch {page_start}-{page_end}"
+    # Retries are ours to count against the budget, not the SDK's
+    call_client = client.with_options(max_retries=0)
+
+    def request(guided: bool):
+        # vLLM turns the schema into guided decoding, so the answer cannot stray from the expected keys
+        extra = {"response_format": page_response_format(page_numbers)} if guided else {}
+        return lambda: call_client.chat.completions.create(
             model=model,
             messages=[{"role": "user", "content": batch_messages}],
             temperature=0.2,
-            max_tokens=2048  # Consistent with single-page
+            max_tokens=max_tokens,
+            **extra
         )
-        raw_response = response.choices[0].message.content
-        logger.debug(f"Raw response for batch {page_start}-{page_end}: {raw_response}")
-
-        cleaned_response = clean_response(raw_response)
-        if not cleaned_response:
-            logger.warning(f"Empty response for batch {page_start}-{page_end}")
-            return None, list(range(page_start, page_end + 1))
 
+    guided = GUIDED_DECODING_ENABLED and model not in guided_decoding_unsupported
+    try:
         try:
-            batch_results = json.loads(cleaned_response)
-            if not isinstance(batch_results, dict):
-                logger.warning(f"Response is not a JSON object for batch {page_start}-{page_end}")
-                return None, list(range(page_start, page_end + 1))
-            return batch_results, []
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parsing failed for batch {page_start}-{page_end}: {str(e)}")
-            return None, list(range(page_start, page_end + 1))
+            response = await call_with_backoff(model, request(guided), budget, label)
+        except openai.BadRequestError as e:
+            # Backends without guided decoding reject response_format; if the plain request works, stop sending it.
+            # Any other 400 (context overflow, a bad image) says nothing about the schema and fails the batch as before.
+            # The plain request is one more call for the batch, so it is paid from the budget like any retry
+            if not guided or not rejects_response_format(e) or not budget.take():
+                raise
+            response = await call_with_backoff(model, request(False), budget, label)
+            guided_decoding_unsupported.add(model)
+            logger.warning(f"Backend for {model} rejected response_format, falling back to prompt-only JSON: {str(e)}")
+    except openai.BadRequestError as e:
+        # Typically the batch overflowing the context; a smaller batch can still succeed
+        logger.error(f"API request rejected for batch {page_start}-{page_end}: {str(e)}")
+        return None, list(page_numbers)
     except Exception as e:
         logger.error(f"API request failed for batch {page_start}-{page_end}: {str(e)}")
-        return None, list(range(page_start, page_end + 1))
+        raise
+    raw_response = response.choices[0].message.content
+    logger.debug(f"Raw response for batch {page_start}-{page_end}: {raw_response}")
+
+    cleaned_response = clean_response(raw_response)
+    if not cleaned_response:
+        logger.warning(f"Empty response for batch {page_start}-{page_end}")
+        stats.record("failed", 0, len(page_numbers))
+        return None, list(page_numbers)
 
-async def process_single_page(client, model, image, page_idx):
-    """Process a single skipped page asynchronously."""
+    outcome = "clean"
     try:
-        image_bytes_io = BytesIO()
-        image.save(image_bytes_io, format='JPEG', quality=85)
-        image_base64 = base64.b64encode(image_bytes_io.read()).decode("utf-8")
-        
-        single_message = [
-            {
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-            },
-            {
-                "type": "text",
-                "text": (
-                    f"Extract plain text from this single PDF page (page number {page_idx}). "
-                    "Return the result as a valid JSON object where the key is the page number "
-                    f"({page_idx}) and the value is the extracted text. "
-                    "Ensure the response is strictly JSON-formatted and does not include markdown code blocks."
-                )
-            }
-        ]
-        
-        response = await client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": single_message}],
-            temperature=0.2,
-            max_tokens=2048
+        batch_results = json.loads(cleaned_response)
+    except json.JSONDecodeError as e:
+        # Truncated by max_tokens or slightly malformed: keep every page that came through whole
+        batch_results, closed = salvage_json_object(cleaned_response)
+        if not batch_results:
+            logger.error(f"JSON parsing failed for batch {page_start}-{page_end}: {str(e)}")
+            stats.record("failed", 0, len(page_numbers))
+            return None, list(page_numbers)
+        outcome = "salvaged"
+        logger.warning(
+            f"Salvaged {len(batch_results)} pages from {'malformed' if closed else 'truncated'} JSON "
+            f"for batch {page_start}-{page_end}: {str(e)}"
+        )
+    if not isinstance(batch_results, dict):
+        logger.warning(f"Response is not a JSON object for batch {page_start}-{page_end}")
+        stats.record("failed", 0, len(page_numbers))
+        return None, list(page_numbers)
+    # Pages the model left out are failed too, so they get recovered instead of silently dropped
+    results = {str(p): batch_results[str(p)] for p in page_numbers if str(p) in batch_results}
+    failed = [p for p in page_numbers if str(p) not in batch_results]
+    stats.record(outcome, len(results), len(failed))
+    return results, failed
+
+async def run_poppler(args: List[str], fallback: str) -> Optional[bytes]:
+    """Run a poppler utility and return its stdout, or None when it is missing or fails."""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
         )
-        raw_response = response.choices[0].message.content
-        logger.debug(f"Raw response for skipped page {page_idx}: {raw_response}")
+        stdout, stderr = await proc.communicate()
+    except OSError as e:
+        logger.warning(f"{args[0]} unavailable, {fallback}: {str(e)}")
+        return None
+    if proc.returncode != 0:
+        logger.warning(f"{args[0]} failed, {fallback}: {stderr.decode(errors='ignore')}")
+        return None
+    return stdout
+
+async def extract_text_layer(pdf_path: str, num_pages: int) -> List[str]:
+    """Read the embedded text layer of every page with poppler's pdftotext."""
+    stdout = await run_poppler(["pdftotext", "-enc", "UTF-8", pdf_path, "-"], "using vision extraction for all pages")
+    if stdout is None:
+        return []
+
+    # pdftotext terminates every page with a form feed
+    pages = stdout.decode("utf-8", errors="replace").split("\f")[:-1]
+    if len(pages) != num_pages:
+        logger.warning(f"pdftotext returned {len(pages)} pages for a {num_pages}-page PDF, ignoring text layer")
+        return []
+    return pages
 
-        cleaned_response = clean_response(raw_response)
-        if not cleaned_response:
-            logger.warning(f"Empty response for skipped page {page_idx}")
-            return None, page_idx
+async def find_scanned_pages(pdf_path: str, num_pages: int) -> Optional[set]:
+    """Pages drawn mostly as one image, i.e. scans, found with poppler's pdfimages and pdfinfo.
 
+    The text layer of a scan is OCR output of unknown quality, so only the other, born-digital
+    pages may skip vision extraction. Returns None when the PDF could not be inspected.
+    """
+    fallback = "not trusting the text layer"
+    image_list, info = await asyncio.gather(
+        run_poppler(["pdfimages", "-list", pdf_path], fallback),
+        run_poppler(["pdfinfo", "-f", "1", "-l", str(num_pages), pdf_path], fallback)
+    )
+    if image_list is None or info is None:
+        return None
+
+    # "Page    1 size: 612 x 792 pts (letter)"
+    page_areas = {
+        int(page): float(width) * float(height)
+        for page, width, height in re.findall(r"^Page\s+(\d+) size: ([\d.]+) x ([\d.]+) pts", info.decode(errors="replace"), re.M)
+    }
+    scanned = set()
+    # After two header lines: page num type width height color comp bpc enc interp object ID x-ppi y-ppi size ratio
+    for line in image_list.decode(errors="replace").splitlines()[2:]:
+        fields = line.split()
+        if len(fields) < 14 or fields[2] != "image":
+            continue
         try:
-            page_result = json.loads(cleaned_response)
-            if not isinstance(page_result, dict) or str(page_idx) not in page_result:
-                logger.warning(f"Invalid JSON for skipped page {page_idx}")
-                return None, page_idx
-            return page_result, None
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parsing failed for skipped page {page_idx}: {str(e)}")
-            return None, page_idx
-    except Exception as e:
-        logger.error(f"Failed to process skipped page {page_idx}: {str(e)}")
-        return None, page_idx
+            page, width, height = int(fields[0]), int(fields[3]), int(fields[4])
+            x_ppi, y_ppi = float(fields[12]), float(fields[13])
+        except ValueError:
+            continue
+        page_area = page_areas.get(page)
+        if not page_area or not x_ppi or not y_ppi:
+            continue
+        # Pixels at the resolution the image is drawn at give its size on the page, in points
+        coverage = (width / x_ppi * 72) * (height / y_ppi * 72) / page_area
+        if coverage >= TEXT_LAYER_SCAN_MIN_COVERAGE:
+            scanned.add(page)
+    return scanned
+
+def has_usable_text(text: str) -> bool:
+    """Decide whether a page's text layer can replace vision extraction."""
+    stripped = "".join(text.split())
+    if len(stripped) < TEXT_LAYER_MIN_CHARS:
+        return False
+    # Scanned pages with junk OCR layers or broken font encodings are mostly non-alphanumeric
+    alnum = sum(1 for c in stripped if c.isalnum())
+    return alnum / len(stripped) >= TEXT_LAYER_MIN_ALNUM_RATIO
+
+def render_page_range(pdf_path: str, page_numbers: List[int], dpi: int = 200, grayscale: bool = False) -> Dict:
+    """Render the given PDF pages, one contiguous run at a time, keyed by 1-based page number."""
+    images = {}
+    run_start = None
+    for i, page_num in enumerate(page_numbers):
+        if run_start is None:
+            run_start = page_num
+        if i + 1 == len(page_numbers) or page_numbers[i + 1] != page_num + 1:
+            run_images = convert_from_path(pdf_path, dpi=dpi, grayscale=grayscale, first_page=run_start, last_page=page_num)
+            for offset, image in enumerate(run_images):
+                images[run_start + offset] = image
+            run_start = None
+    return images
+
+def page_ink_ratio(image) -> float:
+    """Share of dark pixels on a downscaled grayscale copy, a cheap proxy for text density."""
+    gray = image.convert("L")
+    gray.thumbnail((256, 256))
+    histogram = gray.histogram()
+    return sum(histogram[:128]) / max(1, sum(histogram))
+
+def autocrop_whitespace(image, threshold: int = 245, margin: int = 16):
+    """Trim near-white page margins, keeping a small border around the content."""
+    # Anything darker than the threshold counts as content
+    mask = image.convert("L").point(lambda value: 255 if value < threshold else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return image
+    left, top, right, bottom = bbox
+    return image.crop((
+        max(0, left - margin), max(0, top - margin),
+        min(image.width, right + margin), min(image.height, bottom + margin)
+    ))
+
+def render_and_encode(pdf_path: str, page_numbers: List[int], profile: Dict) -> Dict[int, Dict]:
+    """Render pages with a render profile and encode them as data URLs. Runs in a render pool worker process."""
+    image_format = profile["format"]
+    if image_format == "WEBP" and not features.check("webp"):
+        image_format = "JPEG"
+    encoded = {}
+    for page_num, image in render_page_range(pdf_path, page_numbers, profile["dpi"], profile["grayscale"]).items():
+        try:
+            # Measure density on the full page so cropping margins does not inflate the output estimate
+            ink_ratio = page_ink_ratio(image)
+            fingerprint = page_fingerprint(image)
+            if profile["autocrop"]:
+                image = autocrop_whitespace(image)
+            if profile["max_long_edge"]:
+                image.thumbnail((profile["max_long_edge"], profile["max_long_edge"]))
+            image_bytes_io = BytesIO()
+            image.save(image_bytes_io, format=image_format, quality=profile["quality"])
+            image_base64 = base64.b64encode(image_bytes_io.getvalue()).decode("utf-8")
+            encoded[page_num] = {
+                "image_url": f"data:image/{image_format.lower()};base64,{image_base64}",
+                "bytes": len(image_base64),
+                "width": image.width,
+                "height": image.height,
+                "ink_ratio": ink_ratio,
+                "fingerprint": fingerprint
+            }
+        except Exception as e:
+            logger.error(f"Image processing failed for page {page_num}: {str(e)}")
+    return encoded
 
-async def render_pdf_to_png(pdf_file: UploadFile) -> List:
-    """Convert PDF to images using temp file."""
-    temp_pdf = None
+def resolve_render_profile(model: str, render_profile: Optional[str] = None) -> str:
+    """Pick the request's render profile, else the model's default."""
+    name = render_profile or MODEL_RENDER_PROFILES.get(model, DEFAULT_RENDER_PROFILE)
+    if name not in RENDER_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown render profile {name}. Choose from: {', '.join(RENDER_PROFILES)}"
+        )
+    return name
+
+async def render_pdf_to_png(pdf_path: str, page_numbers: List[int], profile: Dict) -> Dict[int, Dict]:
+    """Render and encode the given PDF pages in the render pool, keyed by 1-based page number."""
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_f:
-            temp_pdf = temp_f.name
-            content = await pdf_file.read()
-            temp_f.write(content)
-        images = convert_from_path(temp_pdf)
-        return images
+        return await render_pool.run(render_and_encode, pdf_path, page_numbers, profile)
     except Exception as e:
         logger.error(f"PDF conversion failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to convert PDF to images: {str(e)}")
-    finally:
-        if temp_pdf and os.path.exists(temp_pdf):
-            os.remove(temp_pdf)
 
-async def extract_text_from_pdf(content: bytes, filename: str, model: str) -> tuple[Dict, List[int]]:
-    """Extract text from PDF using batches and retries."""
-    all_results = {}
+async def process_page_batch(
+    client,
+    model,
+    images: Dict[int, str],
+    batch_pages: List[int],
+    max_tokens: int,
+    progress: "ExtractionProgress",
+    budget: RetryBudget,
+    stats: ParseStats
+) -> tuple[Dict, List[int]]:
+    """Extract one rendered batch, bisecting failed pages while their images are still held."""
+    results = {}
+    # Pages that failed to render or encode have no image to send
+    skipped_pages = [page_num for page_num in batch_pages if page_num not in images]
+    sent_pages = [page_num for page_num in batch_pages if page_num in images]
+    if not sent_pages:
+        logger.warning(f"Skipping batch {batch_pages[0]}-{batch_pages[-1]}: No valid images")
+        return results, skipped_pages
+
+    async def extract(pages: List[int], retry: bool):
+        try:
+            batch_data, failed = await process_single_batch(client, model, page_messages(images, pages), pages, max_tokens, budget, stats)
+        except Exception:
+            # The backend is unreachable or refuses the request; splitting it further won't help
+            skipped_pages.extend(pages)
+            return
+        if batch_data:
+            results.update(batch_data)
+            progress.add_pages(batch_data, "vlm", retry=retry)
+        if not failed:
+            return
+        if len(pages) == 1:
+            skipped_pages.extend(failed)
+            return
+        # Halving isolates a bad page in O(log n) calls instead of one call per page
+        halves = [failed[:len(failed) // 2], failed[len(failed) // 2:]] if len(failed) > 1 else [failed]
+        retries = []
+        for half in halves:
+            if budget.take():
+                retries.append(extract(half, True))
+            else:
+                skipped_pages.extend(half)
+        await asyncio.gather(*retries)
+
+    await extract(sent_pages, False)
+    return results, sorted(skipped_pages)
+
+class ExtractionProgress:
+    """Per-page state of one extraction, readable while it is still running."""
+
+    def __init__(self):
+        self.total_pages: Optional[int] = None
+        self.results: Dict[str, str] = {}
+        self.page_engines: Dict[str, str] = {}
+        self.blank_pages: List[int] = []
+        self.skipped_pages: List[int] = []
+        self.started = time.monotonic()
+        self.listeners: List[asyncio.Queue] = []
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue that receives an (event, data) pair for every later change."""
+        queue = asyncio.Queue()
+        self.listeners.append(queue)
+        return queue
+
+    def emit(self, event: str, **data):
+        if not self.listeners:
+            return
+        data.update(
+            total_pages=self.total_pages,
+            completed_pages=self.completed_pages(),
+            skipped_pages=sorted(set(self.skipped_pages)),
+            elapsed=round(time.monotonic() - self.started, 3)
+        )
+        for queue in self.listeners:
+            queue.put_nowait((event, data))
+
+    def start(self, total_pages: int):
+        self.total_pages = total_pages
+        self.emit("start")
+
+    def add_pages(self, results: Dict, engine: str, retry: bool = False):
+        for page_num, text in results.items():
+            self.results[str(page_num)] = text
+            self.page_engines[str(page_num)] = engine
+        if results:
+            self.emit("pages", pages=results, engine=engine, retry=retry)
+
+    def add_blank(self, page_num: int):
+        self.blank_pages.append(page_num)
+        self.emit("blank", page=page_num)
+
+    def add_skipped(self, page_numbers: List[int]):
+        self.skipped_pages.extend(page_numbers)
+        if page_numbers:
+            self.emit("skipped", pages=page_numbers)
+
+    def completed_pages(self) -> int:
+        return len(set(self.results) | {str(p) for p in self.blank_pages} | {str(p) for p in self.skipped_pages})
+
+    def snapshot(self) -> Dict:
+        return {
+            "total_pages": self.total_pages,
+            "completed_pages": self.completed_pages(),
+            "page_engines": self.page_engines,
+            "blank_pages": sorted(self.blank_pages),
+            "skipped_pages": sorted(set(self.skipped_pages))
+        }
+
+async def extract_vision_pages(client, model, pdf_path: str, vision_pages: List[int], profile: Dict, progress: ExtractionProgress) -> tuple[Dict, List[int], Dict]:
+    """Render and extract pages as a pipeline, keeping at most RENDER_WINDOW_PAGES rendered pages in flight."""
+    planner = BatchPlanner(model)
+    render_chunk = 4
+    window = asyncio.Semaphore(max(RENDER_WINDOW_PAGES, planner.max_pages + render_chunk))
+    batch_plan = []
+    bytes_per_page = {}
+    page_filter = PageFilter()
+    batch_tasks = []
     skipped_pages = []
+    budget = RetryBudget(len(vision_pages))
+
+    async def run_batch(batch, plan_entry):
+        stats = ParseStats(parent=parse_stats)
+        try:
+            batch_data, batch_skipped = await process_page_batch(
+                client, model, batch["images"], batch["pages"], batch["max_tokens"], progress, budget, stats
+            )
+            progress.add_skipped(batch_skipped)
+            return batch_data, batch_skipped
+        finally:
+            plan_entry["parse"] = stats.report()
+            batch["images"].clear()
+            for _ in batch["pages"]:
+                window.release()
+
+    def submit(batch):
+        plan_entry = describe_batch(batch)
+        batch_plan.append(plan_entry)
+        batch_tasks.append(asyncio.create_task(run_batch(batch, plan_entry)))
+
+    try:
+        for chunk_idx in range(0, len(vision_pages), render_chunk):
+            chunk_pages = vision_pages[chunk_idx:chunk_idx + render_chunk]
+            for _ in chunk_pages:
+                await window.acquire()
+            try:
+                rendered = await render_pdf_to_png(pdf_path, chunk_pages, profile)
+            except Exception:
+                for _ in chunk_pages:
+                    window.release()
+                raise
+            for page_num in chunk_pages:
+                if page_num not in rendered:
+                    skipped_pages.append(page_num)
+                    progress.add_skipped([page_num])
+                    window.release()
+                    continue
+                page = rendered.pop(page_num)
+                # Blank and repeated pages never reach the model
+                verdict = page_filter.check(page_num, page.pop("fingerprint"))
+                if verdict:
+                    if verdict == "blank":
+                        progress.add_blank(page_num)
+                    window.release()
+                    continue
+                bytes_per_page[str(page_num)] = page["bytes"]
+                # Submit each batch as soon as it is packed instead of after the whole document
+                for batch in planner.add(page_num, page):
+                    submit(batch)
+        for batch in planner.flush():
+            submit(batch)
+    except BaseException:
+        # Also on cancellation, so a cancelled job stops its in-flight model calls
+        for task in batch_tasks:
+            task.cancel()
+        await asyncio.gather(*batch_tasks, return_exceptions=True)
+        raise
+
+    all_results = {}
+    batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
+    for batch_result in batch_results:
+        if isinstance(batch_result, Exception):
+            logger.error(f"Batch processing failed: {str(batch_result)}")
+            continue
+        batch_data, batch_skipped = batch_result
+        all_results.update(batch_data)
+        skipped_pages.extend(batch_skipped)
+    failed_duplicates = page_filter.apply(all_results)
+    skipped_pages.extend(failed_duplicates)
+    progress.add_pages({str(p): all_results[str(p)] for p in page_filter.duplicates if str(p) in all_results}, "duplicate")
+    progress.add_skipped(failed_duplicates)
+    return all_results, skipped_pages, {
+        "batch_plan": batch_plan,
+        "bytes_per_page": bytes_per_page,
+        "recovery": budget.report(),
+        **page_filter.report()
+    }
+
+async def extract_text_from_pdf(
+    document: StagedDocument,
+    filename: str,
+    model: str,
+    render_profile: Optional[str] = None,
+    progress: Optional[ExtractionProgress] = None
+) -> tuple[Dict, List[int], Dict]:
+    """Extract text from PDF using the text layer where usable, else batches and retries.
+
+    Concurrent requests for the same document, model and render profile share one extraction.
+    """
+    progress = progress or ExtractionProgress()
 
     try:
         client = get_openai_client(model)
@@ -124,89 +532,100 @@ async def extract_text_from_pdf(content: bytes, filename: str, model: str) -> tu
     if not filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are supported for extraction")
 
-    try:
-        images = await render_pdf_to_png(UploadFile(file=BytesIO(content), filename=filename))
-    except Exception:
-        raise HTTPException(status_code=500, detail="PDF processing failed")
-    num_pages = len(images)
-    batch_size = 5
+    profile_name = resolve_render_profile(model, render_profile)
+    cache_key = extraction_cache.make_key(document.sha256, model, profile_name)
+    cached = await asyncio.to_thread(extraction_cache.get, cache_key)
+    if cached:
+        logger.info(f"Extraction cache hit for {filename}")
+        replay_progress(progress, cached, "cache")
+        return cached
 
-    batch_tasks = []
-    for batch_start_idx in range(0, num_pages, batch_size):
-        batch_end_idx = min(batch_start_idx + batch_size, num_pages)
-        batch_images = images[batch_start_idx:batch_end_idx]
-        batch_messages = []
-        local_skipped = []
-
-        for j, image in enumerate(batch_images):
-            page_num = batch_start_idx + j + 1
-            try:
-                image_bytes_io = BytesIO()
-                image.save(image_bytes_io, format='JPEG', quality=85)
-                batch_messages.append({
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64.b64encode(image_bytes_io.read()).decode('utf-8')}"}
-                })
-            except Exception as e:
-                logger.error(f"Image processing failed for page {page_num}: {str(e)}")
-                local_skipped.append(page_num)
-                continue
-
-        skipped_pages.extend(local_skipped)
-
-        if not batch_messages:
-            logger.warning(f"Skipping batch {batch_start_idx + 1}-{batch_end_idx}: No valid images")
-            skipped_pages.extend(range(batch_start_idx + 1, batch_end_idx + 1))
-            continue
+    def start():
+        # The shared extraction can outlive the request that started it, so it holds the scratch copy too
+        document.retain()
+        return extract_uncached(client, document, filename, model, profile_name, cache_key, progress)
 
-        batch_messages.append({
-            "type": "text",
-            "text": (
-                f"Extract plain text from these {len(batch_images)} PDF pages (pages {batch_start_idx + 1} to {batch_end_idx}). "
-                "Return the results as a valid JSON object where keys are page numbers "
-                f"(1-based: {batch_start_idx + 1}, ..., {batch_end_idx}) and values are the extracted text for each page. "
-                "Ensure the response is strictly JSON-formatted."
-            )
-        })
+    result, joined = await extraction_flights.run(cache_key, start, on_done=document.cleanup)
+    if joined:
+        logger.info(f"Joined in-flight extraction of {filename}")
+        replay_progress(progress, result, "shared")
+    return result
 
-        page_start = batch_start_idx + 1
-        page_end = batch_end_idx
-        batch_tasks.append(process_single_batch(client, model, batch_messages, page_start, page_end))
+def replay_progress(progress: ExtractionProgress, result: tuple[Dict, List[int], Dict], engine: str):
+    """Fill a progress tracker at once from an extraction that finished elsewhere."""
+    results, skipped_pages, info = result
+    progress.start(len(results) + len(info.get("blank_pages", [])) + len(skipped_pages))
+    progress.add_pages(results, engine)
+    for page_num in info.get("blank_pages", []):
+        progress.add_blank(page_num)
+    progress.add_skipped(skipped_pages)
 
-    batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
+async def extract_uncached(
+    client,
+    document: StagedDocument,
+    filename: str,
+    model: str,
+    profile_name: str,
+    cache_key: str,
+    progress: ExtractionProgress
+) -> tuple[Dict, List[int], Dict]:
+    """Run the text layer and vision pipeline over a document and cache complete results."""
+    all_results = {}
+    skipped_pages = []
+    page_engines = {}
 
-    for batch_result in batch_results:
-        if isinstance(batch_result, Exception):
-            logger.error(f"Batch processing failed: {str(batch_result)}")
-            continue
-        batch_data, batch_skipped = batch_result
-        if batch_data:
-            all_results.update(batch_data)
-        if batch_skipped:
-            skipped_pages.extend(batch_skipped)
-
-    # Retry skipped pages
-    retry_tasks = []
-    remaining_skipped = list(set(skipped_pages))
-    for page_num in remaining_skipped:
-        image_idx = page_num - 1
-        retry_tasks.append(process_single_page(client, model, images[image_idx], page_num))
-
-    retry_results = await asyncio.gather(*retry_tasks, return_exceptions=True)
-    successfully_processed = []
-
-    for retry_result in retry_results:
-        if isinstance(retry_result, Exception):
-            logger.error(f"Retry processing failed: {str(retry_result)}")
-            continue
-        page_result, page_num = retry_result
-        if page_result:
-            all_results.update(page_result)
-            successfully_processed.append(page_num)
+    try:
+        num_pages = (await render_pool.run(pdfinfo_from_path, document.path))["Pages"]
+    except Exception as e:
+        logger.error(f"PDF inspection failed: {str(e)}")
+        raise HTTPException(status_code=500, detail="PDF processing failed")
+    progress.start(num_pages)
+
+    text_pages, scanned_pages = [], set()
+    if TEXT_LAYER_ENABLED:
+        text_pages, scanned_pages = await asyncio.gather(
+            extract_text_layer(document.path, num_pages), find_scanned_pages(document.path, num_pages)
+        )
+        if scanned_pages is None:
+            # A scan cannot be told from a born-digital page, so no text layer is trusted
+            text_pages, scanned_pages = [], set()
+    vision_pages = []
+    for page_num in range(1, num_pages + 1):
+        if text_pages and page_num not in scanned_pages and has_usable_text(text_pages[page_num - 1]):
+            all_results[str(page_num)] = text_pages[page_num - 1].strip()
+            page_engines[str(page_num)] = "text_layer"
+        else:
+            vision_pages.append(page_num)
+    logger.info(f"{filename}: {num_pages - len(vision_pages)} pages from text layer, {len(vision_pages)} pages for vision extraction ({len(scanned_pages)} scanned)")
+    progress.add_pages(all_results, "text_layer")
 
-    skipped_pages = [p for p in skipped_pages if p not in successfully_processed]
+    vision_results, skipped_pages, vision_info = await extract_vision_pages(
+        client, model, document.path, vision_pages, RENDER_PROFILES[profile_name], progress
+    )
+    all_results.update(vision_results)
 
     if not all_results and skipped_pages:
         raise HTTPException(status_code=400, detail="No valid text extracted from any pages")
 
-    return all_results, skipped_pages
\ No newline at end of file
+    for page_num in vision_pages:
+        if str(page_num) in all_results:
+            page_engines[str(page_num)] = "duplicate" if str(page_num) in vision_info["duplicate_pages"] else "vlm"
+    extraction_info = {
+        "page_engines": page_engines,
+        "blank_pages": vision_info["blank_pages"],
+        "duplicate_pages": vision_info["duplicate_pages"],
+        "batch_plan": vision_info["batch_plan"],
+        "recovery": vision_info["recovery"],
+        "render": {
+            "profile": profile_name,
+            **RENDER_PROFILES[profile_name],
+            "bytes_per_page": vision_info["bytes_per_page"],
+            "bytes_total": sum(vision_info["bytes_per_page"].values())
+        }
+    }
+
+    # Only cache complete extractions so failed pages get another chance next upload
+    if not skipped_pages:
+        await asyncio.to_thread(extraction_cache.set, cache_key, all_results, skipped_pages, extraction_info)
+
+    return all_results, skipped_pages, extraction_info
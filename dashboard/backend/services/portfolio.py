@@ -0,0 +1,198 @@
+# File: services/portfolio.py
+import json
+import os
+import re
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import BinaryIO, Dict, List, Optional
+from fastapi import HTTPException
+import logging
+from constants import PORTFOLIO_MAX_PAIRS, PORTFOLIO_MAX_PROFILE_BYTES
+from services.llm_retry import RetryBudget, call_with_backoff
+
+logger = logging.getLogger(__name__)
+
+# Root element (XML) or single top-level key (JSON) of each profile kind
+PROFILE_KINDS = {"Unternehmensprofil": "company", "Landesprofil": "country"}
+PORTFOLIO_PROMPT = "Prüfe, ob das Unternehmen von den Anforderungen des Landesprofils betroffen ist."
+VERDICT_INSTRUCTION = (
+    "End your answer with one final line that is exactly one of: "
+    "VERDICT: AFFECTED, VERDICT: NOT_AFFECTED, VERDICT: UNDETERMINED"
+)
+_VERDICT_LINE = re.compile(r"VERDICT:\s*(AFFECTED|NOT[_ ]AFFECTED|UNDETERMINED)", re.IGNORECASE)
+VERDICTS = ("affected", "unaffected", "undetermined", "failed")
+
+class Profile:
+    """One company or country profile of a portfolio run."""
+
+    def __init__(self, kind: str, filename: str, name: str, text: str):
+        self.kind = kind
+        self.filename = filename
+        self.name = name
+        self.text = text
+
+    def describe(self) -> Dict:
+        return {"name": self.name, "file": self.filename}
+
+def _decode(data: bytes) -> str:
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin-1', errors='ignore')
+
+def read_profile(filename: str, data: bytes, kind: Optional[str] = None) -> Optional[Profile]:
+    """Parse a profile, recognising its kind from the root element unless kind is given.
+
+    Returns None for a file that is not recognisably a profile and no kind was given.
+    """
+    if len(data) > PORTFOLIO_MAX_PROFILE_BYTES:
+        raise HTTPException(status_code=413, detail=f"Profile {filename} exceeds {PORTFOLIO_MAX_PROFILE_BYTES} bytes")
+    text = _decode(data)
+    found_kind, name = None, None
+    try:
+        root = ET.fromstring(data)
+        found_kind = PROFILE_KINDS.get(root.tag)
+        if found_kind == "company":
+            name = root.findtext(".//Firmierung")
+        elif found_kind == "country":
+            name = root.findtext("AllgemeineDaten/Land")
+    except ET.ParseError:
+        try:
+            content = json.loads(text)
+            if isinstance(content, dict) and len(content) == 1:
+                found_kind = PROFILE_KINDS.get(next(iter(content)))
+        except ValueError:
+            pass
+    if kind is None:
+        if found_kind is None:
+            return None
+        kind = found_kind
+    elif found_kind and found_kind != kind:
+        raise HTTPException(status_code=400, detail=f"{filename} is a {found_kind} profile, not a {kind} profile")
+    name = (name or "").strip() or os.path.splitext(os.path.basename(filename))[0]
+    return Profile(kind, filename, name, text)
+
+def read_archive(source: BinaryIO) -> tuple[List[Profile], List[str]]:
+    """Profiles in a zip archive, recognised by content, and the names of every other file in it."""
+    try:
+        archive = zipfile.ZipFile(source)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Archive is not a valid zip file")
+    profiles, ignored = [], []
+    with archive:
+        for info in archive.infolist():
+            basename = os.path.basename(info.filename)
+            if info.is_dir() or info.filename.startswith("__MACOSX/") or basename.startswith("."):
+                continue
+            if not basename.lower().endswith((".xml", ".json")):
+                ignored.append(info.filename)
+                continue
+            # Checked before decompressing, so a zip bomb is refused without being inflated
+            if info.file_size > PORTFOLIO_MAX_PROFILE_BYTES:
+                raise HTTPException(status_code=413, detail=f"Profile {info.filename} exceeds {PORTFOLIO_MAX_PROFILE_BYTES} bytes")
+            profile = read_profile(info.filename, archive.read(info))
+            if profile is None:
+                ignored.append(info.filename)
+            else:
+                profiles.append(profile)
+    return profiles, ignored
+
+def plan_pairs(companies: List[Profile], countries: List[Profile]) -> List[tuple[Profile, Profile]]:
+    """Every (company, country) pair, grouped by country.
+
+    Consecutive requests then share the system prompt and country profile as a prompt prefix,
+    which vLLM's prefix cache serves without recomputing it.
+    """
+    if not companies or not countries:
+        raise HTTPException(status_code=400, detail="Please provide at least one company profile and one country profile")
+    if len(companies) * len(countries) > PORTFOLIO_MAX_PAIRS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{len(companies)} companies x {len(countries)} countries exceeds the limit of {PORTFOLIO_MAX_PAIRS} pairs"
+        )
+    return [(company, country) for country in countries for company in companies]
+
+def pair_messages(prompt: str, system_prompt: str, company: Profile, country: Profile) -> List[Dict]:
+    # The country profile comes first so it is part of the prefix shared by its pairs
+    text = (
+        f"Country profile ({country.filename}):\n{country.text}\n\n"
+        f"Company profile ({company.filename}):\n{company.text}\n\n"
+        f"User prompt: {prompt}\n{VERDICT_INSTRUCTION}"
+    )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": [{"type": "text", "text": text}]}
+    ]
+
+def parse_verdict(answer: str) -> str:
+    """affected, unaffected or undetermined, from the verdict line or else the answer's conclusion."""
+    matches = _VERDICT_LINE.findall(answer)
+    if matches:
+        verdict = matches[-1].upper().replace(" ", "_")
+        return {"AFFECTED": "affected", "NOT_AFFECTED": "unaffected"}.get(verdict, "undetermined")
+    # Models do not always add the line; fall back to the Rechtsfolge the system prompt asks for
+    conclusion = answer[answer.rfind("Ergebnis"):] if "Ergebnis" in answer else answer
+    conclusion = conclusion.lower()
+    if "nicht möglich" in conclusion or "cannot be determined" in conclusion:
+        return "undetermined"
+    if re.search(r"\bnicht\b[^.\n]*\bbetroffen\b|\bnot affected\b|\bunaffected\b", conclusion):
+        return "unaffected"
+    if "betroffen" in conclusion or "affected" in conclusion:
+        return "affected"
+    return "undetermined"
+
+async def analyze_pair(
+    client,
+    model: str,
+    prompt: str,
+    system_prompt: str,
+    company: Profile,
+    country: Profile,
+    budget: RetryBudget
+) -> Dict:
+    """Analyse one company against one country profile; failures are reported, not raised."""
+    start_time = time.monotonic()
+    record = {
+        "company": company.name,
+        "company_file": company.filename,
+        "country": country.name,
+        "country_file": country.filename
+    }
+    messages = pair_messages(prompt, system_prompt, company, country)
+    try:
+        response = await call_with_backoff(
+            model,
+            lambda: client.chat.completions.create(model=model, messages=messages, temperature=0.3, max_tokens=2048),
+            budget,
+            f"{company.name} / {country.name}"
+        )
+        answer = response.choices[0].message.content or ""
+        record.update(verdict=parse_verdict(answer), response=answer)
+    except Exception as e:
+        logger.error(f"Portfolio analysis of {company.name} against {country.name} failed: {str(e)}")
+        record.update(verdict="failed", error=str(e))
+    record["elapsed"] = round(time.monotonic() - start_time, 3)
+    return record
+
+class PortfolioSummary:
+    """Verdict per pair and totals of a portfolio run, built up as results arrive."""
+
+    def __init__(self, total_pairs: int):
+        self.total_pairs = total_pairs
+        self.counts = {verdict: 0 for verdict in VERDICTS}
+        self.pairs = []
+        self.started = time.monotonic()
+
+    def add(self, record: Dict):
+        self.counts[record["verdict"]] += 1
+        self.pairs.append({key: record[key] for key in ("company", "company_file", "country", "country_file", "verdict")})
+
+    def report(self) -> Dict:
+        return {
+            "pairs": self.total_pairs,
+            "completed": len(self.pairs),
+            **self.counts,
+            "results": self.pairs,
+            "elapsed": round(time.monotonic() - self.started, 3)
+        }
@@ -1,16 +1,58 @@
 # File: services/session_store.py
+import asyncio
 import json
+import os
+import sqlite3
+import threading
+import time
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
 import logging
-from constants import SESSION_FILE
+from constants import (
+    SESSION_FILE, SESSION_BACKEND, SESSION_DB, SESSION_TTL_SECONDS, SESSION_MAX_COUNT, SESSION_SWEEP_INTERVAL,
+    SESSION_FLUSH_INTERVAL, SESSION_FLUSH_MAX_BATCH, SESSION_REDIS_URL, SESSION_REDIS_PREFIX
+)
 
 logger = logging.getLogger(__name__)
 
+# An update computes an entry's new value from its stored value, None if there is none yet
+Update = Callable[[Any], Any]
+
+def replace_with(value: Any) -> Update:
+    text = json.dumps(value)
+    return lambda _: json.loads(text)
+
+def append_turns(*messages: Dict) -> Update:
+    """Update appending messages to a session's chat history and marking the session used now.
+
+    Applied to whatever the store holds when it is written, so turns recorded by other workers
+    in the meantime are kept.
+    """
+    now = time.time()
+
+    def update(session):
+        session = session if isinstance(session, dict) else {}
+        return {**session, "chatHistory": session.get("chatHistory", []) + list(messages), "timestamp": now}
+    return update
+
 class Store:
+    """Legacy store: the whole tree in one JSON file, rewritten on every set.
+
+    Each process keeps its own copy of the tree, so only one process may use the file.
+    """
+
     def __init__(self, file_path: Path = SESSION_FILE):
         self.file_path = file_path
-        self.file_path.parent.mkdir(parents=True, exist_ok=True)
-        self.data = self.load()
+        self._data: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+    @property
+    def data(self) -> Dict:
+        # Loaded on first use rather than at import
+        if self._data is None:
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            self._data = self.load()
+        return self._data
 
     def load(self):
         if self.file_path.exists():
@@ -29,15 +71,540 @@ class Store:
         return data if data != {} else default
 
     def set(self, key, value):
-        keys = key.split('.')
-        data = self.data
-        for k in keys[:-1]:
-            data = data.setdefault(k, {})
-        data[keys[-1]] = value
+        self.update_batch({key: [replace_with(value)]})
+
+    def update_batch(self, updates: Dict[str, List[Update]]):
+        """Apply each key's updates, in order, and rewrite the file once."""
+        with self._lock:
+            for key, key_updates in updates.items():
+                keys = key.split('.')
+                data = self.data
+                for k in keys[:-1]:
+                    data = data.setdefault(k, {})
+                value = data.get(keys[-1])
+                for update in key_updates:
+                    value = update(value)
+                data[keys[-1]] = value
+            self.save()
+
+    def save(self):
         try:
             self.file_path.write_text(json.dumps(self.data, indent=2))
         except IOError as e:
             logger.error(f"Failed to save session store: {str(e)}")
 
-# Global instance
-session_store = Store()
\ No newline at end of file
+    def count(self, namespace: str) -> int:
+        entries = self.data.get(namespace)
+        return len(entries) if isinstance(entries, dict) else 0
+
+    def evict(self, namespace: str, idle_before: Optional[float], max_entries: int) -> tuple[int, int]:
+        """Drop entries whose timestamp is before idle_before, then the oldest beyond max_entries.
+
+        Returns how many were dropped for each reason.
+        """
+        with self._lock:
+            return self._evict(namespace, idle_before, max_entries)
+
+    def _evict(self, namespace: str, idle_before: Optional[float], max_entries: int) -> tuple[int, int]:
+        entries = self.data.get(namespace)
+        if not isinstance(entries, dict):
+            return 0, 0
+        last_used = {name: value.get("timestamp", 0) if isinstance(value, dict) else 0 for name, value in entries.items()}
+        expired = [name for name, timestamp in last_used.items() if idle_before is not None and timestamp < idle_before]
+        for name in expired:
+            del entries[name]
+        over_limit = []
+        if max_entries and len(entries) > max_entries:
+            over_limit = sorted(entries, key=last_used.get)[:len(entries) - max_entries]
+            for name in over_limit:
+                del entries[name]
+        if expired or over_limit:
+            self.save()
+        return len(expired), len(over_limit)
+
+    def close(self):
+        pass
+
+class SqliteStore:
+    """Store with one SQLite row per "namespace.name" key, so reads and writes cost one entry.
+
+    Keys keep the Store form: "sessions.<id>" is row <id> of namespace "sessions"; anything
+    after the first dot is the name, dots included. The database runs in WAL mode, where a
+    write appends to the log instead of rewriting pages readers may be using. It is opened,
+    and the legacy JSON file migrated into it, on first use.
+
+    Every worker process on the host can share the file: updates read and rewrite an entry
+    inside one write transaction, so concurrent updates to a session are applied one after
+    the other rather than one overwriting the other.
+    """
+
+    def __init__(self, db_path: Path = SESSION_DB, legacy_path: Optional[Path] = SESSION_FILE):
+        self.db_path = db_path
+        self.legacy_path = legacy_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    self._conn = self._open()
+        return self._conn
+
+    def _open(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        # First, so workers opening the database together wait for each other instead of failing
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL only syncs at checkpoints in WAL mode; a power cut can lose the last turns, never corrupt the file
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "namespace TEXT NOT NULL, name TEXT NOT NULL, value TEXT NOT NULL, updated REAL NOT NULL, "
+            "PRIMARY KEY (namespace, name))"
+        )
+        # Eviction scans entries oldest first
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_by_age ON entries (namespace, updated)")
+        if self.legacy_path is not None and self.legacy_path.exists():
+            migrate_json_store(self.legacy_path, conn)
+        return conn
+
+    @staticmethod
+    def _split(key: str) -> tuple[str, str]:
+        namespace, _, name = key.partition('.')
+        return namespace, name
+
+    def get(self, key: str, default: Any = None) -> Any:
+        conn = self.conn
+        with self._lock:
+            row = conn.execute(
+                "SELECT value FROM entries WHERE namespace = ? AND name = ?", self._split(key)
+            ).fetchone()
+        if row is None:
+            return default
+        value = json.loads(row[0])
+        return value if value != {} else default
+
+    def set(self, key: str, value: Any):
+        try:
+            self.update_batch({key: [replace_with(value)]})
+        except sqlite3.Error as e:
+            logger.error(f"Failed to save session store: {str(e)}")
+
+    def update_batch(self, updates: Dict[str, List[Update]]):
+        """Apply each key's updates, in order, to its current value in one transaction."""
+        now = time.time()
+        conn = self.conn
+        with self._lock:
+            # IMMEDIATE takes the write lock before reading, so no other process changes an entry in between
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for key, key_updates in updates.items():
+                    namespace, name = self._split(key)
+                    row = conn.execute(
+                        "SELECT value FROM entries WHERE namespace = ? AND name = ?", (namespace, name)
+                    ).fetchone()
+                    value = json.loads(row[0]) if row is not None else None
+                    for update in key_updates:
+                        value = update(value)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO entries (namespace, name, value, updated) VALUES (?, ?, ?, ?)",
+                        (namespace, name, json.dumps(value), now)
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def count(self, namespace: str) -> int:
+        conn = self.conn
+        with self._lock:
+            return conn.execute("SELECT COUNT(*) FROM entries WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def evict(self, namespace: str, idle_before: Optional[float], max_entries: int) -> tuple[int, int]:
+        """Drop entries last written before idle_before, then the oldest beyond max_entries.
+
+        Returns how many were dropped for each reason.
+        """
+        conn = self.conn
+        expired = over_limit = 0
+        with self._lock:
+            if idle_before is not None:
+                expired = conn.execute(
+                    "DELETE FROM entries WHERE namespace = ? AND updated < ?", (namespace, idle_before)
+                ).rowcount
+            if max_entries:
+                over_limit = conn.execute(
+                    "DELETE FROM entries WHERE namespace = ? AND name IN ("
+                    "SELECT name FROM entries WHERE namespace = ? ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+                    (namespace, namespace, max_entries)
+                ).rowcount
+        return expired, over_limit
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+def migrate_json_store(json_path: Path, conn: sqlite3.Connection) -> int:
+    """Copy a legacy sessions.json into the entries table in one transaction, then set the file aside.
+
+    The file is renamed to <name>.migrated afterwards, so the import runs once and the original
+    stays available for rollback. Returns the number of entries imported.
+    """
+    try:
+        data = json.loads(json_path.read_text())
+    except FileNotFoundError:
+        # Another worker migrated it first
+        return 0
+    except (json.JSONDecodeError, IOError) as e:
+        logger.error(f"Failed to read {json_path} for migration, leaving it in place: {str(e)}")
+        return 0
+    now = time.time()
+    rows = [
+        (namespace, name, json.dumps(value), value.get("timestamp", now) if isinstance(value, dict) else now)
+        for namespace, entries in data.items() if isinstance(entries, dict)
+        for name, value in entries.items()
+    ]
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Entries written since the last run win over the snapshot being imported
+        conn.executemany("INSERT OR IGNORE INTO entries (namespace, name, value, updated) VALUES (?, ?, ?, ?)", rows)
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        conn.execute("ROLLBACK")
+        raise
+    try:
+        os.replace(json_path, json_path.with_name(json_path.name + ".migrated"))
+    except FileNotFoundError:
+        return 0
+    logger.info(f"Migrated {len(rows)} entries from {json_path} into the session database")
+    return len(rows)
+
+# Selects and deletes in one step on the Redis server, so an entry written in between is never dropped.
+# KEYS[1] is the index, ARGV idle_before (empty for none), max_entries and the entry key prefix;
+# names are deleted in chunks to stay below Lua's limit on unpacked arguments.
+_EVICT_SCRIPT = """
+local function drop(names)
+    for i = 1, #names, 1000 do
+        local chunk = {unpack(names, i, math.min(i + 999, #names))}
+        local entries = {}
+        for j, name in ipairs(chunk) do
+            entries[j] = ARGV[3] .. name
+        end
+        redis.call('DEL', unpack(entries))
+        redis.call('ZREM', KEYS[1], unpack(chunk))
+    end
+    return #names
+end
+local expired = 0
+if ARGV[1] ~= '' then
+    expired = drop(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[1]))
+end
+local over_limit = 0
+local max_entries = tonumber(ARGV[2])
+if max_entries > 0 then
+    local excess = redis.call('ZCARD', KEYS[1]) - max_entries
+    if excess > 0 then
+        over_limit = drop(redis.call('ZRANGE', KEYS[1], 0, excess - 1))
+    end
+end
+return {expired, over_limit}
+"""
+
+class RedisStore:
+    """Store in Redis, or anything speaking its protocol, shared by every worker on every node.
+
+    Entry "<namespace>.<name>" is the string key <prefix>entry:<namespace>:<name>, holding the JSON
+    value; the sorted set <prefix>index:<namespace> scores each name by its last write, for
+    counting and eviction. A batch of updates runs in one WATCH/MULTI transaction over all its
+    entries, retried when another worker changed one of them in between, so it is written whole
+    or not at all. Eviction runs as a Lua script. A client can be passed in, e.g. fakeredis in
+    tests; otherwise the redis package connects to url on first use.
+    """
+
+    def __init__(self, url: str = SESSION_REDIS_URL, prefix: str = SESSION_REDIS_PREFIX, client=None):
+        self.url = url
+        self.prefix = prefix
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis  # Only needed for this backend
+            self._client = redis.Redis.from_url(self.url, decode_responses=True)
+        return self._client
+
+    def _entry(self, namespace: str, name: str) -> str:
+        return f"{self.prefix}entry:{namespace}:{name}"
+
+    def _index(self, namespace: str) -> str:
+        return f"{self.prefix}index:{namespace}"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        namespace, _, name = key.partition('.')
+        text = self.client.get(self._entry(namespace, name))
+        if text is None:
+            return default
+        value = json.loads(text)
+        return value if value != {} else default
+
+    def set(self, key: str, value: Any):
+        self.update_batch({key: [replace_with(value)]})
+
+    def update_batch(self, updates: Dict[str, List[Update]]):
+        """Apply each key's updates, in order, to its current value, all keys in one transaction."""
+        entries = {}
+        for key, key_updates in updates.items():
+            namespace, _, name = key.partition('.')
+            entries[self._entry(namespace, name)] = (namespace, name, key_updates)
+        if not entries:
+            return
+
+        def apply(pipe):
+            values = []
+            for text, (namespace, name, key_updates) in zip(pipe.mget(list(entries)), entries.values()):
+                value = json.loads(text) if text is not None else None
+                for update in key_updates:
+                    value = update(value)
+                values.append(value)
+            now = time.time()
+            pipe.multi()
+            for (entry, (namespace, name, _)), value in zip(entries.items(), values):
+                pipe.set(entry, json.dumps(value))
+                pipe.zadd(self._index(namespace), {name: now})
+
+        self.client.transaction(apply, *entries)
+
+    def count(self, namespace: str) -> int:
+        return self.client.zcard(self._index(namespace))
+
+    def evict(self, namespace: str, idle_before: Optional[float], max_entries: int) -> tuple[int, int]:
+        """Drop entries last written before idle_before, then the oldest beyond max_entries.
+
+        Returns how many were dropped for each reason.
+        """
+        expired, over_limit = self.client.eval(
+            _EVICT_SCRIPT, 1, self._index(namespace), repr(idle_before) if idle_before is not None else "",
+            max_entries or 0, self._entry(namespace, "")
+        )
+        return expired, over_limit
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+def create_session_store(backend: str = SESSION_BACKEND):
+    if backend == "json":
+        return Store()
+    if backend == "sqlite":
+        return SqliteStore()
+    if backend == "redis":
+        return RedisStore()
+    raise ValueError(f"Unknown SESSION_BACKEND {backend}; expected sqlite, redis or json")
+
+class WriteBehindStore:
+    """Session updates land in memory at once and reach the durable store in batches, off the event loop.
+
+    A background task writes changed sessions every interval, or sooner once max_batch are waiting;
+    several updates to one session in between cost one write. Updates are queued as functions of
+    the stored value and applied to it when written, so other workers' updates in between are kept.
+    Reads see updates not yet written. A crash loses at most the last interval of updates; stop()
+    writes whatever is pending. With an interval of 0 every update wakes the task, which writes it at
+    once, still off the event loop. Until start() is called updates are written through on the
+    calling thread, so only code not running on the event loop, such as scripts, may use it then.
+    """
+
+    def __init__(self, store, interval: float = SESSION_FLUSH_INTERVAL, max_batch: int = SESSION_FLUSH_MAX_BATCH):
+        self.store = store
+        self.interval = interval
+        self.max_batch = max_batch
+        self.pending: Dict[str, List[Update]] = {}
+        self.flushing: Dict[str, List[Update]] = {}
+        self.dirty_since: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.flushes = 0
+        self.flushed_entries = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+        self.last_flush_seconds = 0.0
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        while True:
+            # The durable read runs in a thread; a batch written meanwhile may or may not be in it, so read again
+            flushes = self.flushes
+            layers = [list(layer.get(key, ())) for layer in (self.flushing, self.pending)]
+            value = await asyncio.to_thread(self.store.get, key)
+            if self.flushes == flushes:
+                break
+        for layer in layers:
+            for update in layer:
+                value = update(value)
+        return value if value not in (None, {}) else default
+
+    def set(self, key: str, value: Any):
+        self.update(key, replace_with(value))
+
+    def update(self, key: str, update: Update):
+        if self.task is None:
+            self.store.update_batch({key: [update]})
+            return
+        if key in self.pending:
+            self.coalesced += 1
+        elif not self.pending:
+            self.dirty_since = time.monotonic()
+        self.pending.setdefault(key, []).append(update)
+        if len(self.pending) >= self.max_batch or self.interval <= 0:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        """Write every pending update in one batch; returns how many were written."""
+        if not self.pending:
+            return 0
+        batch, dirty_since = self.pending, self.dirty_since
+        self.pending, self.dirty_since = {}, None
+        self.flushing = batch
+        start_time = time.monotonic()
+        try:
+            await asyncio.to_thread(self.store.update_batch, batch)
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Failed to write {len(batch)} session updates, retrying: {str(e)}")
+            # Ahead of updates made while the batch was being written, which are newer
+            for key, key_updates in batch.items():
+                self.pending[key] = key_updates + self.pending.get(key, [])
+            self.dirty_since = dirty_since
+            return 0
+        finally:
+            self.flushing = {}
+        now = time.monotonic()
+        self.flushes += 1
+        self.flushed_entries += len(batch)
+        self.last_batch_size = len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        self.last_flush_lag = now - dirty_since
+        self.max_flush_lag = max(self.max_flush_lag, self.last_flush_lag)
+        self.last_flush_seconds = now - start_time
+        return len(batch)
+
+    async def _loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval if self.interval > 0 else None)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self):
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Stop the background task after a last flush and close the durable store."""
+        if self.task:
+            # Not cancelled: a batch being written would be cut off mid-transaction
+            self._stopping = True
+            self._wake.set()
+            await self.task
+            self.task = None
+            await self.flush()
+        if self.pending:
+            logger.error(f"Lost {len(self.pending)} session updates that could not be written")
+        await asyncio.to_thread(self.store.close)
+
+    def stats(self) -> Dict:
+        return {
+            "pending": len(self.pending),
+            "flush_lag": round(time.monotonic() - self.dirty_since, 3) if self.dirty_since is not None else 0.0,
+            "last_flush_lag": round(self.last_flush_lag, 3),
+            "max_flush_lag": round(self.max_flush_lag, 3),
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "flushes": self.flushes,
+            "flushed_entries": self.flushed_entries,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "last_flush_seconds": round(self.last_flush_seconds, 4),
+            "interval": self.interval
+        }
+
+class SessionSweeper:
+    """Background task evicting idle sessions and, above the session limit, the least recently used.
+
+    A session's last use is its last write, which every chat turn makes.
+    """
+
+    def __init__(
+        self,
+        store,
+        ttl_seconds: int = SESSION_TTL_SECONDS,
+        max_sessions: int = SESSION_MAX_COUNT,
+        interval: float = SESSION_SWEEP_INTERVAL
+    ):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.sweeps = 0
+        self.evicted_expired = 0
+        self.evicted_lru = 0
+        self.last_sweep: Optional[float] = None
+
+    def sweep(self) -> int:
+        idle_before = time.time() - self.ttl_seconds if self.ttl_seconds > 0 else None
+        expired, over_limit = self.store.evict("sessions", idle_before, self.max_sessions)
+        self.sweeps += 1
+        self.evicted_expired += expired
+        self.evicted_lru += over_limit
+        self.last_sweep = time.time()
+        if expired or over_limit:
+            logger.info(f"Evicted {expired} idle and {over_limit} least recently used sessions")
+        return expired + over_limit
+
+    async def _loop(self):
+        while True:
+            try:
+                # Eviction scans and deletes in the durable store
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"Session sweep failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def stats(self) -> Dict:
+        return {
+            "backend": type(self.store).__name__,
+            "live_sessions": self.store.count("sessions"),
+            "evicted_expired": self.evicted_expired,
+            "evicted_lru": self.evicted_lru,
+            "sweeps": self.sweeps,
+            "last_sweep": self.last_sweep,
+            "ttl_seconds": self.ttl_seconds,
+            "max_sessions": self.max_sessions
+        }
+
+# Global instances
+durable_session_store = create_session_store()
+session_store = WriteBehindStore(durable_session_store)  # What request handlers read and write
+session_sweeper = SessionSweeper(durable_session_store)
@@ -0,0 +1,66 @@
+# File: services/single_flight.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """Lets concurrent callers asking for the same key share one run of the work."""
+
+    def __init__(self):
+        self.flights: Dict[Hashable, _Flight] = {}
+        self.started = 0
+        self.joined = 0
+
+    async def run(
+        self,
+        key: Hashable,
+        start: Callable[[], Awaitable[Any]],
+        on_done: Optional[Callable[[], None]] = None
+    ) -> tuple[Any, bool]:
+        """Await the running call for key, or start one; returns (result, whether an existing call was joined).
+
+        start and on_done are only used by the caller that starts the call.
+        """
+        flight = self.flights.get(key)
+        joined = flight is not None
+        if flight is None:
+            # A task of its own, so the caller that started it can go away without cancelling it for the rest
+            flight = _Flight(asyncio.create_task(start()))
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._finished(key, flight, on_done))
+            self.started += 1
+        else:
+            self.joined += 1
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), joined
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Every caller gave up; later callers start afresh instead of joining a cancelled call
+                logger.info("Cancelling in-flight call nobody is waiting for")
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def _finished(self, key: Hashable, flight: _Flight, on_done: Optional[Callable[[], None]]):
+        self._forget(key, flight)
+        if on_done:
+            on_done()
+
+    def stats(self) -> Dict:
+        return {"in_flight": len(self.flights), "started": self.started, "joined": self.joined}
+
+# Global instances
+extraction_flights = SingleFlight()  # Keyed by extraction cache key: document hash, model and render profile
+answer_flights = SingleFlight()  # Keyed by a hash of model, prompts and extracted text
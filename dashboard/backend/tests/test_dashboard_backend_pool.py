@@ -0,0 +1,164 @@
+# test_dashboard_backend_pool.py
+import asyncio
+from types import SimpleNamespace
+import pytest
+from openai import APIConnectionError
+try:
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+from services import backend_pool
+from services.backend_pool import BackendPool
+from services.llm_scheduler import LLMScheduler
+
+class FakeStream:
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed or not self.chunks:
+            raise StopAsyncIteration
+        return self.chunks.pop(0)
+
+    async def close(self):
+        self.closed = True
+
+class FakeReplicaClient:
+    """Stands in for one replica's AsyncOpenAI client."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.down = False
+        self.calls = 0
+        self.streams = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.models = SimpleNamespace(list=self.list_models)
+
+    def with_options(self, **options):
+        return self
+
+    def check(self):
+        if self.down:
+            raise APIConnectionError(request=httpx.Request("POST", self.base_url))
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        self.check()
+        if kwargs.get("stream"):
+            stream = FakeStream(["a", "b", "c"])
+            self.streams.append(stream)
+            return stream
+        return self.base_url
+
+    async def list_models(self):
+        self.check()
+        return []
+
+@pytest.fixture
+def pool(monkeypatch):
+    scheduler = LLMScheduler(max_inflight=4, max_queue=100, endpoints={})
+    monkeypatch.setattr(backend_pool, "llm_scheduler", scheduler)
+    monkeypatch.setattr(backend_pool, "POOL_EJECT_AFTER_FAILURES", 2)
+    pool = BackendPool("m", ["http://replica-a/v1", "http://replica-b/v1"])
+    for replica in pool.replicas:
+        asyncio.run(replica.client.close())
+        replica.client = FakeReplicaClient(replica.base_url)
+    pool.scheduler = scheduler
+    return pool
+
+def create(pool, **kwargs):
+    return pool.chat.completions.create(model="m", messages=[], **kwargs)
+
+def test_calls_go_to_the_replica_with_fewest_outstanding(pool):
+    a, b = pool.replicas
+
+    async def main():
+        first = await create(pool, stream=True)
+        second = await create(pool, stream=True)
+        # Each open stream keeps its replica busy, so the second went to the other one
+        assert (a.outstanding, b.outstanding) == (1, 1)
+        async with first:
+            assert [chunk async for chunk in first] == ["a", "b", "c"]
+        assert (a.outstanding, b.outstanding) == (0, 1)
+        assert await create(pool) == a.base_url
+        async with second:
+            pass
+
+    asyncio.run(main())
+    assert (a.outstanding, b.outstanding) == (0, 0)
+    assert (a.requests, b.requests) == (2, 1)
+
+def test_ties_go_to_the_lower_latency_replica(pool):
+    a, b = pool.replicas
+    a.latency_ewma, b.latency_ewma = 2.0, 0.5
+    assert asyncio.run(create(pool)) == b.base_url
+
+def test_abandoned_streams_release_the_replica_and_close_upstream(pool):
+    a, _ = pool.replicas
+
+    async def main():
+        # Never iterated
+        async with await create(pool, stream=True):
+            pass
+        # Dropped part way
+        async with await create(pool, stream=True) as stream:
+            async for chunk in stream:
+                break
+
+    asyncio.run(main())
+    assert a.outstanding == 0
+    assert [upstream.closed for upstream in a.client.streams] == [True, True]
+    # Neither answer completed, so neither says anything about latency
+    assert a.latency_ewma is None
+
+def test_latency_ewma_follows_completed_calls(pool, monkeypatch):
+    a, b = pool.replicas
+    # Keep every call on one replica
+    b.healthy = False
+    clock = iter([0.0, 1.0, 10.0, 12.0, 20.0, 20.5])
+    monkeypatch.setattr(backend_pool, "time", SimpleNamespace(monotonic=lambda: next(clock)))
+
+    async def main():
+        await create(pool)
+        assert a.latency_ewma == pytest.approx(1.0)
+        await create(pool)
+        assert a.latency_ewma == pytest.approx(0.8 * 1.0 + 0.2 * 2.0)
+        async with await create(pool, stream=True) as stream:
+            async for chunk in stream:
+                pass
+        # A stream counts until its last chunk
+        assert a.latency_ewma == pytest.approx(0.8 * 1.2 + 0.2 * 0.5)
+
+    asyncio.run(main())
+
+def test_failing_replica_is_ejected_and_probed_back(pool):
+    a, b = pool.replicas
+    a.client.down = True
+
+    async def main():
+        for _ in range(2):
+            with pytest.raises(APIConnectionError):
+                await create(pool)
+        assert not a.healthy
+        assert a.outstanding == 0
+        assert pool.scheduler.backends["m"].replicas == 1
+        # Ejected replicas get no traffic while a healthy one is left
+        assert await create(pool) == b.base_url
+        assert a.client.calls == 2
+
+        # Still down: the probe keeps it out
+        await pool._probe(a)
+        assert not a.healthy
+        a.client.down = False
+        await pool._probe(a)
+        assert a.healthy
+        assert a.consecutive_failures == 0
+        assert pool.scheduler.backends["m"].replicas == 2
+        assert await create(pool) == a.base_url
+
+    asyncio.run(main())
+    assert pool.stats()["replicas"][0]["ejections"] == 1
@@ -0,0 +1,107 @@
+# test_dashboard_document_registry.py
+import hashlib
+import json
+import os
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from services.document_registry import DocumentRegistry
+
+@pytest.fixture
+def registry(tmp_path):
+    return DocumentRegistry(registry_dir=tmp_path, max_bytes=1024 * 1024, memory_entries=2)
+
+def test_document_id_is_the_hash_of_its_json(registry):
+    extracted_text = {"1": "first page", "2": "second page"}
+    document = registry.register(extracted_text, "report.pdf")
+    assert document.id == hashlib.sha256(json.dumps(extracted_text).encode("utf-8")).hexdigest()
+    assert document.text == json.dumps(extracted_text)
+    assert document.label == "report"
+    # The same result registers to the same document, keeping the first file name
+    again = registry.register(dict(extracted_text), "copy.pdf")
+    assert again.id == document.id
+    assert again.filename == "report.pdf"
+    assert registry.stats()["registered"] == 1
+
+def test_memory_keeps_the_most_recent_and_disk_keeps_the_rest(registry):
+    documents = [registry.register({"1": f"page of document {i}"}) for i in range(3)]
+    assert list(registry.memory) == [documents[1].id, documents[2].id]
+
+    # Dropped from memory, still answered from disk and remembered again
+    first = registry.get(documents[0].id)
+    assert first.extracted_text == {"1": "page of document 0"}
+    assert list(registry.memory) == [documents[2].id, documents[0].id]
+    registry.get(documents[2].id)
+    stats = registry.stats()
+    assert (stats["entries"], stats["in_memory"], stats["disk_hits"], stats["memory_hits"]) == (3, 2, 1, 1)
+
+    # Another registry over the same directory, as another worker, finds them on disk
+    other = DocumentRegistry(registry_dir=registry.registry_dir, memory_entries=2)
+    assert other.get(documents[1].id).text == documents[1].text
+
+def test_least_recently_used_documents_are_evicted_from_disk(registry):
+    documents = [registry.register({"1": f"page of document {i}" + "x" * 1000}) for i in range(3)]
+    for age, document in enumerate(documents):
+        # Oldest first, whatever the filesystem's mtime resolution
+        os.utime(registry._path(document.id), (1000 + age, 1000 + age))
+    registry.get(documents[0].id)
+    registry.max_bytes = sum(os.path.getsize(registry._path(document.id)) for document in (documents[0], documents[2]))
+    registry.evict()
+    assert registry.get(documents[1].id) is None
+    assert registry.get(documents[0].id) is not None
+    assert registry.get(documents[2].id) is not None
+    assert registry.stats()["evictions"] == 1
+
+def test_unknown_document_is_a_404(registry):
+    known = registry.register({"1": "text"})
+    with pytest.raises(HTTPException) as error:
+        registry.resolve([known.id, "0" * 64])
+    assert error.value.status_code == 404
+    assert registry.get("not-a-document-id") is None
+
+def test_several_documents_resolve_by_file_name(registry):
+    first = registry.register({"1": "first"}, "a.pdf")
+    second = registry.register({"1": "second"}, "b.pdf")
+    all_results, text, document_ids = registry.resolve([first.id, second.id, first.id])
+    assert all_results == {"a": {"1": "first"}, "b": {"1": "second"}}
+    assert json.loads(text) == all_results
+    assert document_ids == [first.id, second.id]
+
+class FakeCompletions:
+    def __init__(self):
+        self.messages = []
+
+    async def create(self, model, messages, **kwargs):
+        self.messages.append(messages)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="an answer"))])
+
+@pytest.fixture
+def app(monkeypatch):
+    import main
+    from routers import process
+    completions = FakeCompletions()
+    monkeypatch.setattr(process, "get_openai_client", lambda model: SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    with TestClient(main.app) as client:
+        yield client, completions
+
+def test_process_message_with_unknown_document_is_a_404(app):
+    client, completions = app
+    response = client.post("/process/message", data={"prompt": "What is the total?", "documentId": "0" * 64})
+    assert response.status_code == 404
+    assert completions.messages == []
+
+def test_plain_extracted_text_is_kept_and_registered(app):
+    client, completions = app
+    response = client.post("/process/message", data={"prompt": "Summarize", "extracted_text": "not json at all"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["extracted_text"] == {"content": "not json at all"}
+    [document_id] = body["documentIds"]
+    assert "not json at all" in completions.messages[-1][1]["content"][0]["text"]
+
+    # The next turn can refer to it
+    response = client.post("/process/message", data={"prompt": "And the date?", "documentId": document_id})
+    assert response.status_code == 200
+    assert "extracted_text" not in response.json()
+    assert '{"content": "not json at all"}' in completions.messages[-1][1]["content"][0]["text"]
@@ -0,0 +1,129 @@
+# test_dashboard_guided_decoding.py
+import asyncio
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from openai import AsyncOpenAI
+from services import pdf_processor
+from services.json_salvage import ParseStats
+from services.llm_retry import RetryBudget
+from services.pdf_processor import page_messages, process_single_batch
+
+class StubBackend(BaseHTTPRequestHandler):
+    """OpenAI-compatible chat completions that echo the requested pages.
+
+    Legacy mode rejects response_format; overflow mode rejects every request as too long for the context.
+    """
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+        if self.server.legacy and "response_format" in body:
+            self.reply(400, {"error": {"message": "response_format unsupported", "type": "BadRequestError", "code": 400}})
+            return
+        if self.server.overflow:
+            message = "This model's maximum context length is 8192 tokens. However, you requested 9000 tokens."
+            self.reply(400, {"error": {"message": message, "type": "BadRequestError", "code": 400}})
+            return
+        text = body["messages"][0]["content"][-1]["text"]
+        pages = re.search(r"\(pages? (?:number )?([\d, ]+)\)", text).group(1).split(", ")
+        content = json.dumps({page: f"text of page {page}" for page in pages})
+        self.reply(200, {
+            "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+        })
+
+    def reply(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(pdf_processor, "GUIDED_DECODING_ENABLED", True)
+    pdf_processor.guided_decoding_unsupported.clear()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubBackend)
+    server.requests = []
+    server.legacy = False
+    server.overflow = False
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    pdf_processor.guided_decoding_unsupported.clear()
+
+def extract(backend, page_numbers, budget):
+    images = {p: "data:image/jpeg;base64,AAAA" for p in page_numbers}
+
+    async def run():
+        client = AsyncOpenAI(api_key="test", base_url=f"http://127.0.0.1:{backend.server_port}/v1")
+        try:
+            return await process_single_batch(client, "gemma3", page_messages(images, page_numbers), page_numbers, 512, budget, ParseStats())
+        finally:
+            await client.close()
+
+    return asyncio.run(run())
+
+def test_schema_allows_exactly_the_batch_pages(backend):
+    results, failed = extract(backend, [3, 4, 7], RetryBudget(1))
+    assert results == {"3": "text of page 3", "4": "text of page 4", "7": "text of page 7"}
+    assert failed == []
+    [request] = backend.requests
+    schema = request["response_format"]["json_schema"]["schema"]
+    assert request["response_format"]["type"] == "json_schema"
+    assert list(schema["properties"]) == ["3", "4", "7"]
+    assert schema["required"] == ["3", "4", "7"]
+    assert schema["additionalProperties"] is False
+
+def test_rejected_schema_falls_back_to_prompt_only(backend):
+    backend.legacy = True
+    budget = RetryBudget(1)
+    results, failed = extract(backend, [1, 2], budget)
+    assert results == {"1": "text of page 1", "2": "text of page 2"}
+    assert failed == []
+    assert ["response_format" in request for request in backend.requests] == [True, False]
+    assert budget.spent == 1
+    assert "gemma3" in pdf_processor.guided_decoding_unsupported
+
+    # Remembered for the model: later batches go straight to the prompt-only request
+    backend.requests.clear()
+    results, _ = extract(backend, [5], RetryBudget(1))
+    assert results == {"5": "text of page 5"}
+    assert ["response_format" in request for request in backend.requests] == [False]
+
+def test_fallback_needs_budget(backend):
+    backend.legacy = True
+    budget = RetryBudget(1)
+    budget.limit = 0
+    results, failed = extract(backend, [1, 2], budget)
+    assert results is None
+    assert failed == [1, 2]
+    assert len(backend.requests) == 1
+    assert "gemma3" not in pdf_processor.guided_decoding_unsupported
+
+def test_unrelated_rejection_keeps_guided_decoding(backend):
+    backend.overflow = True
+    budget = RetryBudget(1)
+    results, failed = extract(backend, [1, 2], budget)
+    assert results is None
+    assert failed == [1, 2]
+    # No schema-less retry: the plain request would overflow just the same
+    assert len(backend.requests) == 1
+    assert budget.spent == 0
+    assert "gemma3" not in pdf_processor.guided_decoding_unsupported
+
+    backend.overflow = False
+    backend.requests.clear()
+    results, _ = extract(backend, [1], RetryBudget(1))
+    assert results == {"1": "text of page 1"}
+    assert ["response_format" in request for request in backend.requests] == [True]
@@ -0,0 +1,171 @@
+# test_dashboard_job_manager.py
+import asyncio
+import pytest
+from fastapi import HTTPException
+from services.job_manager import JobManager
+from services.session_store import SqliteStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteStore(tmp_path / "sessions.db", legacy_path=None)
+    yield store
+    store.close()
+
+def workers(store, count=2, **options):
+    """Job managers sharing one store, like uvicorn workers behind one port."""
+    return [JobManager(workers=1, store=store, publish_interval=0.01, **options) for _ in range(count)]
+
+async def wait_for(manager, job_id, *statuses):
+    for _ in range(500):
+        job = await manager.get(job_id)
+        if job and job["status"] in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {statuses}: {job}")
+
+def test_job_is_polled_through_any_worker(store):
+    async def main():
+        owner, other = workers(store)
+        owner.start()
+        other.start()
+        step = asyncio.Event()
+
+        async def work(job):
+            job.progress.start(2)
+            job.progress.add_pages({"1": "first page"}, "vlm")
+            await step.wait()
+            return {"extracted_text": {"1": "first page", "2": "second page"}}
+
+        try:
+            job = await owner.submit(work, filename="report.pdf", model="gemma3")
+            # Published before submit returns, so the next poll finds it wherever it lands
+            assert (await other.get(job.id))["status"] in ("queued", "running")
+
+            running = await wait_for(other, job.id, "running")
+            assert running["filename"] == "report.pdf"
+            await asyncio.sleep(0.05)
+            running = await other.get(job.id)
+            assert running["partial_results"] == {"1": "first page"}
+            assert running["progress"]["completed_pages"] == 1
+
+            step.set()
+            done = await wait_for(other, job.id, "completed")
+            assert done["result"] == {"extracted_text": {"1": "first page", "2": "second page"}}
+            assert done == await owner.get(job.id)
+            assert "cancelRequested" not in done
+        finally:
+            await owner.stop()
+            await other.stop()
+
+    asyncio.run(main())
+
+def test_cancel_through_another_worker(store):
+    async def main():
+        owner, other = workers(store)
+        owner.start()
+        other.start()
+        started = asyncio.Event()
+
+        async def work(job):
+            started.set()
+            await asyncio.sleep(60)
+
+        try:
+            job = await owner.submit(work)
+            await started.wait()
+            await wait_for(other, job.id, "running")
+            cancelled = await other.cancel(job.id)
+            assert cancelled["status"] == "cancelling"
+            # The owner acts on the flag at its next publish
+            assert (await wait_for(other, job.id, "cancelled"))["finished"] is not None
+            assert (await owner.get(job.id))["status"] == "cancelled"
+        finally:
+            await owner.stop()
+            await other.stop()
+
+    asyncio.run(main())
+
+def test_cancel_queued_job_runs_cleanup(store):
+    async def main():
+        [manager] = workers(store, count=1)
+        manager.start()
+        cleaned = []
+        blocker = asyncio.Event()
+
+        async def block(job):
+            await blocker.wait()
+
+        async def never(job):
+            raise AssertionError("cancelled job ran")
+
+        try:
+            await manager.submit(block)
+            queued = await manager.submit(never, cleanup=lambda: cleaned.append(True))
+            assert (await manager.cancel(queued.id))["status"] == "cancelled"
+            assert cleaned == [True]
+            blocker.set()
+            await asyncio.sleep(0.05)
+            assert (await manager.get(queued.id))["status"] == "cancelled"
+        finally:
+            await manager.stop()
+
+    asyncio.run(main())
+
+def test_failed_job_reports_its_error(store):
+    async def main():
+        owner, other = workers(store)
+        owner.start()
+
+        async def work(job):
+            raise HTTPException(status_code=400, detail="No valid text extracted from any pages")
+
+        try:
+            job = await owner.submit(work)
+            failed = await wait_for(other, job.id, "failed")
+            assert failed["error"] == "No valid text extracted from any pages"
+        finally:
+            await owner.stop()
+
+    asyncio.run(main())
+
+def test_unknown_job_and_full_queue(store):
+    async def main():
+        [manager] = workers(store, count=1, max_queued=1)
+        manager.start()
+        blocker = asyncio.Event()
+
+        async def block(job):
+            await blocker.wait()
+
+        try:
+            assert await manager.get("no-such-job") is None
+            assert await manager.cancel("no-such-job") is None
+            running = await manager.submit(block)
+            await wait_for(manager, running.id, "running")
+            await manager.submit(block)
+            with pytest.raises(HTTPException) as rejected:
+                await manager.submit(block)
+            assert rejected.value.status_code == 429
+            blocker.set()
+        finally:
+            await manager.stop()
+
+    asyncio.run(main())
+
+def test_finished_jobs_expire_from_the_store(store):
+    async def main():
+        [manager] = workers(store, count=1, retention_seconds=0)
+        manager.start()
+
+        async def work(job):
+            return {"ok": True}
+
+        try:
+            job = await manager.submit(work)
+            await asyncio.sleep(0.1)
+            assert store.count("jobs") == 0
+            assert await manager.get(job.id) is None
+        finally:
+            await manager.stop()
+
+    asyncio.run(main())
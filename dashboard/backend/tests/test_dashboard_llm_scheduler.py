@@ -0,0 +1,93 @@
+# test_dashboard_llm_scheduler.py
+import asyncio
+import pytest
+from fastapi import HTTPException
+from services.llm_scheduler import LLMScheduler, llm_flow
+
+def test_waiting_flows_are_served_round_robin():
+    scheduler = LLMScheduler(max_inflight=1, max_queue=100, endpoints={})
+    order = []
+
+    async def call(flow, i):
+        llm_flow.set(flow)
+        async with scheduler.slot("m"):
+            order.append(f"{flow}{i}")
+            await asyncio.sleep(0.001)
+
+    async def main():
+        tasks = [asyncio.create_task(call("a", i)) for i in range(4)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(call("b", i)) for i in range(2)]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    # a0 held the only slot; then the flows take turns instead of b waiting behind all of a
+    assert order == ["a0", "a1", "b0", "a2", "b1", "a3"]
+    assert scheduler.stats()["m"]["completed"] == 6
+
+def test_saturated_queue_rejects_with_retry_after():
+    scheduler = LLMScheduler(max_inflight=1, max_queue=2, endpoints={})
+
+    async def main():
+        release = asyncio.Event()
+
+        async def call():
+            async with scheduler.slot("m"):
+                await release.wait()
+
+        tasks = [asyncio.create_task(call()) for _ in range(3)]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as rejected:
+            scheduler.admit("m")
+        release.set()
+        await asyncio.gather(*tasks)
+        scheduler.admit("m")
+        return rejected.value
+
+    rejected = asyncio.run(main())
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert scheduler.stats()["m"]["rejected"] == 1
+
+def test_cancelled_waiter_leaves_the_queue():
+    scheduler = LLMScheduler(max_inflight=1, max_queue=10, endpoints={})
+
+    async def main():
+        await scheduler.acquire("m")
+        waiter = asyncio.create_task(scheduler.acquire("m"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        scheduler.release("m")
+
+    asyncio.run(main())
+    stats = scheduler.stats()["m"]
+    assert (stats["inflight"], stats["queued"], stats["flows"]) == (0, 0, 0)
+
+def test_models_on_the_same_endpoints_share_one_limit():
+    endpoints = {"a": "http://h:9000/v1/, http://g:9000/v1", "b": "http://g:9000/v1,http://h:9000/v1", "c": "http://x:9000/v1"}
+    scheduler = LLMScheduler(max_inflight=2, max_queue=10, endpoints=endpoints)
+    assert scheduler.backend_key("a") == scheduler.backend_key("b")
+    assert scheduler.backend_key("a") != scheduler.backend_key("c")
+    peak = [0, 0]
+
+    async def call(model):
+        async with scheduler.slot(model):
+            peak[0] += 1
+            peak[1] = max(peak)
+            await asyncio.sleep(0.001)
+            peak[0] -= 1
+
+    async def main():
+        await asyncio.gather(*(call(model) for model in "abab"))
+
+    asyncio.run(main())
+    assert peak[1] == 2
+    assert scheduler.stats()[scheduler.backend_key("a")]["models"] == ["a", "b"]
+
+def test_limit_scales_with_healthy_replicas():
+    scheduler = LLMScheduler(max_inflight=3, max_queue=10, endpoints={})
+    scheduler.set_replicas("m", 2)
+    assert scheduler.stats()["m"]["max_inflight"] == 6
+    scheduler.set_replicas("m", 0)
+    assert scheduler.stats()["m"]["max_inflight"] == 3
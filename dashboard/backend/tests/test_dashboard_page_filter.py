@@ -0,0 +1,41 @@
+# test_dashboard_page_filter.py
+from PIL import Image, ImageDraw
+from services.page_filter import PageFilter, page_fingerprint
+
+def blank_page():
+    return Image.new("RGB", (600, 800), "white")
+
+def text_page(lines):
+    image = blank_page()
+    draw = ImageDraw.Draw(image)
+    for i, (x, width) in enumerate(lines):
+        draw.rectangle((x, 60 + i * 40, x + width, 80 + i * 40), fill="black")
+    return image
+
+def test_blank_page_is_dropped():
+    page_filter = PageFilter()
+    assert page_filter.check(1, page_fingerprint(blank_page())) == "blank"
+    assert page_filter.report()["blank_pages"] == [1]
+
+def test_repeated_page_is_routed_to_the_first_copy():
+    page_filter = PageFilter()
+    layout = [(50, 400), (50, 300), (50, 450)] * 5
+    assert page_filter.check(1, page_fingerprint(text_page(layout))) is None
+    # Rescans differ by a few pixels
+    rescan = text_page(layout)
+    ImageDraw.Draw(rescan).point((300, 790), fill="black")
+    assert page_filter.check(2, page_fingerprint(rescan)) == "duplicate"
+    assert page_filter.report()["duplicate_pages"] == {"2": 1}
+
+def test_different_pages_are_both_extracted():
+    page_filter = PageFilter()
+    assert page_filter.check(1, page_fingerprint(text_page([(50, 400)] * 15))) is None
+    assert page_filter.check(2, page_fingerprint(text_page([(300, 250), (50, 100)] * 8))) is None
+    assert page_filter.report() == {"blank_pages": [], "duplicate_pages": {}}
+
+def test_apply_copies_text_and_reports_duplicates_of_failed_pages():
+    page_filter = PageFilter()
+    page_filter.duplicates = {3: 1, 4: 2}
+    results = {"1": "first page"}
+    assert page_filter.apply(results) == [4]
+    assert results == {"1": "first page", "3": "first page"}
@@ -0,0 +1,59 @@
+# test_dashboard_render_profiles.py
+import base64
+from io import BytesIO
+import pytest
+from PIL import Image, ImageChops, ImageDraw, features
+from constants import MODEL_RENDER_PROFILES, RENDER_PROFILES
+from services import pdf_processor
+from services.pdf_processor import render_and_encode, resolve_render_profile
+
+def letter_page(dpi, grayscale):
+    """A US letter page at the given DPI with a printed block inside one-inch margins."""
+    image = Image.new("L" if grayscale else "RGB", (int(8.5 * dpi), int(11 * dpi)), "white")
+    draw = ImageDraw.Draw(image)
+    for top in range(dpi, 10 * dpi, dpi // 4):
+        draw.rectangle((dpi, top, int(7.5 * dpi), top + dpi // 10), fill="black")
+    return image
+
+@pytest.fixture(autouse=True)
+def fake_poppler(monkeypatch):
+    def convert_from_path(pdf_path, dpi, grayscale, first_page, last_page):
+        return [letter_page(dpi, grayscale) for _ in range(first_page, last_page + 1)]
+
+    monkeypatch.setattr(pdf_processor, "convert_from_path", convert_from_path)
+
+def rendered(profile_name):
+    [page] = render_and_encode("doc.pdf", [1], RENDER_PROFILES[profile_name]).values()
+    header, data = page["image_url"].split(",", 1)
+    image = Image.open(BytesIO(base64.b64decode(data)))
+    return page, header, image
+
+def test_fidelity_matches_the_pre_profile_rendering():
+    page, header, image = rendered("fidelity")
+    assert header == "data:image/jpeg;base64"
+    assert (image.format, image.mode, image.size) == ("JPEG", "RGB", (1700, 2200))
+    assert (page["width"], page["height"]) == (1700, 2200)
+
+def test_standard_crops_the_margins():
+    page, header, image = rendered("standard")
+    assert header == "data:image/jpeg;base64"
+    assert (image.format, image.mode, image.size) == ("JPEG", "RGB", (1008, 1380))
+
+def test_compact_is_grayscale_capped_and_smallest():
+    page, header, image = rendered("compact")
+    image_format = "WEBP" if features.check("webp") else "JPEG"
+    assert header == f"data:image/{image_format.lower()};base64"
+    assert (image.format, image.size) == (image_format, (760, 1024))
+    if image.mode == "RGB":
+        # WebP has no grayscale mode; a gray page decodes with (near) equal channels
+        red, green, blue = image.split()
+        assert ImageChops.difference(red, green).getextrema()[1] <= 2
+        assert ImageChops.difference(red, blue).getextrema()[1] <= 2
+    else:
+        assert image.mode == "L"
+    assert page["bytes"] < rendered("standard")[0]["bytes"] < rendered("fidelity")[0]["bytes"]
+
+def test_models_default_to_the_pre_profile_rendering():
+    assert set(MODEL_RENDER_PROFILES.values()) == {"fidelity"}
+    assert resolve_render_profile("gemma3") == "fidelity"
+    assert resolve_render_profile("gemma3", "compact") == "compact"
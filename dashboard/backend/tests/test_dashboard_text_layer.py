@@ -0,0 +1,105 @@
+# test_dashboard_text_layer.py
+import asyncio
+from types import SimpleNamespace
+import pytest
+from services import pdf_processor
+from services.pdf_processor import ExtractionProgress, extract_uncached, find_scanned_pages, has_usable_text
+
+born_digital_text = "Quarterly report. Revenue grew 12 percent to 4.2 million on higher subscription sales.\n"
+ocr_text = "Invoice 2024-117. Total due 1,250.00 EUR within 30 days of the invoice date, thank you.\n"
+
+image_list_header = (
+    "page   num  type   width height color comp bpc  enc interp  object ID x-ppi y-ppi size ratio\n"
+    "--------------------------------------------------------------------------------------------\n"
+)
+
+def image_row(page, width, height, ppi):
+    return f"   {page}     0 image    {width}  {height}  rgb     3   8  jpeg   no        {10 + page}  0   {ppi}   {ppi}  200K  3.1%\n"
+
+letter_pages = "".join(f"Page    {page} size: 612 x 792 pts (letter)\nPage    {page} rot:  0\n" for page in (1, 2, 3))
+
+# Page 1 is born-digital with a small logo, page 2 a scan with an OCR layer, page 3 a scan without one
+poppler_output = {
+    "pdftotext": f"{born_digital_text}\f{ocr_text}\f\f".encode(),
+    "pdfimages": (image_list_header + image_row(1, 300, 100, 300) + image_row(2, 2550, 3300, 300) + image_row(3, 1275, 1650, 150)).encode(),
+    "pdfinfo": letter_pages.encode()
+}
+
+class FakeProcess:
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.returncode = 0
+
+    async def communicate(self):
+        return self.stdout, b""
+
+@pytest.fixture
+def poppler(monkeypatch):
+    """Poppler's command-line tools, which are not installed where the tests run."""
+    calls = []
+    output = dict(poppler_output)
+
+    async def create_subprocess_exec(program, *args, stdout=None, stderr=None):
+        calls.append(program)
+        if program not in output:
+            raise FileNotFoundError(f"No such file or directory: '{program}'")
+        return FakeProcess(output[program])
+
+    monkeypatch.setattr(pdf_processor.asyncio, "create_subprocess_exec", create_subprocess_exec)
+    return output
+
+@pytest.fixture
+def vision(monkeypatch):
+    """Stands in for rendering and the model, recording which pages were sent to it."""
+    sent = []
+
+    class InlinePool:
+        async def run(self, fn, *args):
+            return fn(*args)
+
+    async def extract_vision_pages(client, model, pdf_path, vision_pages, profile, progress):
+        sent.extend(vision_pages)
+        results = {str(page): f"vision text of page {page}" for page in vision_pages}
+        info = {"blank_pages": [], "duplicate_pages": {}, "batch_plan": [], "recovery": {}, "bytes_per_page": {}}
+        return results, [], info
+
+    monkeypatch.setattr(pdf_processor, "render_pool", InlinePool())
+    monkeypatch.setattr(pdf_processor, "pdfinfo_from_path", lambda pdf_path: {"Pages": 3})
+    monkeypatch.setattr(pdf_processor, "extract_vision_pages", extract_vision_pages)
+    monkeypatch.setattr(pdf_processor, "TEXT_LAYER_ENABLED", True)
+    monkeypatch.setattr(pdf_processor, "extraction_cache", SimpleNamespace(set=lambda *entry: None))
+    return sent
+
+def extract():
+    document = SimpleNamespace(path="doc.pdf")
+    return asyncio.run(extract_uncached(None, document, "doc.pdf", "gemma3", "standard", "cache-key", ExtractionProgress()))
+
+def test_pages_drawn_as_one_large_image_are_scans(poppler):
+    assert asyncio.run(find_scanned_pages("doc.pdf", 3)) == {2, 3}
+
+def test_ocr_layer_of_a_scan_passes_the_text_checks():
+    # Which is why the text checks alone cannot tell a scan from a born-digital page
+    assert has_usable_text(born_digital_text)
+    assert has_usable_text(ocr_text)
+    assert not has_usable_text("")
+    assert not has_usable_text("~~ ## ~~ ## ~~ ## ~~ ## ~~ ## ~~ ## ~~ ## ~~ ## ~~ ##")
+
+def test_only_born_digital_pages_skip_vision(poppler, vision):
+    results, skipped, info = extract()
+    assert results["1"] == born_digital_text.strip()
+    assert vision == [2, 3]
+    assert results["2"] == "vision text of page 2"
+    assert info["page_engines"] == {"1": "text_layer", "2": "vlm", "3": "vlm"}
+    assert skipped == []
+
+def test_without_pdftotext_every_page_goes_to_vision(poppler, vision):
+    del poppler["pdftotext"]
+    results, _, info = extract()
+    assert vision == [1, 2, 3]
+    assert set(info["page_engines"].values()) == {"vlm"}
+
+def test_without_image_information_no_text_layer_is_trusted(poppler, vision):
+    del poppler["pdfimages"]
+    _, _, info = extract()
+    assert vision == [1, 2, 3]
+    assert set(info["page_engines"].values()) == {"vlm"}
@@ -0,0 +1,106 @@
+# test_dashboard_write_behind.py
+import asyncio
+import pytest
+from services.session_store import SqliteStore, WriteBehindStore, append_turns
+
+class RecordingStore(SqliteStore):
+    """SqliteStore that records each batch it writes and can be made to fail."""
+
+    def __init__(self, db_path):
+        super().__init__(db_path, legacy_path=None)
+        self.batches = []
+        self.failures = 0
+        self.closed = False
+
+    def update_batch(self, updates):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk I/O error")
+        self.batches.append(sorted(updates))
+        super().update_batch(updates)
+
+    def close(self):
+        self.closed = True
+        super().close()
+
+@pytest.fixture
+def store(tmp_path):
+    store = RecordingStore(tmp_path / "sessions.db")
+    yield store
+    store.close()
+
+def history(session):
+    return [message["content"] for message in session["chatHistory"]]
+
+def test_updates_before_start_are_written_through(store):
+    sessions = WriteBehindStore(store, interval=60)
+    sessions.update("sessions.a", append_turns({"content": "q"}))
+    assert history(store.get("sessions.a")) == ["q"]
+
+def test_updates_are_coalesced_and_visible_before_they_are_written(store):
+    store.set("sessions.a", {"chatHistory": [{"content": "earlier"}]})
+    store.batches.clear()
+
+    async def main():
+        sessions = WriteBehindStore(store, interval=60, max_batch=100)
+        sessions.start()
+        for turn in ["q1", "a1", "q2"]:
+            sessions.update("sessions.a", append_turns({"content": turn}))
+        sessions.update("sessions.b", append_turns({"content": "other"}))
+        assert history(await sessions.get("sessions.a")) == ["earlier", "q1", "a1", "q2"]
+        assert await sessions.get("sessions.missing", "default") == "default"
+        assert store.batches == []
+        # Another worker writes meanwhile; its turn is kept
+        store.update_batch({"sessions.a": [append_turns({"content": "elsewhere"})]})
+        assert await sessions.flush() == 2
+        stats = sessions.stats()
+        assert (stats["flushes"], stats["flushed_entries"], stats["coalesced"], stats["pending"]) == (1, 2, 2, 0)
+        await sessions.stop()
+
+    asyncio.run(main())
+    assert store.batches == [["sessions.a"], ["sessions.a", "sessions.b"]]
+    assert history(store.get("sessions.a")) == ["earlier", "elsewhere", "q1", "a1", "q2"]
+
+def test_full_batch_is_written_without_waiting_for_the_interval(store):
+    async def main():
+        sessions = WriteBehindStore(store, interval=60, max_batch=2)
+        sessions.start()
+        sessions.update("sessions.a", append_turns({"content": "a"}))
+        sessions.update("sessions.b", append_turns({"content": "b"}))
+        for _ in range(100):
+            if store.batches:
+                break
+            await asyncio.sleep(0.01)
+        assert store.batches == [["sessions.a", "sessions.b"]]
+        await sessions.stop()
+
+    asyncio.run(main())
+
+def test_failed_batch_is_retried_ahead_of_newer_updates(store):
+    async def main():
+        sessions = WriteBehindStore(store, interval=60)
+        sessions.start()
+        sessions.update("sessions.a", append_turns({"content": "q1"}))
+        store.failures = 1
+        assert await sessions.flush() == 0
+        assert sessions.stats()["failures"] == 1
+        sessions.update("sessions.a", append_turns({"content": "q2"}))
+        assert history(await sessions.get("sessions.a")) == ["q1", "q2"]
+        assert await sessions.flush() == 1
+        await sessions.stop()
+
+    asyncio.run(main())
+    assert history(store.get("sessions.a")) == ["q1", "q2"]
+
+def test_stop_writes_pending_updates_and_closes_the_store(store):
+    async def main():
+        sessions = WriteBehindStore(store, interval=60)
+        sessions.start()
+        sessions.update("sessions.a", append_turns({"content": "last words"}))
+        await sessions.stop()
+        return sessions
+
+    sessions = asyncio.run(main())
+    assert store.closed
+    assert sessions.task is None
+    assert history(store.get("sessions.a")) == ["last words"]
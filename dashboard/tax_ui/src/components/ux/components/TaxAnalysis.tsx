@@ -109,7 +109,7 @@ export default function TaxAnalysisChat() {
   const [files, setFiles] = useState([]);
   const [sessionId, setSessionId] = useState(`session_${Date.now()}`);
   const [language, setLanguage] = useState('English');
-  const [extractedText, setExtractedText] = useState('');
+  const [documentIds, setDocumentIds] = useState([]);
   const [systemPrompt, setSystemPrompt] = useState(DEFAULT_SYSTEM_PROMPT);
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState('');
@@ -134,12 +134,12 @@ export default function TaxAnalysisChat() {
     return true;
   };
 
-  // Extract texts from files
+  // Extract texts from files; the server keeps the text and returns its document ID
   const extractTexts = async (fileList) => {
     const validFiles = Array.from(fileList).filter(validateFile);
     if (validFiles.length === 0) {
       setError('No valid files to process.');
-      return '';
+      return [];
     }
 
     const formData = new FormData();
@@ -158,10 +158,10 @@ export default function TaxAnalysisChat() {
       });
       if (!response.ok) throw new Error(`HTTP ${response.status}`);
       const result = await response.json();
-      return JSON.stringify(result.extracted_text || {});
+      return result.documentId ? [result.documentId] : [];
     } catch (err) {
       setError(`Extraction failed: ${err.message}`);
-      return '';
+      return [];
     }
   };
 
@@ -171,7 +171,7 @@ export default function TaxAnalysisChat() {
       setError('Please enter a valid question!');
       return;
     }
-    if (!files.length && !extractedText) {
+    if (!files.length && !documentIds.length) {
       setError('Please upload at least one document first!');
       return;
     }
@@ -179,32 +179,37 @@ export default function TaxAnalysisChat() {
     setIsLoading(true);
     setError('');
 
-    let textForApi = extractedText;
+    let idsForApi = documentIds;
     let newSessionId = sessionId;
 
     // Extract if not done
-    if (!extractedText && files.length > 0) {
-      const extractedJson = await extractTexts(files);
-      if (!extractedJson || extractedJson === '{}') {
+    if (!documentIds.length && files.length > 0) {
+      const extractedIds = await extractTexts(files);
+      if (!extractedIds.length) {
         setError('No text could be extracted from the provided documents!');
         setIsLoading(false);
         return;
       }
-      textForApi = extractedJson;
-      setExtractedText(extractedJson);
+      idsForApi = extractedIds;
+      setDocumentIds(extractedIds);
     }
 
     try {
+      // Follow-up questions refer to the extracted text by ID instead of uploading it again
+      const formData = new FormData();
+      formData.append('prompt', `Answer in ${language}: ${message}`);
+      idsForApi.forEach((id) => formData.append('documentId', id));
+      formData.append('sessionId', newSessionId);
+      formData.append('system_prompt', systemPrompt);
       const response = await fetch(API_URL_MESSAGE, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          prompt: `Answer in ${language}: ${message}`,
-          extracted_text: textForApi,
-          sessionId: newSessionId,
-          system_prompt: systemPrompt,
-        }),
+        body: formData,
       });
+      if (response.status === 404) {
+        // The server evicted the documents; the next question extracts them again
+        setDocumentIds([]);
+        throw new Error('The documents expired on the server. Please ask again to re-process them.');
+      }
       if (!response.ok) throw new Error(`HTTP ${response.status}`);
       const result = await response.json();
 
@@ -234,7 +239,7 @@ export default function TaxAnalysisChat() {
   const newChat = () => {
     setHistory([]);
     setFiles([]);
-    setExtractedText('');
+    setDocumentIds([]);
     setSessionId(`session_${Date.now()}`);
     setMessage('');
     setError('');
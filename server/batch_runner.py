@@ -0,0 +1,261 @@
+# batch_runner.py
+"""Run JSONL files of process_file / process_message requests through the pipeline in-process.
+
+Each input line is one request, with the same fields as the HTTP form:
+
+    {"id": "r1", "endpoint": "process_file", "file": "docs/a.pdf", "prompt": "...", "model": "gemma3",
+     "is_extraction": false, "render_profile": null, "system_prompt": "...", "sessionId": null, "timestamp": 1718000000.0}
+    {"id": "r2", "endpoint": "process_message", "prompt": "...", "extracted_text": "...", "model": "gemma3"}
+    {"id": "r3", "endpoint": "process_message", "prompt": "...", "documentId": ["<documentId>"], "model": "gemma3"}
+
+Relative file paths resolve against the directory of the JSONL file. Each output line has the
+request id, status, per-stage timings in seconds and, unless --timings-only, the response body.
+With --replay, requests start at their recorded timestamp offsets (scaled by --speed) to
+reproduce production arrival rates; requests without a timestamp start at once.
+
+Usage: python -m server.batch_runner requests.jsonl [more.jsonl ...] -o results.jsonl --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from uuid import uuid4
+import logging
+from fastapi import HTTPException
+from server.constants import default_system_prompt
+from server.services.ai_client import client_registry, get_openai_client
+from server.services.render_pool import render_pool
+from server.services.pdf_processor import extract_document, resolve_render_profile
+from server.services.ingestion import stage_file
+from server.services.llm_scheduler import llm_flow
+from server.services.document_registry import document_registry
+from server.services.session_store import session_store
+from server.main import answer_prompt, process_message
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = ("process_file", "process_message")
+
+class StageTimer:
+    """Wall-clock seconds spent in each stage of one request."""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.monotonic() - start_time, 3)
+
+def load_requests(paths):
+    """Requests from every JSONL file, in file order; malformed lines become requests that fail."""
+    requests = []
+    for path in paths:
+        base_dir = os.path.dirname(os.path.abspath(path))
+        with open(path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                location = f"{os.path.basename(path)}:{line_number}"
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("expected a JSON object")
+                except ValueError as e:
+                    request = {"invalid": f"Malformed request at {location}: {str(e)}"}
+                request.setdefault("id", location)
+                request["base_dir"] = base_dir
+                requests.append(request)
+    return requests
+
+def read_text_file(path):
+    with open(path, "rb") as f:
+        content = f.read()
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        return content.decode('latin-1', errors='ignore')
+
+async def run_process_file(request, timer):
+    """The /process_file pipeline over a local file, timing staging, extraction and answering."""
+    prompt = request.get("prompt", "")
+    model = request.get("model", "gemma3")
+    render_profile = request.get("render_profile")
+    if not request.get("file"):
+        raise HTTPException(status_code=400, detail="Please upload a file")
+    if not prompt.strip():
+        raise HTTPException(status_code=400, detail="Please provide a non-empty prompt")
+    try:
+        client = get_openai_client(model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    path = os.path.join(request["base_dir"], request["file"])
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=400, detail=f"File {request['file']} not found")
+    filename = os.path.basename(path).lower()
+    skipped_pages = []
+    extraction_info = {}
+    if filename.endswith(".pdf"):
+        profile_name = resolve_render_profile(model, render_profile)
+        with timer.stage("stage"):
+            document = await stage_file(path)
+        with document:
+            with timer.stage("extract"):
+                all_results, skipped_pages, extraction_info = await extract_document(client, model, document, profile_name, filename)
+        if not all_results and skipped_pages:
+            raise HTTPException(status_code=400, detail="No valid text extracted from any pages")
+    else:
+        # Non-PDF files (XML, CSV, JSON) are passed on as text
+        with timer.stage("read"):
+            all_results = await asyncio.to_thread(read_text_file, path)
+
+    session_id = request.get("sessionId") or f"session_{int(time.time())}_{str(uuid4())}"
+    if request.get("is_extraction"):
+        return {
+            "extracted_text": all_results,
+            "skipped_pages": skipped_pages,
+            **extraction_info,
+            "documentId": (await asyncio.to_thread(document_registry.register, all_results, filename)).id,
+            "sessionId": session_id
+        }
+    with timer.stage("answer"):
+        return await answer_prompt(
+            client, model, prompt, request.get("system_prompt", default_system_prompt), session_id, all_results, skipped_pages, extraction_info, filename
+        )
+
+async def run_process_message(request, timer):
+    """The /process_message endpoint, called directly."""
+    document_ids = request.get("documentId")
+    with timer.stage("answer"):
+        return await process_message(
+            prompt=request.get("prompt", ""),
+            extracted_text=request.get("extracted_text", ""),
+            documentId=[document_ids] if isinstance(document_ids, str) else document_ids,
+            sessionId=request.get("sessionId"),
+            model=request.get("model", "gemma3"),
+            system_prompt=request.get("system_prompt", default_system_prompt),
+            stream=False
+        )
+
+async def run_request(request, timer):
+    if "invalid" in request:
+        raise HTTPException(status_code=400, detail=request["invalid"])
+    endpoint = request.get("endpoint", "process_file" if "file" in request else "process_message")
+    if endpoint == "process_file":
+        return await run_process_file(request, timer)
+    if endpoint == "process_message":
+        return await run_process_message(request, timer)
+    raise HTTPException(status_code=400, detail=f"Unknown endpoint {endpoint}; expected one of {', '.join(ENDPOINTS)}")
+
+class BatchRunner:
+    """Runs requests with bounded concurrency, writing one JSONL result line as each finishes."""
+
+    def __init__(self, output, concurrency, replay=False, speed=1.0, timings_only=False):
+        self.output = output
+        self.concurrency = concurrency
+        self.replay = replay
+        self.speed = speed
+        self.timings_only = timings_only
+        self.results = []
+        self.started = time.monotonic()
+
+    async def run(self, requests):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        timestamps = [request["timestamp"] for request in requests if isinstance(request.get("timestamp"), (int, float))]
+        first_timestamp = min(timestamps) if timestamps else None
+        self.started = time.monotonic()
+        await asyncio.gather(*(self.run_one(request, semaphore, first_timestamp) for request in requests))
+        return self.results
+
+    async def run_one(self, request, semaphore, first_timestamp):
+        if self.replay and first_timestamp is not None and isinstance(request.get("timestamp"), (int, float)):
+            # Hold the request back until its recorded arrival time, relative to the first request
+            offset = (request["timestamp"] - first_timestamp) / self.speed
+            await asyncio.sleep(max(0.0, offset - (time.monotonic() - self.started)))
+        timer = StageTimer()
+        arrived = time.monotonic()
+        async with semaphore:
+            timer.timings["queue"] = round(time.monotonic() - arrived, 3)
+            # Each request is its own flow in the LLM scheduler's fair queue, as over HTTP
+            llm_flow.set(str(uuid4()))
+            result = {"id": request["id"], "endpoint": request.get("endpoint")}
+            try:
+                with timer.stage("total"):
+                    body = await run_request(request, timer)
+                result.update(status="ok", status_code=200)
+                if not self.timings_only:
+                    result["response"] = body
+            except HTTPException as e:
+                result.update(status="error", status_code=e.status_code, error=e.detail)
+            except Exception as e:
+                logger.error(f"Batch request {request['id']} failed: {str(e)}")
+                result.update(status="error", status_code=500, error=str(e))
+        result["timings"] = timer.timings
+        self.results.append(result)
+        self.output.write(json.dumps(result) + "\n")
+        self.output.flush()
+
+    def summary(self):
+        """Throughput and latency percentiles per stage, for capacity planning."""
+        elapsed = time.monotonic() - self.started
+        stages = {}
+        for result in self.results:
+            for stage, seconds in result["timings"].items():
+                stages.setdefault(stage, []).append(seconds)
+        percentiles = {}
+        for stage, values in stages.items():
+            values.sort()
+            percentiles[stage] = {
+                f"p{p}": values[min(len(values) - 1, int(len(values) * p / 100))] for p in (50, 95, 99)
+            }
+        return {
+            "requests": len(self.results),
+            "ok": sum(1 for result in self.results if result["status"] == "ok"),
+            "errors": sum(1 for result in self.results if result["status"] != "ok"),
+            "elapsed": round(elapsed, 3),
+            "requests_per_second": round(len(self.results) / elapsed, 3) if elapsed else None,
+            "stages": percentiles
+        }
+
+async def run_batch(runner, requests):
+    render_pool.start()
+    client_registry.start()
+    session_store.start()
+    try:
+        await runner.run(requests)
+    finally:
+        await session_store.stop()
+        render_pool.stop()
+        await client_registry.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run JSONL request logs through the pipeline without HTTP")
+    parser.add_argument("inputs", nargs="+", help="JSONL files of process_file / process_message requests")
+    parser.add_argument("-o", "--output", default="-", help="JSONL results file, - for stdout (default)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at once (default 4)")
+    parser.add_argument("--replay", action="store_true", help="Start requests at their recorded timestamp offsets")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed-up factor, e.g. 10 replays an hour in 6 minutes")
+    parser.add_argument("--timings-only", action="store_true", help="Leave response bodies out of the results")
+    args = parser.parse_args()
+    if args.concurrency < 1 or args.speed <= 0:
+        parser.error("--concurrency must be at least 1 and --speed positive")
+
+    requests = load_requests(args.inputs)
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        runner = BatchRunner(output, args.concurrency, args.replay, args.speed, args.timings_only)
+        asyncio.run(run_batch(runner, requests))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    logger.info(f"Batch summary: {json.dumps(runner.summary())}")
+
+if __name__ == "__main__":
+    main()
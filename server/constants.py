@@ -0,0 +1,80 @@
+# constants.py
+import os
+
+master_prompt =  ""
+default_system_prompt = "1. CORE IDENTITY & PERSONA\n\nYou are \"Juris-Diction(AI)ry\", a highly specialized AI assistant designed for tax professionals. Your name is a fusion of \"Jurisdiction,\" \"Dictionary,\" and \"AI,\" reflecting your core capability: to interpret the language of tax law and apply it to specific corporate contexts.\n\nYour persona is that of a precise, analytical, and reliable partner for tax advisors. You are a powerful analytical tool, not a human tax advisor. Your tone is professional, objective, and always supportive. You avoid speculation and base your conclusions strictly on the data provided.\n\n2. PRIMARY OBJECTIVE\n\nYour primary objective is to analyze and cross-reference two types of structured data:\n\nCountry Profiles (Landesprofile): XML or JSON files containing structured information on tax laws, regulations, and recent legal changes, derived from news articles and legal documents.\n\nCompany Profiles (Unternehmensprofile): XML or JSON files containing specific data points about a company relevant for tax assessment (e.g., industry, revenue, number of employees, corporate structure, digital services offered, etc.).\n\nBased on this cross-referencing, your goal is to perform a logical subsumption (Anwendung eines Gesetzes auf einen Sachverhalt) and determine the legal consequence: Is a specific company affected by a new tax regulation?\n\n3. KEY CAPABILITIES & FUNCTIONS\n\nDocument Interpretation: You can read, understand, and extract key information from tax-related documents, news articles, and legal texts. You identify critical criteria such as deadlines, thresholds (e.g., revenue limits), target industries, and specific obligations.\n\nStructured Data Analysis: You can parse and logically interpret the content of XML and JSON-based Country and Company Profiles.\n\nLogical Subsumption: This is your core task. You follow a strict, step-by-step reasoning process:\n\nIdentify the Rule (Obersatz): Clearly state the requirement from the Country Profile (e.g., \"Companies in the digital services sector with an annual revenue over €750 million must file a new digital tax report.\").\n\nAnalyze the Facts (Sachverhalt): Extract the relevant data points from the Company Profile (e.g., \"Company X operates in 'digital services' and has a revenue of €800 million.\").\n\nApply Rule to Facts (Subsumption): Compare the facts with the rule's criteria (e.g., \"Company X meets both the industry criterion and the revenue threshold.\").\n\nConclude the Legal Consequence (Rechtsfolge): State the logical outcome clearly (e.g., \"Therefore, Company X is affected by the new digital tax regulation and is required to file the new report.\").\n\nOutput Generation: You present your findings in a clear, structured, and easily digestible format for the user (the tax professional).\n\n4. CONSTRAINTS & CRITICAL SAFEGUARDS (MANDATORY RULES)\n\nSTRICT DATA BASIS: Your conclusions must be based exclusively on the information provided in the Country and Company Profiles. If a crucial piece of information is missing for a criterion, you must state this explicitly.\n\nExample for Missing Data: \"Eine endgültige Beurteilung ist nicht möglich, da im Unternehmensprofil die Angabe zum Jahresumsatz für das Kriterium X fehlt.\"\n\nCITE YOUR SOURCES: When referencing a new regulation, always mention the source or the specific rule from the Country Profile you are applying.\n\nCONFIDENTIALITY: You will treat all provided company and user data as strictly confidential and will not share it outside the current session.\n\nOBJECTIVITY: Remain neutral and objective. Avoid any language that could be interpreted as a personal opinion or recommendation.\n\n5. INTERACTION STYLE & OUTPUT FORMAT\n\nWhen a user asks you to analyze a case, structure your response as follows to ensure clarity and professional utility:\n\nAnalyse-Anfrage für: [Unternehmensname]\nGeprüfte Rechtsnorm: [Name der Verordnung/des Gesetzes aus dem Landesprofil]\n\n1. Zusammenfassung der Rechtsnorm:\n[Gib hier in 1-2 Sätzen die Kernaussage der neuen steuerlichen Anforderung wieder.]\n\n2. Relevante Kriterien der Norm:\n\nKriterium A: [z.B. Unternehmenssektor: Digitale Dienstleistungen]\n\nKriterium B: [z.B. Umsatzgrenze: > €750 Mio. jährlich]\n\nKriterium C: [z.B. Mitarbeiterzahl: > 250]\n\nFrist: [z.B. 31.12.2025]\n\n3. Abgleich mit dem Unternehmensprofil:\n\nKriterium A (Sektor): Erfüllt. (Grund: Profil gibt 'Digitale Dienstleistungen' an.)\n\nKriterium B (Umsatz): Erfüllt. (Grund: Profil gibt '€800 Mio.' an.)\n\nKriterium C (Mitarbeiter): Nicht erfüllt. (Grund: Profil gibt '150 Mitarbeiter' an.)\n\n4. Ergebnis (Rechtsfolge):\n[Formuliere hier das klare Ergebnis. Zum Beispiel:]\n\"Basierend auf der Analyse ist das Unternehmen nicht von der neuen Anforderung betroffen, da das Kriterium der Mitarbeiterzahl nicht erfüllt ist.\"\noder\n\"Basierend auf der Analyse ist das Unternehmen betroffen von der neuen Anforderung, da alle relevanten Kriterien erfüllt sind. Die resultierende Pflicht ist [kurze Beschreibung der Pflicht], welche bis zum [Datum] zu erfüllen ist.\""
+
+extraction_cache_dir = os.getenv('EXTRACTION_CACHE_DIR', "extraction_cache")
+extraction_cache_max_bytes = int(os.getenv('EXTRACTION_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+extraction_prompt_version = os.getenv('EXTRACTION_PROMPT_VERSION', "2")  # Bump when the page extraction prompt changes
+document_registry_dir = os.getenv('DOCUMENT_REGISTRY_DIR', "documents")  # Extraction results chat turns refer to by documentId
+document_registry_max_bytes = int(os.getenv('DOCUMENT_REGISTRY_MAX_BYTES', str(1024 * 1024 * 1024)))  # LRU eviction above this size
+document_memory_entries = int(os.getenv('DOCUMENT_MEMORY_ENTRIES', "32"))  # Recently used documents kept parsed in memory per process
+text_layer_enabled = os.getenv('TEXT_LAYER_ENABLED', "true").lower() == "true"  # Use the PDF text layer before vision extraction
+text_layer_min_chars = int(os.getenv('TEXT_LAYER_MIN_CHARS', "40"))  # Fewer non-whitespace chars means a scanned/image page
+text_layer_min_alnum_ratio = float(os.getenv('TEXT_LAYER_MIN_ALNUM_RATIO', "0.5"))  # Below this the text layer is treated as junk
+text_layer_scan_min_coverage = float(os.getenv('TEXT_LAYER_SCAN_MIN_COVERAGE', "0.5"))  # A page this much covered by one image is a scan; its text layer is OCR output
+render_window_pages = int(os.getenv('RENDER_WINDOW_PAGES', "20"))  # Max rendered pages held in memory per document
+# Every uvicorn worker has its own render pool, so by default the cores are split between the WEB_CONCURRENCY workers
+render_pool_workers = int(os.getenv('RENDER_POOL_WORKERS', str(max(1, (os.cpu_count() or 1) // int(os.getenv('WEB_CONCURRENCY', "1"))))))  # Processes for PDF rendering and JPEG/base64 encoding per uvicorn worker
+llm_max_inflight = int(os.getenv('LLM_MAX_INFLIGHT', "8"))  # Concurrent LLM calls per healthy replica of a model backend
+llm_max_queue = int(os.getenv('LLM_MAX_QUEUE', "200"))  # Queued LLM calls per backend before new requests get 429
+llm_http_max_connections = int(os.getenv('LLM_HTTP_MAX_CONNECTIONS', "32"))  # Connection pool size per model backend
+llm_http_max_keepalive = int(os.getenv('LLM_HTTP_MAX_KEEPALIVE', "16"))  # Idle connections kept open per model backend
+llm_http_keepalive_expiry = float(os.getenv('LLM_HTTP_KEEPALIVE_EXPIRY', "120"))  # Seconds before an idle connection is closed
+llm_max_model_len = int(os.getenv('LLM_MAX_MODEL_LEN', "8192"))  # Context window of the served models (vLLM --max-model-len)
+llm_max_output_tokens = int(os.getenv('LLM_MAX_OUTPUT_TOKENS', "4096"))  # Upper bound on max_tokens for one extraction call
+max_pages_per_batch = int(os.getenv('MAX_PAGES_PER_BATCH', "8"))  # Hard cap on pages packed into one extraction call
+output_tokens_per_full_page = int(os.getenv('OUTPUT_TOKENS_PER_FULL_PAGE', "1000"))  # Expected output tokens for a densely printed page
+scratch_dir = os.getenv('SCRATCH_DIR') or ("/dev/shm" if os.access("/dev/shm", os.W_OK) else None)  # Per-request upload staging; tmpfs keeps rendering off disk
+ingest_chunk_bytes = int(os.getenv('INGEST_CHUNK_BYTES', str(1024 * 1024)))  # Read size when streaming uploads into scratch space
+render_profiles = {  # Named page rendering settings; max_long_edge None keeps the rendered size
+    "fidelity": {"dpi": 200, "grayscale": False, "max_long_edge": None, "autocrop": False, "format": "JPEG", "quality": 85},  # The pre-profile rendering
+    "standard": {"dpi": 150, "grayscale": False, "max_long_edge": 1600, "autocrop": True, "format": "JPEG", "quality": 85},
+    "compact": {"dpi": 120, "grayscale": True, "max_long_edge": 1024, "autocrop": True, "format": "WEBP", "quality": 75}
+}
+default_render_profile = os.getenv('DEFAULT_RENDER_PROFILE', "fidelity")  # Used when neither the request nor the model picks one; smaller profiles are opt-in
+model_render_profiles = {  # Per-model default render profile
+    "gemma3": os.getenv('GEMMA3_RENDER_PROFILE', default_render_profile),  # "compact" suits it: SigLIP downsamples to 896x896 anyway
+    "gpt-oss": os.getenv('GPT_OSS_RENDER_PROFILE', default_render_profile)
+}
+blank_page_max_stddev = float(os.getenv('BLANK_PAGE_MAX_STDDEV', "2.0"))  # Grayscale pixel std-dev at or below which a page is blank
+duplicate_page_max_hamming = int(os.getenv('DUPLICATE_PAGE_MAX_HAMMING', "16"))  # Max differing bits of the 256-bit page hash
+duplicate_page_max_pixel_diff = float(os.getenv('DUPLICATE_PAGE_MAX_PIXEL_DIFF', "2.0"))  # Max mean 64x64 thumbnail difference for duplicates
+job_workers = int(os.getenv('JOB_WORKERS', "2"))  # Background extraction jobs run at once per process
+job_max_queued = int(os.getenv('JOB_MAX_QUEUED', "100"))  # Waiting jobs before POST /jobs answers 429
+job_retention_seconds = int(os.getenv('JOB_RETENTION_SECONDS', "3600"))  # Finished jobs stay readable this long
+job_publish_interval = float(os.getenv('JOB_PUBLISH_INTERVAL', "1.0"))  # Seconds between progress writes of running jobs to the shared session store
+model_image_tokens = {  # Vision encoder cost per model: pixels per patch and the per-image token cap
+    "gemma3": {"patch_pixels": 28, "max_tokens": 256},
+    "gpt-oss": {"patch_pixels": 28, "max_tokens": 16384}
+}
+llm_retry_max_attempts = int(os.getenv('LLM_RETRY_MAX_ATTEMPTS', "4"))  # Tries per extraction call on transport errors (connection, timeout, 429, 5xx)
+llm_retry_base_delay = float(os.getenv('LLM_RETRY_BASE_DELAY', "0.5"))  # Seconds; backoff ceiling doubles per attempt, actual delay is jittered below it
+llm_retry_max_delay = float(os.getenv('LLM_RETRY_MAX_DELAY', "8"))  # Cap on a single backoff delay
+retry_budget_per_page = float(os.getenv('RETRY_BUDGET_PER_PAGE', "0.75"))  # Extra extraction calls a document may spend on recovery, per vision page
+retry_budget_min_calls = int(os.getenv('RETRY_BUDGET_MIN_CALLS', "8"))  # Floor of the recovery budget for short documents
+guided_decoding_enabled = os.getenv('GUIDED_DECODING_ENABLED', "true").lower() == "true"  # Send a JSON schema of the expected page keys with extraction calls
+pool_probe_interval = float(os.getenv('POOL_PROBE_INTERVAL', "10"))  # Seconds between health probes of each replica
+pool_probe_timeout = float(os.getenv('POOL_PROBE_TIMEOUT', "3"))  # A probe slower than this counts as a failure
+pool_eject_after_failures = int(os.getenv('POOL_EJECT_AFTER_FAILURES', "3"))  # Consecutive connection/5xx errors or failed probes that eject a replica
+portfolio_max_concurrency = int(os.getenv('PORTFOLIO_MAX_CONCURRENCY', "4"))  # Pair analyses one bulk portfolio request runs at once
+portfolio_max_pairs = int(os.getenv('PORTFOLIO_MAX_PAIRS', "500"))  # Company x country pairs accepted per bulk request
+portfolio_max_profile_bytes = int(os.getenv('PORTFOLIO_MAX_PROFILE_BYTES', str(64 * 1024)))  # Larger profiles would not fit the model context in pairs
+session_backend = os.getenv('SESSION_BACKEND', "sqlite")  # sqlite (workers on one host), redis (workers on any node), or json for the legacy single-process store
+session_file = os.getenv('SESSION_FILE', "sessions.json")  # Legacy JSON session store; migrated into session_db on first use
+session_db = os.getenv('SESSION_DB', "sessions.db")  # SQLite session database
+session_ttl_seconds = int(os.getenv('SESSION_TTL_SECONDS', str(7 * 24 * 3600)))  # Sessions idle longer than this are evicted; 0 keeps them forever
+session_max_count = int(os.getenv('SESSION_MAX_COUNT', "100000"))  # Least recently used sessions beyond this are evicted; 0 for no limit
+session_sweep_interval = float(os.getenv('SESSION_SWEEP_INTERVAL', "300"))  # Seconds between session eviction sweeps
+session_flush_interval = float(os.getenv('SESSION_FLUSH_INTERVAL', "1.0"))  # Seconds between batched writes of changed sessions, the most a crash can lose; 0 writes each update at once
+session_flush_max_batch = int(os.getenv('SESSION_FLUSH_MAX_BATCH', "500"))  # Changed sessions that trigger a write before the interval is up
+session_redis_url = os.getenv('SESSION_REDIS_URL', "redis://localhost:6379/0")  # Used when SESSION_BACKEND is redis
+session_redis_prefix = os.getenv('SESSION_REDIS_PREFIX', "juris:")  # Key prefix, so several deployments can share one Redis
+
+dwani_api_base_url = os.getenv('DWANI_API_BASE_URL', "0.0.0.0")
+
+model_endpoints = {  # Comma-separated OpenAI-compatible base URLs per model; calls are spread over every replica listed
+    "gemma3": os.getenv('GEMMA3_ENDPOINTS', f"http://{dwani_api_base_url}:9000/v1"),
+    "gpt-oss": os.getenv('GPT_OSS_ENDPOINTS', f"http://{dwani_api_base_url}:9500/v1")
+}
@@ -2,63 +2,33 @@
 import logging
 import json
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
-from fastapi.responses import JSONResponse
-from openai import AsyncOpenAI
-import base64
-from io import BytesIO
-from pdf2image import convert_from_path
+from fastapi.responses import JSONResponse, StreamingResponse
 import os
 import asyncio
-import re
-from typing import List, Dict, Optional
+from typing import List
 import time
+import hashlib
 from starlette.middleware.base import BaseHTTPMiddleware
 from uuid import uuid4
-
-master_prompt =  ""
+from server.constants import default_system_prompt, portfolio_max_concurrency, portfolio_max_profile_bytes
+from server.services.session_store import append_turns, session_store, session_sweeper
+from server.services.extraction_cache import extraction_cache
+from server.services.document_registry import document_registry
+from server.services.single_flight import extraction_flights, answer_flights
+from server.services.render_pool import render_pool
+from server.services.llm_scheduler import llm_scheduler, llm_flow
+from server.services.job_manager import job_manager
+from server.services.ai_client import client_registry, get_openai_client
+from server.services.json_salvage import parse_stats
+from server.services.llm_retry import RetryBudget
+from server.services.ingestion import stage_upload
+from server.services.pdf_processor import ExtractionProgress, extract_document, resolve_render_profile
+from server.services.portfolio import portfolio_prompt, PortfolioSummary, analyze_pair, plan_pairs, read_archive, read_profile
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Simple file-based session store
-class Store:
-    def __init__(self, file_path="sessions.json"):
-        self.file_path = file_path
-        self.data = self.load()
-
-    def load(self):
-        if os.path.exists(self.file_path):
-            try:
-                with open(self.file_path, 'r') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, IOError) as e:
-                logger.error(f"Failed to load session store: {str(e)}")
-                return {}
-        return {}
-
-    def get(self, key, default=None):
-        keys = key.split('.')
-        data = self.data
-        for k in keys:
-            data = data.get(k, {})
-        return data if data != {} else default
-
-    def set(self, key, value):
-        keys = key.split('.')
-        data = self.data
-        for k in keys[:-1]:
-            data = data.setdefault(k, {})
-        data[keys[-1]] = value
-        try:
-            with open(self.file_path, 'w') as f:
-                json.dump(self.data, f, indent=2)
-        except IOError as e:
-            logger.error(f"Failed to save session store: {str(e)}")
-
-# Initialize session storage
-session_store = Store()
-
 app = FastAPI(title="Dwani Document Processing API")
 
 # Middleware to measure request processing time
@@ -73,130 +43,76 @@ class TimingMiddleware(BaseHTTPMiddleware):
 
 app.add_middleware(TimingMiddleware)
 
-dwani_api_base_url = os.getenv('DWANI_API_BASE_URL', "0.0.0.0")
-
-def encode_image(image: BytesIO) -> str:
-    """Encode image bytes to base64 string."""
-    return base64.b64encode(image.read()).decode("utf-8")
-
-def get_openai_client(model: str) -> AsyncOpenAI:
-    """Initialize AsyncOpenAI client with model-specific base_url."""
-    valid_models = ["gemma3", "gpt-oss"]
-    if model not in valid_models:
-        raise ValueError(f"Invalid model: {model}. Choose from: {', '.join(valid_models)}")
-    
-    model_ports = {
-        "gemma3": "9000",
-        "gpt-oss": "9500",
-    }
-    base_url = f"http://{dwani_api_base_url}:{model_ports[model]}/v1"
-    return AsyncOpenAI(api_key="http", base_url=base_url)
-
-def clean_response(raw_response: str) -> Optional[str]:
-    """Clean markdown code blocks or other non-JSON content from the response."""
-    if not raw_response:
-        return None
-    cleaned = re.sub(r'```(?:json)?\s*([\s\S]*?)\s*```', r'\1', raw_response)
-    return cleaned.strip()
-
-async def process_single_batch(client, model, batch_messages, page_start, page_end):
-    """Process a single batch of pages asynchronously."""
+@app.on_event("startup")
+async def startup():
+    render_pool.start()
+    client_registry.start()
+    job_manager.start()
+    session_store.start()
+    session_sweeper.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await session_sweeper.stop()
+    await job_manager.stop()
+    # After the jobs, whose answers also update sessions
+    await session_store.stop()
+    render_pool.stop()
+    await client_registry.close()
+
+async def answer_prompt(client, model, prompt, system_prompt, session_id, all_results, skipped_pages, extraction_info, filename=None):
+    """Answer the prompt over the extracted text and record the exchange in the session."""
     try:
-        response = await client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": batch_messages}],
-            temperature=0.2,
-            max_tokens=2024
-        )
-        raw_response = response.choices[0].message.content
-        logger.debug(f"Raw response for batch {page_start}-{page_end}: {raw_response}")
-
-        cleaned_response = clean_response(raw_response)
-        if not cleaned_response:
-            logger.warning(f"Empty response for batch {page_start}-{page_end}")
-            return None, list(range(page_start, page_end + 1))
-
-        try:
-            batch_results = json.loads(cleaned_response)
-            if not isinstance(batch_results, dict):
-                logger.warning(f"Response is not a JSON object for batch {page_start}-{page_end}")
-                return None, list(range(page_start, page_end + 1))
-            return batch_results, []
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parsing failed for batch {page_start}-{page_end}: {str(e)}")
-            return None, list(range(page_start, page_end + 1))
+        document = await asyncio.to_thread(document_registry.register, all_results, filename)
+        results_str = document.text
     except Exception as e:
-        logger.error(f"API request failed for batch {page_start}-{page_end}: {str(e)}")
-        return None, list(range(page_start, page_end + 1))
-
-async def process_single_page(client, model, image, page_idx):
-    """Process a single skipped page asynchronously."""
-    try:
-        image_bytes_io = BytesIO()
-        image.save(image_bytes_io, format='JPEG', quality=85)
-        image_bytes_io.seek(0)
-        image_base64 = encode_image(image_bytes_io)
-        
-        single_message = [
-            {
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-            },
-            {
-                "type": "text",
-                "text": (
-                    f"Extract plain text from this single PDF page (page number {page_idx}). "
-                    "Return the result as a valid JSON object where the key is the page number "
-                    f"({page_idx}) and the value is the extracted text. "
-                    "Ensure the response is strictly JSON-formatted and does not include markdown code blocks."
-                )
-            }
-        ]
-        
-        response = await client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": single_message}],
-            temperature=0.2,
-            max_tokens=2048
-        )
-        raw_response = response.choices[0].message.content
-        logger.debug(f"Raw response for skipped page {page_idx}: {raw_response}")
-
-        cleaned_response = clean_response(raw_response)
-        if not cleaned_response:
-            logger.warning(f"Empty response for skipped page {page_idx}")
-            return None, page_idx
+        logger.error(f"Failed to serialize all_results: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to serialize extracted text: {str(e)}")
 
-        try:
-            page_result = json.loads(cleaned_response)
-            if not isinstance(page_result, dict) or str(page_idx) not in page_result:
-                logger.warning(f"Invalid JSON for skipped page {page_idx}")
-                return None, page_idx
-            return page_result, None
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parsing failed for skipped page {page_idx}: {str(e)}")
-            return None, page_idx
-    except Exception as e:
-        logger.error(f"Failed to process skipped page {page_idx}: {str(e)}")
-        return None, page_idx
+    # Recorded together with the answer, as one update of whatever the session holds by then
+    question = {"role": "user", "content": prompt}
+
+    async def complete():
+        async with llm_scheduler.slot(model):
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": [{"type": "text", "text": f"User prompt: {prompt}\nExtracted text: {results_str}"}]}
+                ],
+                temperature=0.3,
+                max_tokens=2048
+            )
+        return response.choices[0].message.content
 
-async def render_pdf_to_png(pdf_file):
-    """Convert PDF to images."""
+    # Identical questions over identical text share one completion; each caller still records it in its own session
+    flight_key = hashlib.sha256("\0".join([model, system_prompt, prompt, results_str]).encode()).hexdigest()
     try:
-        with open("temp.pdf", "wb") as f:
-            f.write(await pdf_file.read())
-        images = convert_from_path("temp.pdf")
+        generated_response, _ = await answer_flights.run(flight_key, complete)
+        session_store.update(f"sessions.{session_id}", append_turns(question, {"role": "assistant", "content": generated_response}))
+        return {
+            "response": generated_response,
+            "extracted_text": all_results,
+            "skipped_pages": skipped_pages,
+            **extraction_info,
+            "documentId": document.id,
+            "sessionId": session_id
+        }
     except Exception as e:
-        logger.error(f"PDF conversion failed: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to convert PDF to images: {str(e)}")
-    finally:
-        if os.path.exists("temp.pdf"):
-            os.remove("temp.pdf")
+        logger.error(f"Final API request failed: {str(e)}")
+        session_store.update(f"sessions.{session_id}", append_turns(question, {"role": "assistant", "content": f"⚠️ Error processing question: {str(e)}"}))
+        raise HTTPException(status_code=500, detail=f"Final API request failed: {str(e)}")
 
-    return images
+async def read_text_upload(file):
+    """Read a non-PDF upload (XML, CSV, JSON) as text."""
+    content = await file.read()
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        return content.decode('latin-1', errors='ignore')
 
 @app.post("/process_file")
-async def process_file(file: UploadFile = File(...), prompt: str = Form(...), sessionId: str = Form(None), model: str = Form(default="gemma3"), is_extraction: bool = Form(False), system_prompt: str = Form(default="1. CORE IDENTITY & PERSONA\n\nYou are \"Juris-Diction(AI)ry\", a highly specialized AI assistant designed for tax professionals. Your name is a fusion of \"Jurisdiction,\" \"Dictionary,\" and \"AI,\" reflecting your core capability: to interpret the language of tax law and apply it to specific corporate contexts.\n\nYour persona is that of a precise, analytical, and reliable partner for tax advisors. You are a powerful analytical tool, not a human tax advisor. Your tone is professional, objective, and always supportive. You avoid speculation and base your conclusions strictly on the data provided.\n\n2. PRIMARY OBJECTIVE\n\nYour primary objective is to analyze and cross-reference two types of structured data:\n\nCountry Profiles (Landesprofile): XML or JSON files containing structured information on tax laws, regulations, and recent legal changes, derived from news articles and legal documents.\n\nCompany Profiles (Unternehmensprofile): XML or JSON files containing specific data points about a company relevant for tax assessment (e.g., industry, revenue, number of employees, corporate structure, digital services offered, etc.).\n\nBased on this cross-referencing, your goal is to perform a logical subsumption (Anwendung eines Gesetzes auf einen Sachverhalt) and determine the legal consequence: Is a specific company affected by a new tax regulation?\n\n3. KEY CAPABILITIES & FUNCTIONS\n\nDocument Interpretation: You can read, understand, and extract key information from tax-related documents, news articles, and legal texts. You identify critical criteria such as deadlines, thresholds (e.g., revenue limits), target industries, and specific obligations.\n\nStructured Data Analysis: You can parse and logically interpret the content of XML and JSON-based Country and Company Profiles.\n\nLogical Subsumption: This is your core task. You follow a strict, step-by-step reasoning process:\n\nIdentify the Rule (Obersatz): Clearly state the requirement from the Country Profile (e.g., \"Companies in the digital services sector with an annual revenue over €750 million must file a new digital tax report.\").\n\nAnalyze the Facts (Sachverhalt): Extract the relevant data points from the Company Profile (e.g., \"Company X operates in 'digital services' and has a revenue of €800 million.\").\n\nApply Rule to Facts (Subsumption): Compare the facts with the rule's criteria (e.g., \"Company X meets both the industry criterion and the revenue threshold.\").\n\nConclude the Legal Consequence (Rechtsfolge): State the logical outcome clearly (e.g., \"Therefore, Company X is affected by the new digital tax regulation and is required to file the new report.\").\n\nOutput Generation: You present your findings in a clear, structured, and easily digestible format for the user (the tax professional).\n\n4. CONSTRAINTS & CRITICAL SAFEGUARDS (MANDATORY RULES)\n\nSTRICT DATA BASIS: Your conclusions must be based exclusively on the information provided in the Country and Company Profiles. If a crucial piece of information is missing for a criterion, you must state this explicitly.\n\nExample for Missing Data: \"Eine endgültige Beurteilung ist nicht möglich, da im Unternehmensprofil die Angabe zum Jahresumsatz für das Kriterium X fehlt.\"\n\nCITE YOUR SOURCES: When referencing a new regulation, always mention the source or the specific rule from the Country Profile you are applying.\n\nCONFIDENTIALITY: You will treat all provided company and user data as strictly confidential and will not share it outside the current session.\n\nOBJECTIVITY: Remain neutral and objective. Avoid any language that could be interpreted as a personal opinion or recommendation.\n\n5. INTERACTION STYLE & OUTPUT FORMAT\n\nWhen a user asks you to analyze a case, structure your response as follows to ensure clarity and professional utility:\n\nAnalyse-Anfrage für: [Unternehmensname]\nGeprüfte Rechtsnorm: [Name der Verordnung/des Gesetzes aus dem Landesprofil]\n\n1. Zusammenfassung der Rechtsnorm:\n[Gib hier in 1-2 Sätzen die Kernaussage der neuen steuerlichen Anforderung wieder.]\n\n2. Relevante Kriterien der Norm:\n\nKriterium A: [z.B. Unternehmenssektor: Digitale Dienstleistungen]\n\nKriterium B: [z.B. Umsatzgrenze: > €750 Mio. jährlich]\n\nKriterium C: [z.B. Mitarbeiterzahl: > 250]\n\nFrist: [z.B. 31.12.2025]\n\n3. Abgleich mit dem Unternehmensprofil:\n\nKriterium A (Sektor): Erfüllt. (Grund: Profil gibt 'Digitale Dienstleistungen' an.)\n\nKriterium B (Umsatz): Erfüllt. (Grund: Profil gibt '€800 Mio.' an.)\n\nKriterium C (Mitarbeiter): Nicht erfüllt. (Grund: Profil gibt '150 Mitarbeiter' an.)\n\n4. Ergebnis (Rechtsfolge):\n[Formuliere hier das klare Ergebnis. Zum Beispiel:]\n\"Basierend auf der Analyse ist das Unternehmen nicht von der neuen Anforderung betroffen, da das Kriterium der Mitarbeiterzahl nicht erfüllt ist.\"\noder\n\"Basierend auf der Analyse ist das Unternehmen betroffen von der neuen Anforderung, da alle relevanten Kriterien erfüllt sind. Die resultierende Pflicht ist [kurze Beschreibung der Pflicht], welche bis zum [Datum] zu erfüllen ist.\"")):
+async def process_file(file: UploadFile = File(...), prompt: str = Form(...), sessionId: str = Form(None), model: str = Form(default="gemma3"), is_extraction: bool = Form(False), render_profile: str = Form(default=None), system_prompt: str = Form(default=default_system_prompt)):
     """Endpoint to process file and extract text based on prompt."""
     if not file:
         raise HTTPException(status_code=400, detail="Please upload a file")
@@ -207,6 +123,7 @@ async def process_file(file: UploadFile = File(...), prompt: str = Form(...), se
     file_ext = os.path.splitext(filename)[1]
     all_results = {}
     skipped_pages = []
+    extraction_info = {}
 
     try:
         client = get_openai_client(model)
@@ -214,86 +131,14 @@ async def process_file(file: UploadFile = File(...), prompt: str = Form(...), se
         logger.error(f"Invalid model: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+    llm_scheduler.admit(model)
+    llm_flow.set(str(uuid4()))
+
     if file_ext == '.pdf':
-        images = await render_pdf_to_png(file)
-        num_pages = len(images)
-        batch_size = 5
-
-        batch_tasks = []
-        for batch_start_idx in range(0, num_pages, batch_size):
-            batch_end_idx = min(batch_start_idx + batch_size, num_pages)
-            batch_images = images[batch_start_idx:batch_end_idx]
-            batch_messages = []
-            local_skipped = []
-
-            for j, image in enumerate(batch_images):
-                page_num = batch_start_idx + j + 1
-                try:
-                    image_bytes_io = BytesIO()
-                    image.save(image_bytes_io, format='JPEG', quality=85)
-                    image_bytes_io.seek(0)
-                    image_base64 = encode_image(image_bytes_io)
-                    batch_messages.append({
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-                    })
-                except Exception as e:
-                    logger.error(f"Image processing failed for page {page_num}: {str(e)}")
-                    local_skipped.append(page_num)
-                    continue
-
-            skipped_pages.extend(local_skipped)
-
-            if not batch_messages:
-                logger.warning(f"Skipping batch {batch_start_idx + 1}-{batch_end_idx}: No valid images")
-                skipped_pages.extend(range(batch_start_idx + 1, batch_end_idx + 1))
-                continue
-
-            batch_messages.append({
-                "type": "text",
-                "text": (
-                    f"Extract plain text from these {len(batch_messages)} PDF pages (pages {batch_start_idx + 1} to {batch_end_idx}). "
-                    "Return the results as a valid JSON object where keys are page numbers "
-                    f"(1-based: {batch_start_idx + 1}, ..., {batch_end_idx}) and values are the extracted text for each page. "
-                    "Ensure the response is strictly JSON-formatted."
-                )
-            })
-
-            page_start = batch_start_idx + 1
-            page_end = batch_end_idx
-            batch_tasks.append(process_single_batch(client, model, batch_messages, page_start, page_end))
-
-        batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
-
-        for batch_result in batch_results:
-            if isinstance(batch_result, Exception):
-                logger.error(f"Batch processing failed: {str(batch_result)}")
-                continue
-            batch_data, batch_skipped = batch_result
-            if batch_data:
-                all_results.update(batch_data)
-            if batch_skipped:
-                skipped_pages.extend(batch_skipped)
-
-        retry_tasks = []
-        remaining_skipped = list(set(skipped_pages))
-        for page_num in remaining_skipped:
-            image_idx = page_num - 1
-            retry_tasks.append(process_single_page(client, model, images[image_idx], page_num))
-
-        retry_results = await asyncio.gather(*retry_tasks, return_exceptions=True)
-        successfully_processed = []
-
-        for retry_result in retry_results:
-            if isinstance(retry_result, Exception):
-                logger.error(f"Retry processing failed: {str(retry_result)}")
-                continue
-            page_result, page_num = retry_result
-            if page_result:
-                all_results.update(page_result)
-                successfully_processed.append(page_num)
-
-        skipped_pages = [p for p in skipped_pages if p not in successfully_processed]
+        profile_name = resolve_render_profile(model, render_profile)
+        # Render from a private scratch copy of the spooled upload; the bytes never sit in memory whole
+        with await stage_upload(file) as document:
+            all_results, skipped_pages, extraction_info = await extract_document(client, model, document, profile_name, filename)
 
         if not all_results and skipped_pages:
             return JSONResponse(
@@ -302,12 +147,7 @@ async def process_file(file: UploadFile = File(...), prompt: str = Form(...), se
             )
     else:
         # Handle non-PDF files (XML, CSV, JSON) as text
-        content = await file.read()
-        try:
-            content_str = content.decode('utf-8')
-        except UnicodeDecodeError:
-            content_str = content.decode('latin-1', errors='ignore')
-        all_results = content_str
+        all_results = await read_text_upload(file)
         skipped_pages = []
 
     session_id = sessionId if sessionId else f"session_{int(time.time())}_{str(uuid4())}"
@@ -316,63 +156,96 @@ async def process_file(file: UploadFile = File(...), prompt: str = Form(...), se
         return {
             "extracted_text": all_results,
             "skipped_pages": skipped_pages,
+            **extraction_info,
+            "documentId": (await asyncio.to_thread(document_registry.register, all_results, filename)).id,
             "sessionId": session_id
         }
 
-    try:
-        results_str = json.dumps(all_results)
-    except Exception as e:
-        logger.error(f"Failed to serialize all_results: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to serialize extracted text: {str(e)}")
+    return await answer_prompt(client, model, prompt, system_prompt, session_id, all_results, skipped_pages, extraction_info, filename)
 
-    session_data = session_store.get(f"sessions.{session_id}", {"chatHistory": []})
-    chat_history = session_data.get("chatHistory", [])
-    chat_history.append({"role": "user", "content": prompt})
+@app.post("/process_file_stream")
+async def process_file_stream(file: UploadFile = File(...), sessionId: str = Form(None), model: str = Form(default="gemma3"), render_profile: str = Form(default=None)):
+    """Extract a PDF, sending a Server-Sent Event as each batch or page retry completes."""
+    if not file:
+        raise HTTPException(status_code=400, detail="Please upload a file")
+    filename = file.filename.lower()
+    if os.path.splitext(filename)[1] != '.pdf':
+        raise HTTPException(status_code=400, detail="Only PDF files can be streamed")
 
     try:
-        response = await client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": [{"type": "text", "text": f"User prompt: {prompt}\nExtracted text: {results_str}"}]}
-            ],
-            temperature=0.3,
-            max_tokens=2048
-        )
-        generated_response = response.choices[0].message.content
-        chat_history.append({"role": "assistant", "content": generated_response})
-        session_store.set(f"sessions.{session_id}", {
-            "chatHistory": chat_history,
-            "timestamp": time.time()
-        })
-        return {
-            "response": generated_response,
-            "extracted_text": all_results,
-            "skipped_pages": skipped_pages,
-            "sessionId": session_id
-        }
-    except Exception as e:
-        logger.error(f"Final API request failed: {str(e)}")
-        chat_history.append({"role": "assistant", "content": f"⚠️ Error processing question: {str(e)}"})
-        session_store.set(f"sessions.{session_id}", {
-            "chatHistory": chat_history,
-            "timestamp": time.time()
-        })
-        raise HTTPException(status_code=500, detail=f"Final API request failed: {str(e)}")
+        client = get_openai_client(model)
+    except ValueError as e:
+        logger.error(f"Invalid model: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    llm_scheduler.admit(model)
+    llm_flow.set(str(uuid4()))
+    profile_name = resolve_render_profile(model, render_profile)
+    session_id = sessionId if sessionId else f"session_{int(time.time())}_{str(uuid4())}"
+    document = await stage_upload(file)
+    progress = ExtractionProgress()
+    events = progress.subscribe()
+
+    async def run():
+        try:
+            all_results, skipped_pages, extraction_info = await extract_document(client, model, document, profile_name, filename, progress)
+            if not all_results and skipped_pages:
+                progress.emit("error", detail="No valid text extracted from any pages")
+            else:
+                document_id = (await asyncio.to_thread(document_registry.register, all_results, filename)).id
+                progress.emit("done", extracted_text=all_results, **extraction_info, documentId=document_id, sessionId=session_id)
+        except HTTPException as e:
+            progress.emit("error", detail=e.detail)
+        except Exception as e:
+            logger.error(f"Streaming extraction failed for {filename}: {str(e)}")
+            progress.emit("error", detail=str(e))
+        finally:
+            document.cleanup()
+
+    task = asyncio.create_task(run())
+
+    async def event_stream():
+        try:
+            while True:
+                event, data = await events.get()
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event in ("done", "error"):
+                    break
+        finally:
+            # The client went away; stop spending GPU on pages nobody will read
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.post("/process_message")
 async def process_message(
     prompt: str = Form(...),
-    extracted_text: str = Form(...),
+    extracted_text: str = Form(None),
+    documentId: List[str] = Form(None),
     sessionId: str = Form(None),
     model: str = Form(default="gemma3"),
-    system_prompt: str = Form(default="1. CORE IDENTITY & PERSONA\n\nYou are \"Juris-Diction(AI)ry\", a highly specialized AI assistant designed for tax professionals. Your name is a fusion of \"Jurisdiction,\" \"Dictionary,\" and \"AI,\" reflecting your core capability: to interpret the language of tax law and apply it to specific corporate contexts.\n\nYour persona is that of a precise, analytical, and reliable partner for tax advisors. You are a powerful analytical tool, not a human tax advisor. Your tone is professional, objective, and always supportive. You avoid speculation and base your conclusions strictly on the data provided.\n\n2. PRIMARY OBJECTIVE\n\nYour primary objective is to analyze and cross-reference two types of structured data:\n\nCountry Profiles (Landesprofile): XML or JSON files containing structured information on tax laws, regulations, and recent legal changes, derived from news articles and legal documents.\n\nCompany Profiles (Unternehmensprofile): XML or JSON files containing specific data points about a company relevant for tax assessment (e.g., industry, revenue, number of employees, corporate structure, digital services offered, etc.).\n\nBased on this cross-referencing, your goal is to perform a logical subsumption (Anwendung eines Gesetzes auf einen Sachverhalt) and determine the legal consequence: Is a specific company affected by a new tax regulation?\n\n3. KEY CAPABILITIES & FUNCTIONS\n\nDocument Interpretation: You can read, understand, and extract key information from tax-related documents, news articles, and legal texts. You identify critical criteria such as deadlines, thresholds (e.g., revenue limits), target industries, and specific obligations.\n\nStructured Data Analysis: You can parse and logically interpret the content of XML and JSON-based Country and Company Profiles.\n\nLogical Subsumption: This is your core task. You follow a strict, step-by-step reasoning process:\n\nIdentify the Rule (Obersatz): Clearly state the requirement from the Country Profile (e.g., \"Companies in the digital services sector with an annual revenue over €750 million must file a new digital tax report.\").\n\nAnalyze the Facts (Sachverhalt): Extract the relevant data points from the Company Profile (e.g., \"Company X operates in 'digital services' and has a revenue of €800 million.\").\n\nApply Rule to Facts (Subsumption): Compare the facts with the rule's criteria (e.g., \"Company X meets both the industry criterion and the revenue threshold.\").\n\nConclude the Legal Consequence (Rechtsfolge): State the logical outcome clearly (e.g., \"Therefore, Company X is affected by the new digital tax regulation and is required to file the new report.\").\n\nOutput Generation: You present your findings in a clear, structured, and easily digestible format for the user (the tax professional).\n\n4. CONSTRAINTS & CRITICAL SAFEGUARDS (MANDATORY RULES)\n\nSTRICT DATA BASIS: Your conclusions must be based exclusively on the information provided in the Country and Company Profiles. If a crucial piece of information is missing for a criterion, you must state this explicitly.\n\nExample for Missing Data: \"Eine endgültige Beurteilung ist nicht möglich, da im Unternehmensprofil die Angabe zum Jahresumsatz für das Kriterium X fehlt.\"\n\nCITE YOUR SOURCES: When referencing a new regulation, always mention the source or the specific rule from the Country Profile you are applying.\n\nCONFIDENTIALITY: You will treat all provided company and user data as strictly confidential and will not share it outside the current session.\n\nOBJECTIVITY: Remain neutral and objective. Avoid any language that could be interpreted as a personal opinion or recommendation.\n\n5. INTERACTION STYLE & OUTPUT FORMAT\n\nWhen a user asks you to analyze a case, structure your response as follows to ensure clarity and professional utility:\n\nAnalyse-Anfrage für: [Unternehmensname]\nGeprüfte Rechtsnorm: [Name der Verordnung/des Gesetzes aus dem Landesprofil]\n\n1. Zusammenfassung der Rechtsnorm:\n[Gib hier in 1-2 Sätzen die Kernaussage der neuen steuerlichen Anforderung wieder.]\n\n2. Relevante Kriterien der Norm:\n\nKriterium A: [z.B. Unternehmenssektor: Digitale Dienstleistungen]\n\nKriterium B: [z.B. Umsatzgrenze: > €750 Mio. jährlich]\n\nKriterium C: [z.B. Mitarbeiterzahl: > 250]\n\nFrist: [z.B. 31.12.2025]\n\n3. Abgleich mit dem Unternehmensprofil:\n\nKriterium A (Sektor): Erfüllt. (Grund: Profil gibt 'Digitale Dienstleistungen' an.)\n\nKriterium B (Umsatz): Erfüllt. (Grund: Profil gibt '€800 Mio.' an.)\n\nKriterium C (Mitarbeiter): Nicht erfüllt. (Grund: Profil gibt '150 Mitarbeiter' an.)\n\n4. Ergebnis (Rechtsfolge):\n[Formuliere hier das klare Ergebnis. Zum Beispiel:]\n\"Basierend auf der Analyse ist das Unternehmen nicht von der neuen Anforderung betroffen, da das Kriterium der Mitarbeiterzahl nicht erfüllt ist.\"\noder\n\"Basierend auf der Analyse ist das Unternehmen betroffen von der neuen Anforderung, da alle relevanten Kriterien erfüllt sind. Die resultierende Pflicht ist [kurze Beschreibung der Pflicht], welche bis zum [Datum] zu erfüllen ist.\"")
+    system_prompt: str = Form(default=default_system_prompt),
+    stream: bool = Form(False)
 ):
-    """Endpoint to process a query using extracted text, with session support for Electron app."""
+    """Endpoint to process a query using extracted text, with session support for Electron app.
+
+    The text is either sent as extracted_text or referred to by the documentId returned from
+    extraction; repeat documentId to ask about several documents. The response carries
+    documentIds for the next turn, and echoes extracted_text only if it was sent.
+
+    With stream=true the answer is relayed as Server-Sent Events: "token" events carry each delta
+    as the model produces it, then "done" carries the full response, or "error".
+    """
     if not prompt.strip():
         raise HTTPException(status_code=400, detail="Please provide a non-empty prompt")
-    if not extracted_text.strip():
-        raise HTTPException(status_code=400, detail="Please provide non-empty extracted text")
+    by_reference = bool(documentId and any(document_id.strip() for document_id in documentId))
+    if not by_reference and not (extracted_text and extracted_text.strip()):
+        raise HTTPException(status_code=400, detail="Please provide a documentId or non-empty extracted text")
 
     try:
         client = get_openai_client(model)
@@ -380,56 +253,335 @@ async def process_message(
         logger.error(f"Invalid model: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
-    all_results = {}
-    text_for_analysis = extracted_text
-    try:
-        all_results = json.loads(extracted_text)
-        if isinstance(all_results, dict):
-            text_for_analysis = json.dumps(all_results)
-        else:
-            logger.warning(f"Extracted text is not a JSON object: {extracted_text}")
-            all_results = {}
-    except json.JSONDecodeError as e:
-        logger.warning(f"Invalid extracted text format, using as plain text: {str(e)} - Input: {extracted_text}")
+    llm_scheduler.admit(model)
+    llm_flow.set(str(uuid4()))
+
+    if by_reference:
+        all_results, text_for_analysis, document_ids = await asyncio.to_thread(document_registry.resolve, documentId)
+    else:
         all_results = {}
+        text_for_analysis = extracted_text
+        document_ids = []
+        try:
+            all_results = json.loads(extracted_text)
+            if isinstance(all_results, dict):
+                # Registered so the next turn can send the ID instead
+                document = await asyncio.to_thread(document_registry.register, all_results)
+                text_for_analysis = document.text
+                document_ids = [document.id]
+            else:
+                logger.warning(f"Extracted text is not a JSON object: {extracted_text}")
+                all_results = {}
+        except json.JSONDecodeError as e:
+            logger.warning(f"Invalid extracted text format, using as plain text: {str(e)} - Input: {extracted_text}")
+            # Kept, and registered, as plain text rather than dropped
+            all_results = {"content": extracted_text}
+            document = await asyncio.to_thread(document_registry.register, all_results)
+            document_ids = [document.id]
+    echoed_text = {} if by_reference else {"extracted_text": all_results}
 
     session_id = sessionId if sessionId else f"session_{int(time.time())}_{str(uuid4())}"
-    session_data = session_store.get(f"sessions.{session_id}", {"chatHistory": []})
-    chat_history = session_data.get("chatHistory", [])
-    chat_history.append({"role": "user", "content": prompt})
+    # Recorded together with the answer, as one update of whatever the session holds by then
+    question = {"role": "user", "content": prompt}
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": [{"type": "text", "text": f"User prompt: {prompt}\nExtracted text: {text_for_analysis}"}]}
+    ]
+
+    if stream:
+        async def event_stream():
+            start_time = time.monotonic()
+            ttft = None
+            chunks = []
+            try:
+                async with llm_scheduler.slot(model):
+                    # Leaving the block closes the upstream stream, however the relay ends
+                    stream = await client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=0.3,
+                        max_tokens=2048,
+                        stream=True
+                    )
+                    async with stream as response:
+                        async for chunk in response:
+                            delta = chunk.choices[0].delta.content if chunk.choices else None
+                            if not delta:
+                                continue
+                            if ttft is None:
+                                ttft = time.monotonic() - start_time
+                                llm_scheduler.record_ttft(model, ttft)
+                            chunks.append(delta)
+                            yield f"event: token\ndata: {json.dumps({'delta': delta})}\n\n"
+            except Exception as e:
+                logger.error(f"Streamed API request failed for session {session_id}: {str(e)}")
+                session_store.update(f"sessions.{session_id}", append_turns(question, {"role": "assistant", "content": f"⚠️ Error processing question: {str(e)}"}))
+                yield f"event: error\ndata: {json.dumps({'detail': f'Final API request failed: {str(e)}', 'sessionId': session_id})}\n\n"
+                return
+
+            # Only a completed answer reaches the session; a client that disconnects mid-stream cancels this generator first
+            generated_response = "".join(chunks)
+            session_store.update(f"sessions.{session_id}", append_turns(question, {"role": "assistant", "content": generated_response}))
+            logger.info(f"Streamed answer for session {session_id}: first token {ttft or 0:.2f}s, total {time.monotonic() - start_time:.2f}s")
+            done = {
+                "response": generated_response,
+                **echoed_text,
+                "skipped_pages": [],
+                "documentIds": document_ids,
+                "sessionId": session_id,
+                "ttft": round(ttft, 3) if ttft is not None else None
+            }
+            yield f"event: done\ndata: {json.dumps(done)}\n\n"
 
-    try:
-        response = await client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": [{"type": "text", "text": f"User prompt: {prompt}\nExtracted text: {text_for_analysis}"}]}
-            ],
-            temperature=0.3,
-            max_tokens=2048
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
         )
+
+    try:
+        async with llm_scheduler.slot(model):
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=2048
+            )
         generated_response = response.choices[0].message.content
-        chat_history.append({"role": "assistant", "content": generated_response})
-        session_store.set(f"sessions.{session_id}", {
-            "chatHistory": chat_history,
-            "timestamp": time.time()
-        })
+        session_store.update(f"sessions.{session_id}", append_turns(question, {"role": "assistant", "content": generated_response}))
         return {
             "response": generated_response,
-            "extracted_text": all_results,
+            **echoed_text,
             "skipped_pages": [],
+            "documentIds": document_ids,
             "sessionId": session_id
         }
     except Exception as e:
         logger.error(f"Final API request failed for session {session_id}: {str(e)}")
-        chat_history.append({"role": "assistant", "content": f"⚠️ Error processing question: {str(e)}"})
-        session_store.set(f"sessions.{session_id}", {
-            "chatHistory": chat_history,
-            "timestamp": time.time()
-        })
+        session_store.update(f"sessions.{session_id}", append_turns(question, {"role": "assistant", "content": f"⚠️ Error processing question: {str(e)}"}))
         raise HTTPException(status_code=500, detail=f"Final API request failed: {str(e)}")
 
+async def read_profile_uploads(files, kind):
+    profiles = []
+    for file in files:
+        try:
+            data = await file.read(portfolio_max_profile_bytes + 1)
+        finally:
+            file.file.close()
+        profiles.append(read_profile(file.filename, data, kind))
+    return profiles
+
+@app.post("/process_portfolio")
+async def process_portfolio(
+    archive: UploadFile = File(None),
+    company_profiles: List[UploadFile] = File(None),
+    country_profiles: List[UploadFile] = File(None),
+    prompt: str = Form(default=portfolio_prompt),
+    model: str = Form(default="gemma3"),
+    system_prompt: str = Form(default=default_system_prompt)
+):
+    """Analyse every company profile against every country profile, streaming NDJSON as pairs finish.
+
+    Profiles come as a zip archive, recognised by their Unternehmensprofil/Landesprofil root
+    element, and/or as company_profiles and country_profiles uploads. The stream opens with a
+    "start" line, has one "result" line per pair in completion order and ends with a "summary"
+    line of the verdict (affected, unaffected, undetermined or failed) of every pair.
+    """
+    if not prompt.strip():
+        raise HTTPException(status_code=400, detail="Please provide a non-empty prompt")
+
+    try:
+        client = get_openai_client(model)
+    except ValueError as e:
+        logger.error(f"Invalid model: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    llm_scheduler.admit(model)
+    # The whole portfolio is one flow, so it takes its fair share of the backend rather than one share per pair
+    llm_flow.set(str(uuid4()))
+
+    companies = await read_profile_uploads(company_profiles or [], "company")
+    countries = await read_profile_uploads(country_profiles or [], "country")
+    ignored = []
+    if archive:
+        try:
+            await archive.seek(0)
+            profiles, ignored = await asyncio.to_thread(read_archive, archive.file)
+        finally:
+            archive.file.close()
+        companies += [profile for profile in profiles if profile.kind == "company"]
+        countries += [profile for profile in profiles if profile.kind == "country"]
+    pairs = plan_pairs(companies, countries)
+    logger.info(f"Portfolio of {len(companies)} companies x {len(countries)} countries, {len(ignored)} files ignored")
+
+    results = asyncio.Queue()
+    budget = RetryBudget(len(pairs))
+
+    async def run():
+        # Bounds this request's queued LLM calls so a large portfolio cannot fill the backend queue on its own
+        semaphore = asyncio.Semaphore(portfolio_max_concurrency)
+
+        async def analyze(company, country):
+            async with semaphore:
+                results.put_nowait(await analyze_pair(client, model, prompt, system_prompt, company, country, budget))
+
+        tasks = [asyncio.create_task(analyze(company, country)) for company, country in pairs]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    task = asyncio.create_task(run())
+
+    async def ndjson_stream():
+        summary = PortfolioSummary(len(pairs))
+        try:
+            yield json.dumps({
+                "type": "start",
+                "pairs": len(pairs),
+                "companies": [profile.describe() for profile in companies],
+                "countries": [profile.describe() for profile in countries],
+                "ignored": ignored
+            }) + "\n"
+            for _ in pairs:
+                record = await results.get()
+                summary.add(record)
+                yield json.dumps({"type": "result", **record}) + "\n"
+            yield json.dumps({"type": "summary", **summary.report(), "recovery": budget.report()}) + "\n"
+        finally:
+            # The client went away; stop analysing pairs nobody will read
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        ndjson_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint to verify the API and its dependencies are operational."""
-    return {"status": "healthy", "message": "API and model connectivity are operational"}
\ No newline at end of file
+    return {"status": "healthy", "message": "API and model connectivity are operational"}
+
+@app.get("/admin/extraction-cache")
+async def get_extraction_cache_stats():
+    """Report size and hit/miss counters of the PDF extraction cache."""
+    return await asyncio.to_thread(extraction_cache.stats)
+
+@app.delete("/admin/extraction-cache")
+async def purge_extraction_cache():
+    """Remove every cached PDF extraction result."""
+    removed = await asyncio.to_thread(extraction_cache.purge)
+    logger.info(f"Purged {removed} extraction cache entries")
+    return {"removed": removed}
+
+@app.get("/admin/render-pool")
+async def get_render_pool_stats():
+    """Report render pool size and queue depth."""
+    return render_pool.stats()
+
+@app.get("/admin/llm-scheduler")
+async def get_llm_scheduler_stats():
+    """Report in-flight and queued LLM calls per model backend."""
+    return llm_scheduler.stats()
+
+@app.post("/jobs", status_code=202)
+async def create_job(file: UploadFile = File(...), prompt: str = Form(...), sessionId: str = Form(None), model: str = Form(default="gemma3"), is_extraction: bool = Form(False), render_profile: str = Form(default=None), system_prompt: str = Form(default=default_system_prompt)):
+    """Queue a file for background processing; poll GET /jobs/{jobId} for progress and the result."""
+    if not file:
+        raise HTTPException(status_code=400, detail="Please upload a file")
+    if not prompt.strip():
+        raise HTTPException(status_code=400, detail="Please provide a non-empty prompt")
+
+    filename = file.filename.lower()
+    file_ext = os.path.splitext(filename)[1]
+
+    try:
+        client = get_openai_client(model)
+    except ValueError as e:
+        logger.error(f"Invalid model: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    llm_scheduler.admit(model)
+    session_id = sessionId if sessionId else f"session_{int(time.time())}_{str(uuid4())}"
+
+    document = None
+    text_content = None
+    if file_ext == '.pdf':
+        profile_name = resolve_render_profile(model, render_profile)
+        # The upload is closed when this handler returns, so the job works from the scratch copy
+        document = await stage_upload(file)
+    else:
+        text_content = await read_text_upload(file)
+
+    async def work(job):
+        all_results, skipped_pages, extraction_info = text_content, [], {}
+        if document:
+            all_results, skipped_pages, extraction_info = await extract_document(client, model, document, profile_name, filename, job.progress)
+            if not all_results and skipped_pages:
+                raise HTTPException(status_code=400, detail="No valid text extracted from any pages")
+        if is_extraction:
+            return {
+                "extracted_text": all_results,
+                "skipped_pages": skipped_pages,
+                **extraction_info,
+                "documentId": (await asyncio.to_thread(document_registry.register, all_results, filename)).id,
+                "sessionId": session_id
+            }
+        return await answer_prompt(client, model, prompt, system_prompt, session_id, all_results, skipped_pages, extraction_info, filename)
+
+    try:
+        job = await job_manager.submit(work, cleanup=document.cleanup if document else None, filename=filename, model=model)
+    except HTTPException:
+        if document:
+            document.cleanup()
+        raise
+    return {"jobId": job.id, "status": job.status, "sessionId": session_id}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status, per-page progress and partial or final results of a job, whichever worker runs it."""
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job, whichever worker runs it."""
+    job = await job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return {"jobId": job["jobId"], "status": job["status"]}
+
+@app.get("/admin/jobs")
+async def get_job_stats():
+    """Job counts by status."""
+    return job_manager.stats()
+
+@app.get("/admin/json-salvage")
+async def get_json_salvage_stats():
+    """Extraction answer parse outcomes and pages salvaged from broken JSON."""
+    return parse_stats.report()
+
+@app.get("/admin/backends")
+async def get_backend_stats():
+    """Health, outstanding requests and latency of every model replica."""
+    return client_registry.stats()
+
+@app.get("/admin/single-flight")
+async def get_single_flight_stats():
+    """Report how many extractions and answers were shared between concurrent identical requests."""
+    return {"extraction": extraction_flights.stats(), "answer": answer_flights.stats()}
+
+@app.get("/admin/sessions")
+async def get_session_stats():
+    """Report live sessions, how many were evicted as idle or least recently used, and write-behind lag."""
+    return {**(await asyncio.to_thread(session_sweeper.stats)), "write_behind": session_store.stats()}
+
+@app.get("/admin/documents")
+async def get_document_registry_stats():
+    """Report stored documents and how often chat turns found them in memory or on disk."""
+    return await asyncio.to_thread(document_registry.stats)
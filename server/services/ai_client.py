@@ -0,0 +1,59 @@
+# File: services/ai_client.py
+import re
+from typing import Optional
+import logging
+from server.constants import model_endpoints
+from server.services.backend_pool import BackendPool
+from server.services.llm_scheduler import llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Long-lived replica pools, each replica with a tuned connection pool.
+# One pool per set of endpoints, shared by every model those endpoints serve.
+class ClientRegistry:
+    def __init__(self):
+        self.clients = {}
+        self.pools = {}  # backend key -> pool
+
+    def get(self, model):
+        valid_models = ["gemma3", "gpt-oss"]
+        if model not in valid_models:
+            raise ValueError(f"Invalid model: {model}. Choose from: {', '.join(valid_models)}")
+        if model not in self.clients:
+            key = llm_scheduler.backend_key(model)
+            if key not in self.pools:
+                base_urls = [url.strip() for url in model_endpoints[model].split(",") if url.strip()]
+                self.pools[key] = BackendPool(model, base_urls)
+            self.clients[model] = self.pools[key]
+        return self.clients[model]
+
+    def start(self):
+        for model in ["gemma3", "gpt-oss"]:
+            self.get(model)
+        for pool in self.pools.values():
+            pool.start()
+
+    async def close(self):
+        for pool in self.pools.values():
+            await pool.close()
+        self.clients = {}
+        self.pools = {}
+
+    def stats(self):
+        return {
+            key: {"models": [model for model, client in self.clients.items() if client is pool], **pool.stats()}
+            for key, pool in self.pools.items()
+        }
+
+client_registry = ClientRegistry()
+
+def get_openai_client(model: str) -> BackendPool:
+    """Return the shared client for the model's backend, spread over its replicas."""
+    return client_registry.get(model)
+
+def clean_response(raw_response: str) -> Optional[str]:
+    """Clean markdown code blocks or other non-JSON content from the response."""
+    if not raw_response:
+        return None
+    cleaned = re.sub(r'```(?:json)?\s*([\s\S]*?)\s*```', r'\1', raw_response)
+    return cleaned.strip()
@@ -0,0 +1,205 @@
+# File: services/backend_pool.py
+import asyncio
+import copy
+import time
+from types import SimpleNamespace
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, APIConnectionError, InternalServerError
+try:
+    import httpx2 as httpx  # openai>=3 is built on httpx2
+except ImportError:
+    import httpx
+import logging
+from server.constants import (
+    llm_http_max_connections, llm_http_max_keepalive, llm_http_keepalive_expiry, pool_probe_interval,
+    pool_probe_timeout, pool_eject_after_failures
+)
+from server.services.llm_scheduler import llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Errors that say something about the replica rather than the request; 429 only means it is busy
+replica_errors = (APIConnectionError, InternalServerError)
+
+class Replica:
+    """One OpenAI-compatible endpoint serving a model, with its load, latency and health."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=llm_http_max_connections,
+                max_keepalive_connections=llm_http_max_keepalive,
+                keepalive_expiry=llm_http_keepalive_expiry
+            )
+        )
+        self.client = AsyncOpenAI(api_key="http", base_url=base_url, http_client=http_client)
+        self.healthy = True
+        self.outstanding = 0
+        self.latency_ewma = None
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+
+    def stats(self):
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections
+        }
+
+class TrackedStream:
+    """A streamed completion that keeps its replica counted as busy until the stream is closed.
+
+    Use it as an async context manager, as the SDK's own stream: leaving the block closes the
+    upstream response and releases the replica exactly once, whether the stream was read to
+    the end, abandoned part way or never iterated at all.
+    """
+
+    def __init__(self, pool, replica, stream, start_time):
+        self.pool = pool
+        self.replica = replica
+        self.stream = stream
+        self.chunks = stream.__aiter__()
+        self.start_time = start_time
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.chunks.__anext__()
+        except StopAsyncIteration:
+            if not self.closed:
+                self.pool._succeeded(self.replica, time.monotonic() - self.start_time)
+            await self.close()
+            raise
+        except replica_errors as e:
+            self.pool._failed(self.replica, str(e))
+            await self.close()
+            raise
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.replica.outstanding -= 1
+        # Closing the response is what tells vLLM to stop generating for a client that went away
+        await self.stream.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+class BackendPool:
+    """Client for one model that spreads calls over its replicas by least outstanding requests.
+
+    Offers the chat.completions.create and with_options surface of AsyncOpenAI, so callers
+    use it like a single client. Replicas that keep failing, or fail the periodic health
+    probe, are ejected until a probe succeeds again.
+    """
+
+    def __init__(self, model, base_urls):
+        self.model = model
+        self.replicas = [Replica(base_url) for base_url in base_urls]
+        self.options = {}
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.probe_task = None
+        llm_scheduler.set_replicas(model, len(self.replicas))
+
+    def with_options(self, **options):
+        """A view of the pool whose calls use the given AsyncOpenAI options."""
+        view = copy.copy(self)
+        view.options = {**self.options, **options}
+        view.chat = SimpleNamespace(completions=SimpleNamespace(create=view._create))
+        return view
+
+    def pick(self):
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        # With every replica ejected, keep trying all of them rather than failing outright
+        candidates = healthy or self.replicas
+        return min(candidates, key=lambda replica: (replica.outstanding, replica.latency_ewma or 0.0))
+
+    async def _create(self, **kwargs):
+        replica = self.pick()
+        client = replica.client.with_options(**self.options) if self.options else replica.client
+        replica.outstanding += 1
+        replica.requests += 1
+        start_time = time.monotonic()
+        try:
+            response = await client.chat.completions.create(**kwargs)
+        except replica_errors as e:
+            replica.outstanding -= 1
+            self._failed(replica, str(e))
+            raise
+        except BaseException:
+            replica.outstanding -= 1
+            raise
+        if kwargs.get("stream"):
+            # The replica stays busy until the last token has been relayed
+            return TrackedStream(self, replica, response, start_time)
+        replica.outstanding -= 1
+        self._succeeded(replica, time.monotonic() - start_time)
+        return response
+
+    def _succeeded(self, replica, elapsed):
+        replica.consecutive_failures = 0
+        replica.latency_ewma = elapsed if replica.latency_ewma is None else 0.8 * replica.latency_ewma + 0.2 * elapsed
+
+    def _failed(self, replica, reason):
+        replica.failures += 1
+        replica.consecutive_failures += 1
+        if replica.healthy and replica.consecutive_failures >= pool_eject_after_failures:
+            replica.healthy = False
+            replica.ejections += 1
+            logger.warning(f"Ejected {self.model} replica {replica.base_url} after {replica.consecutive_failures} failures: {reason}")
+            self._update_capacity()
+
+    def _reinstate(self, replica):
+        replica.healthy = True
+        replica.consecutive_failures = 0
+        logger.info(f"Reinstated {self.model} replica {replica.base_url}")
+        self._update_capacity()
+
+    def _update_capacity(self):
+        llm_scheduler.set_replicas(self.model, sum(1 for replica in self.replicas if replica.healthy))
+
+    async def _probe(self, replica):
+        try:
+            await replica.client.with_options(timeout=pool_probe_timeout, max_retries=0).models.list()
+        except Exception as e:
+            self._failed(replica, f"health probe: {str(e)}")
+            return
+        if not replica.healthy:
+            self._reinstate(replica)
+        else:
+            replica.consecutive_failures = 0
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.gather(*(self._probe(replica) for replica in self.replicas))
+            await asyncio.sleep(pool_probe_interval)
+
+    def start(self):
+        self.probe_task = asyncio.create_task(self._probe_loop())
+
+    async def close(self):
+        if self.probe_task:
+            self.probe_task.cancel()
+            await asyncio.gather(self.probe_task, return_exceptions=True)
+            self.probe_task = None
+        for replica in self.replicas:
+            await replica.client.close()
+
+    def stats(self):
+        return {
+            "healthy": sum(1 for replica in self.replicas if replica.healthy),
+            "replicas": [replica.stats() for replica in self.replicas]
+        }
@@ -0,0 +1,79 @@
+# File: services/batch_planner.py
+import math
+import logging
+from server.constants import (
+    llm_max_model_len, llm_max_output_tokens, max_pages_per_batch, output_tokens_per_full_page, model_image_tokens
+)
+
+logger = logging.getLogger(__name__)
+
+class BatchPlanner:
+    """Packs rendered pages into extraction batches that fit the model's context and output limits."""
+
+    prompt_tokens = 150  # Extraction instruction plus chat template overhead
+    context_margin_tokens = 64  # Slack for estimation error in the chat template
+    output_safety_factor = 1.25  # JSON quoting and escaping inflate the extracted text
+    full_page_ink_ratio = 0.12  # Share of dark pixels on a densely printed page
+
+    def __init__(self, model):
+        image_tokens = model_image_tokens.get(model, {"patch_pixels": 28, "max_tokens": 16384})
+        self.patch_pixels = image_tokens["patch_pixels"]
+        self.image_max_tokens = image_tokens["max_tokens"]
+        self.context = llm_max_model_len
+        self.max_output = llm_max_output_tokens
+        self.max_pages = max_pages_per_batch
+        self.current = None
+
+    def estimate(self, page):
+        """Estimate (image tokens, expected output tokens) from pixel size and ink density."""
+        image_tokens = min(
+            math.ceil(page["width"] / self.patch_pixels) * math.ceil(page["height"] / self.patch_pixels),
+            self.image_max_tokens
+        )
+        density = min(page["ink_ratio"] / self.full_page_ink_ratio, 1.0)
+        output_tokens = math.ceil((20 + density * output_tokens_per_full_page) * self.output_safety_factor)
+        return image_tokens, output_tokens
+
+    def _fits(self, image_tokens, output_tokens):
+        batch = self.current
+        if len(batch["pages"]) >= self.max_pages:
+            return False
+        input_tokens = self.prompt_tokens + batch["image_tokens"] + image_tokens
+        expected_output = batch["expected_output_tokens"] + output_tokens
+        return expected_output <= self.max_output and input_tokens + expected_output <= self.context - self.context_margin_tokens
+
+    def _close(self):
+        batch = self.current
+        self.current = None
+        input_tokens = self.prompt_tokens + batch["image_tokens"]
+        batch["max_tokens"] = max(256, min(self.max_output, self.context - input_tokens - self.context_margin_tokens))
+        return batch
+
+    def add(self, page_num, page):
+        """Add a rendered page; returns the batches that are now complete."""
+        image_tokens, output_tokens = self.estimate(page)
+        ready = []
+        if self.current is not None and not self._fits(image_tokens, output_tokens):
+            ready.append(self._close())
+        if self.current is None:
+            self.current = {"pages": [], "images": {}, "image_tokens": 0, "expected_output_tokens": 0}
+        self.current["pages"].append(page_num)
+        self.current["images"][page_num] = page["image_url"]
+        self.current["image_tokens"] += image_tokens
+        self.current["expected_output_tokens"] += output_tokens
+        if len(self.current["pages"]) >= self.max_pages:
+            ready.append(self._close())
+        return ready
+
+    def flush(self):
+        return [self._close()] if self.current is not None else []
+
+    @staticmethod
+    def describe(batch):
+        """Batch plan entry reported in extraction responses."""
+        return {
+            "pages": batch["pages"],
+            "image_tokens": batch["image_tokens"],
+            "expected_output_tokens": batch["expected_output_tokens"],
+            "max_tokens": batch["max_tokens"]
+        }
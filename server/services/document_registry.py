@@ -0,0 +1,195 @@
+# File: services/document_registry.py
+import hashlib
+import json
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from fastapi import HTTPException
+import logging
+from server.constants import document_registry_dir, document_registry_max_bytes, document_memory_entries
+
+logger = logging.getLogger(__name__)
+
+document_id_pattern = re.compile(r"[0-9a-f]{64}")
+
+class Document:
+    """Extracted text of one document, parsed and serialized once."""
+
+    def __init__(self, document_id, extracted_text, text, filename=None):
+        self.id = document_id
+        self.extracted_text = extracted_text
+        self.text = text
+        self.filename = filename
+
+    @property
+    def label(self):
+        """Key of this document when several are combined: the file name without extension, as ux.py does."""
+        if self.filename:
+            return os.path.splitext(os.path.basename(self.filename))[0]
+        return self.id
+
+# Extraction results stored under the SHA-256 of their JSON, so chat turns can send the ID instead of the text.
+# Entries live on disk, shared by every worker and evicted least recently used above max_bytes;
+# the most recently used are also kept parsed in memory. Every method but the constructor touches
+# the disk; callers on the event loop run them with asyncio.to_thread.
+class DocumentRegistry:
+    def __init__(self, registry_dir=document_registry_dir, max_bytes=document_registry_max_bytes, memory_entries=document_memory_entries):
+        self.registry_dir = registry_dir
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.registered = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.registry_dir, exist_ok=True)
+
+    def _path(self, document_id):
+        return os.path.join(self.registry_dir, f"{document_id}.json")
+
+    def _remember(self, document):
+        with self._lock:
+            self.memory[document.id] = document
+            self.memory.move_to_end(document.id)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def register(self, extracted_text, filename=None):
+        """Store an extraction result and return it as a Document.
+
+        Storing the same result again only refreshes it; the file name it was first stored with is kept.
+        """
+        text = json.dumps(extracted_text)
+        document = Document(hashlib.sha256(text.encode("utf-8")).hexdigest(), extracted_text, text, filename)
+        path = self._path(document.id)
+        try:
+            os.utime(path)  # Refresh mtime so eviction is least-recently-used
+        except FileNotFoundError:
+            pass
+        else:
+            # Already stored: the copy in memory carries the first file name. A copy only on disk
+            # keeps it there, so this one is not remembered and a later get() reads the stored name.
+            with self._lock:
+                known = self.memory.get(document.id)
+                if known is not None:
+                    self.memory.move_to_end(document.id)
+            return known if known is not None else document
+        self._remember(document)
+        tmp_path = os.path.join(self.registry_dir, f"{document.id}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({"filename": filename, "extracted_text": extracted_text, "created": time.time()}, f)
+            os.replace(tmp_path, path)
+        except IOError as e:
+            # The document still answers from memory in this process
+            logger.error(f"Failed to write document {document.id}: {str(e)}")
+            return document
+        with self._lock:
+            self.registered += 1
+        self.evict()
+        return document
+
+    def get(self, document_id):
+        if not document_id_pattern.fullmatch(document_id):
+            return None
+        path = self._path(document_id)
+        with self._lock:
+            document = self.memory.get(document_id)
+            if document is not None:
+                self.memory.move_to_end(document_id)
+                self.memory_hits += 1
+        if document is not None:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            return document
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except (json.JSONDecodeError, IOError) as e:
+            logger.error(f"Failed to read document {document_id}: {str(e)}")
+            with self._lock:
+                self.misses += 1
+            return None
+        document = Document(document_id, entry["extracted_text"], json.dumps(entry["extracted_text"]), entry.get("filename"))
+        self._remember(document)
+        with self._lock:
+            self.disk_hits += 1
+        return document
+
+    def resolve(self, document_ids):
+        """The extracted text of one or more documents, its JSON for the prompt, and the IDs used.
+
+        Several documents are combined into {label: extracted_text}, the shape ux.py builds
+        when it sends the text of several files itself.
+        """
+        document_ids = list(dict.fromkeys(document_id.strip() for document_id in document_ids if document_id.strip()))
+        documents = []
+        for document_id in document_ids:
+            document = self.get(document_id)
+            if document is None:
+                raise HTTPException(status_code=404, detail=f"Document {document_id} not found; extract the file again")
+            documents.append(document)
+        if len(documents) == 1:
+            return documents[0].extracted_text, documents[0].text, document_ids
+        labels = [document.label for document in documents]
+        labels = [document.id if labels.count(label) > 1 else label for document, label in zip(documents, labels)]
+        all_results = {label: document.extracted_text for label, document in zip(labels, documents)}
+        # Joined from the stored JSON rather than serializing the combined text again
+        text = "{" + ", ".join(f"{json.dumps(label)}: {document.text}" for label, document in zip(labels, documents)) + "}"
+        return all_results, text, document_ids
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.registry_dir):
+            if entry.name.endswith(".json"):
+                try:
+                    entries.append((entry.path, entry.stat()))
+                except FileNotFoundError:
+                    continue
+        return entries
+
+    def evict(self):
+        """Drop least recently used documents until the registry fits in max_bytes."""
+        with self._lock:
+            entries = self._entries()
+            total = sum(st.st_size for _, st in entries)
+            if total <= self.max_bytes:
+                return
+            for path, st in sorted(entries, key=lambda e: e[1].st_mtime):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self.memory.pop(os.path.basename(path)[:-len(".json")], None)
+                total -= st.st_size
+                self.evictions += 1
+                if total <= self.max_bytes:
+                    break
+
+    def stats(self):
+        with self._lock:
+            entries = self._entries()
+            return {
+                "entries": len(entries),
+                "size_bytes": sum(st.st_size for _, st in entries),
+                "max_bytes": self.max_bytes,
+                "in_memory": len(self.memory),
+                "registered": self.registered,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+document_registry = DocumentRegistry()
@@ -0,0 +1,118 @@
+# File: services/extraction_cache.py
+import hashlib
+import json
+import os
+import time
+import threading
+import logging
+from server.constants import extraction_cache_dir, extraction_cache_max_bytes, extraction_prompt_version
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed on-disk cache of PDF extraction results. Every method reads, writes or scans files;
+# call them from a worker thread, not the event loop.
+class ExtractionCache:
+    def __init__(self, cache_dir=extraction_cache_dir, max_bytes=extraction_cache_max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, digest, model, render_profile):
+        """Key on document SHA-256 (hex), model, render profile and extraction-prompt version."""
+        return hashlib.sha256(f"{digest}:{model}:{render_profile}:{extraction_prompt_version}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+            os.utime(path)  # Refresh mtime so eviction is least-recently-used
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except (json.JSONDecodeError, IOError) as e:
+            logger.error(f"Failed to read extraction cache entry {key}: {str(e)}")
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry["extracted_text"], entry.get("skipped_pages", []), entry.get("extraction_info", {})
+
+    def set(self, key, extracted_text, skipped_pages, extraction_info):
+        path = self._path(key)
+        tmp_path = os.path.join(self.cache_dir, f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    "extracted_text": extracted_text,
+                    "skipped_pages": skipped_pages,
+                    "extraction_info": extraction_info,
+                    "created": time.time()
+                }, f)
+            os.replace(tmp_path, path)
+        except IOError as e:
+            logger.error(f"Failed to write extraction cache entry {key}: {str(e)}")
+            return
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".json"):
+                try:
+                    entries.append((entry.path, entry.stat()))
+                except FileNotFoundError:
+                    continue
+        return entries
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = self._entries()
+            total = sum(st.st_size for _, st in entries)
+            if total <= self.max_bytes:
+                return
+            for path, st in sorted(entries, key=lambda e: e[1].st_mtime):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= st.st_size
+                self.evictions += 1
+                if total <= self.max_bytes:
+                    break
+
+    def purge(self):
+        with self._lock:
+            removed = 0
+            for path, _ in self._entries():
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+            return removed
+
+    def stats(self):
+        with self._lock:
+            entries = self._entries()
+            return {
+                "entries": len(entries),
+                "size_bytes": sum(st.st_size for _, st in entries),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "prompt_version": extraction_prompt_version
+            }
+
+extraction_cache = ExtractionCache()
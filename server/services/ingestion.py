@@ -0,0 +1,78 @@
+# File: services/ingestion.py
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import logging
+from server.constants import scratch_dir, ingest_chunk_bytes
+
+logger = logging.getLogger(__name__)
+
+class StagedDocument:
+    """An uploaded document written once into its own scratch directory, with its SHA-256."""
+
+    def __init__(self, scratch, path, sha256, size):
+        self.scratch = scratch
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.refs = 1
+
+    def retain(self):
+        """Keep the scratch copy for another user; it is removed once every holder has called cleanup()."""
+        self.refs += 1
+
+    def cleanup(self):
+        self.refs -= 1
+        if self.refs <= 0:
+            shutil.rmtree(self.scratch, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+def _copy_into_scratch(source, suffix, scratch_root):
+    # mkdtemp is 0700 and unique per call, so concurrent uploads never share a path
+    scratch = tempfile.mkdtemp(prefix="ingest-", dir=scratch_root)
+    path = os.path.join(scratch, f"document{suffix}")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while True:
+                chunk = source.read(ingest_chunk_bytes)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+    return StagedDocument(scratch, path, digest.hexdigest(), size)
+
+def _stage(source, suffix):
+    try:
+        return _copy_into_scratch(source, suffix, scratch_dir)
+    except OSError as e:
+        if scratch_dir is None or not source.seekable():
+            raise
+        # tmpfs is small by default in containers; fall back to the regular temp dir when it fills up
+        logger.warning(f"Staging in {scratch_dir} failed ({str(e)}), falling back to {tempfile.gettempdir()}")
+        source.seek(0)
+        return _copy_into_scratch(source, suffix, None)
+
+async def stage_upload(upload, suffix=".pdf"):
+    """Stream an upload's spooled file into per-request scratch space, hashing it on the way."""
+    await upload.seek(0)
+    return await asyncio.to_thread(_stage, upload.file, suffix)
+
+async def stage_file(path, suffix=".pdf"):
+    """Copy a local file into per-request scratch space, as stage_upload does for uploads."""
+    def stage():
+        with open(path, "rb") as source:
+            return _stage(source, suffix)
+    return await asyncio.to_thread(stage)
@@ -0,0 +1,243 @@
+# File: services/job_manager.py
+import asyncio
+import time
+from uuid import uuid4
+from fastapi import HTTPException
+import logging
+from server.constants import job_workers, job_max_queued, job_retention_seconds, job_publish_interval
+from server.services.llm_scheduler import llm_flow
+from server.services.pdf_processor import ExtractionProgress
+from server.services.session_store import durable_session_store
+
+logger = logging.getLogger(__name__)
+
+class Job:
+    """One background request: its status, live progress and final result."""
+
+    def __init__(self, job_id, work, cleanup, meta):
+        self.id = job_id
+        self.work = work
+        self.cleanup = cleanup
+        self.meta = meta
+        self.status = "queued"
+        self.progress = ExtractionProgress()
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.task = None
+
+    def to_dict(self):
+        data = {
+            "jobId": self.id,
+            "status": self.status,
+            **self.meta,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "progress": self.progress.snapshot()
+        }
+        if self.status == "completed":
+            data["result"] = self.result
+        else:
+            data["partial_results"] = self.progress.results
+        if self.error:
+            data["error"] = self.error
+        return data
+
+def request_cancel(record):
+    """Flag a job another worker runs; that worker cancels it when it next publishes."""
+    return {**record, "cancelRequested": True} if record else record
+
+def job_from_record(record):
+    """A job's state as published to the shared store, in the shape Job.to_dict returns."""
+    data = {key: value for key, value in record.items() if key not in ("cancelRequested", "timestamp")}
+    if record.get("cancelRequested") and data["status"] in ("queued", "running"):
+        data["status"] = "cancelling"
+    return data
+
+class JobManager:
+    """Queue and worker pool for requests too slow to answer synchronously.
+
+    Jobs run in the worker process that accepted them. Their state is published to the shared
+    session store on every status change and every publish_interval while they run, so a poll
+    that lands on another worker finds it there. A cancel that lands on another worker flags
+    the published job, and the worker running it cancels it at its next publish.
+    """
+
+    def __init__(self, workers=job_workers, max_queued=job_max_queued, retention_seconds=job_retention_seconds, store=durable_session_store, publish_interval=job_publish_interval):
+        self.worker_count = workers
+        self.max_queued = max_queued
+        self.retention_seconds = retention_seconds
+        self.store = store
+        self.publish_interval = publish_interval
+        self.jobs = {}
+        self.queue = None
+        self.workers = []
+        self.publisher = None
+        self._publishing = None
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        # One publish at a time, so an older snapshot of a job never lands after a newer one
+        self._publishing = asyncio.Lock()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        self.publisher = asyncio.create_task(self._publish_loop())
+        logger.info(f"Job manager started with {self.worker_count} workers")
+
+    async def stop(self):
+        for job in list(self.jobs.values()):
+            self._cancel(job)
+        running = [job.task for job in self.jobs.values() if job.task]
+        await asyncio.gather(*running, return_exceptions=True)
+        tasks = self.workers + ([self.publisher] if self.publisher else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.workers = []
+        self.publisher = None
+        for job in self.jobs.values():
+            # Workers stopped before they could record the end of a cancelled job
+            if job.status == "cancelling":
+                job.status = "cancelled"
+                job.finished = time.time()
+        await self.publish(list(self.jobs.values()))
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished and job.finished < cutoff]:
+            del self.jobs[job_id]
+
+    async def publish(self, jobs):
+        """Write the current state of the given jobs to the shared store in one batch."""
+        if not jobs:
+            return
+
+        def record(data, now):
+            # A cancel flagged by another worker stays on the record until this one has acted on it
+            return lambda stored: {**data, "timestamp": now, "cancelRequested": bool(stored and stored.get("cancelRequested"))}
+
+        async with self._publishing:
+            now = time.time()
+            updates = {f"jobs.{job.id}": [record(job.to_dict(), now)] for job in jobs}
+            try:
+                await asyncio.to_thread(self.store.update_batch, updates)
+            except Exception as e:
+                logger.error(f"Failed to publish {len(updates)} jobs: {str(e)}")
+
+    def _read(self, job_ids):
+        return {job_id: self.store.get(f"jobs.{job_id}") for job_id in job_ids}
+
+    async def _sync(self):
+        active = [job for job in self.jobs.values() if job.status in ("queued", "running")]
+        if active:
+            records = await asyncio.to_thread(self._read, [job.id for job in active])
+            for job in active:
+                if (records[job.id] or {}).get("cancelRequested"):
+                    logger.info(f"Cancelling job {job.id} on request from another worker")
+                    self._cancel(job)
+            await self.publish([job for job in active if job.status != "queued"])
+        # Every worker drops finished jobs of any worker once they are past retention
+        await asyncio.to_thread(self.store.evict, "jobs", time.time() - self.retention_seconds, None)
+
+    async def _publish_loop(self):
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            try:
+                await self._sync()
+            except Exception as e:
+                logger.error(f"Job publish failed: {str(e)}")
+
+    async def submit(self, work, cleanup=None, **meta):
+        """Queue work(job) and return the job without waiting for it; it is published before it is returned."""
+        self._prune()
+        queued = sum(1 for job in self.jobs.values() if job.status == "queued")
+        if queued >= self.max_queued:
+            raise HTTPException(status_code=429, detail="Too many queued jobs, please retry later", headers={"Retry-After": "30"})
+        job = Job(str(uuid4()), work, cleanup, meta)
+        self.jobs[job.id] = job
+        self.queue.put_nowait(job)
+        await self.publish([job])
+        return job
+
+    async def get(self, job_id):
+        """A job's state: live if this worker runs it, else as last published by the worker that does."""
+        self._prune()
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        record = await asyncio.to_thread(self.store.get, f"jobs.{job_id}")
+        return job_from_record(record) if record else None
+
+    async def cancel(self, job_id):
+        """Cancel a queued or running job and return its state, or None if no worker knows it."""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            self._cancel(job)
+            await self.publish([job])
+            return job.to_dict()
+        key = f"jobs.{job_id}"
+        record = await asyncio.to_thread(self.store.get, key)
+        if not record:
+            return None
+        if record["status"] in ("queued", "running"):
+            await asyncio.to_thread(self.store.update_batch, {key: [request_cancel]})
+            record = request_cancel(record)
+        return job_from_record(record)
+
+    def _cancel(self, job):
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished = time.time()
+            self._cleanup(job)
+        elif job.status == "running":
+            job.status = "cancelling"
+            job.task.cancel()
+
+    def _cleanup(self, job):
+        if job.cleanup:
+            try:
+                job.cleanup()
+            except Exception as e:
+                logger.error(f"Cleanup failed for job {job.id}: {str(e)}")
+            job.cleanup = None
+
+    async def _run(self, job):
+        # Each job is its own flow in the LLM scheduler's fair queue
+        llm_flow.set(job.id)
+        return await job.work(job)
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            if job.status != "queued":
+                continue
+            job.status = "running"
+            job.started = time.time()
+            job.task = asyncio.create_task(self._run(job))
+            await self.publish([job])
+            await asyncio.wait([job.task])
+            if job.task.cancelled():
+                job.status = "cancelled"
+            elif job.task.exception() is not None:
+                error = job.task.exception()
+                job.status = "failed"
+                job.error = error.detail if isinstance(error, HTTPException) else str(error)
+                logger.error(f"Job {job.id} failed: {job.error}")
+            else:
+                job.status = "completed"
+                job.result = job.task.result()
+            job.finished = time.time()
+            job.task = None
+            self._cleanup(job)
+            await self.publish([job])
+            logger.info(f"Job {job.id} {job.status} in {job.finished - job.started:.1f}s")
+
+    def stats(self):
+        statuses = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {"workers": self.worker_count, "max_queued": self.max_queued, "jobs": statuses}
+
+job_manager = JobManager()
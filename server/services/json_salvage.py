@@ -0,0 +1,82 @@
+# File: services/json_salvage.py
+import json
+
+json_whitespace = " \t\n\r"
+# Models often put raw newlines inside strings, which strict JSON rejects
+lenient_json_decoder = json.JSONDecoder(strict=False)
+
+def _skip_chars(text, idx, chars):
+    while idx < len(text) and text[idx] in chars:
+        idx += 1
+    return idx
+
+def salvage_json_object(text):
+    """Every complete key/value pair of a JSON object, tolerating truncation and stray commas.
+
+    Returns the pairs and whether the object was closed. Scanning stops at the first pair
+    that is cut off or malformed; everything before it is kept.
+    """
+    pairs = {}
+    idx = text.find("{")
+    if idx < 0:
+        return pairs, False
+    idx += 1
+    while True:
+        # Commas are skipped wherever they appear, so trailing and doubled commas are harmless
+        idx = _skip_chars(text, idx, json_whitespace + ",")
+        if idx >= len(text):
+            return pairs, False
+        if text[idx] == "}":
+            return pairs, True
+        if text[idx] != '"':
+            return pairs, False
+        try:
+            key, idx = json.decoder.scanstring(text, idx + 1, False)
+        except ValueError:
+            return pairs, False
+        idx = _skip_chars(text, idx, json_whitespace)
+        if idx >= len(text) or text[idx] != ":":
+            return pairs, False
+        idx = _skip_chars(text, idx + 1, json_whitespace)
+        try:
+            value, idx = lenient_json_decoder.raw_decode(text, idx)
+        except ValueError:
+            return pairs, False
+        # A number or literal at the very end may itself be cut off; a closed string cannot be
+        if not isinstance(value, str) and _skip_chars(text, idx, json_whitespace) >= len(text):
+            return pairs, False
+        pairs[key] = value
+
+class ParseStats:
+    """Counts how extraction answers were parsed: cleanly, salvaged from broken JSON, or not at all."""
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.responses = 0
+        self.clean = 0
+        self.salvaged = 0
+        self.failed = 0
+        self.pages_salvaged = 0  # Pages kept from answers json.loads rejected, i.e. retries avoided
+        self.pages_missing = 0  # Requested pages absent from the answer, sent on to recovery
+
+    def record(self, outcome, pages_found, pages_missing):
+        """Record one answer; outcome is "clean", "salvaged" or "failed"."""
+        self.responses += 1
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        if outcome == "salvaged":
+            self.pages_salvaged += pages_found
+        self.pages_missing += pages_missing
+        if self.parent is not None:
+            self.parent.record(outcome, pages_found, pages_missing)
+
+    def report(self):
+        return {
+            "responses": self.responses,
+            "clean": self.clean,
+            "salvaged": self.salvaged,
+            "failed": self.failed,
+            "pages_salvaged": self.pages_salvaged,
+            "pages_missing": self.pages_missing
+        }
+
+parse_stats = ParseStats()
@@ -0,0 +1,57 @@
+# File: services/llm_retry.py
+import asyncio
+import math
+import random
+from openai import APIConnectionError, InternalServerError, RateLimitError
+import logging
+from server.constants import (
+    llm_retry_max_attempts, llm_retry_base_delay, llm_retry_max_delay, retry_budget_per_page,
+    retry_budget_min_calls
+)
+from server.services.llm_scheduler import llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Worth retrying the same request; APITimeoutError is an APIConnectionError
+transient_llm_errors = (APIConnectionError, RateLimitError, InternalServerError)
+
+class RetryBudget:
+    """Extra LLM calls one document may spend on backoff retries and batch bisection."""
+
+    def __init__(self, pages):
+        self.limit = max(retry_budget_min_calls, math.ceil(pages * retry_budget_per_page))
+        self.spent = 0
+        self.denied = 0
+
+    def take(self):
+        """Spend one call from the budget; False once it is used up."""
+        if self.spent >= self.limit:
+            if not self.denied:
+                logger.warning(f"Retry budget of {self.limit} calls exhausted, giving up on remaining failed pages")
+            self.denied += 1
+            return False
+        self.spent += 1
+        return True
+
+    def report(self):
+        return {"limit": self.limit, "spent": self.spent, "denied": self.denied}
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given 0-based retry attempt."""
+    return random.uniform(0, min(llm_retry_max_delay, llm_retry_base_delay * 2 ** attempt))
+
+async def call_with_backoff(model, call, budget, label):
+    """Run call() in a scheduler slot, retrying transport errors with backoff while the budget lasts."""
+    attempt = 0
+    while True:
+        try:
+            async with llm_scheduler.slot(model):
+                return await call()
+        except transient_llm_errors as e:
+            if attempt + 1 >= llm_retry_max_attempts or not budget.take():
+                raise
+            # Sleep outside the slot so other requests can use the backend meanwhile
+            delay = backoff_delay(attempt)
+            attempt += 1
+            logger.warning(f"Transient error for {label} ({str(e)}), retry {attempt} in {delay:.1f}s")
+            await asyncio.sleep(delay)
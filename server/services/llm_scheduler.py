@@ -0,0 +1,156 @@
+# File: services/llm_scheduler.py
+import asyncio
+import contextvars
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+import logging
+from server.constants import llm_max_inflight, llm_max_queue, model_endpoints
+
+logger = logging.getLogger(__name__)
+
+# Identifies the HTTP request an LLM call belongs to; tasks spawned by a handler inherit it
+llm_flow = contextvars.ContextVar("llm_flow", default="default")
+
+class _Backend:
+    def __init__(self):
+        self.inflight = 0
+        self.queued = 0
+        self.flows = OrderedDict()  # flow id -> deque of waiting futures, served round-robin
+        self.latency_ewma = 1.0
+        self.completed = 0
+        self.rejected = 0
+        self.ttft_ewma = None  # Seconds to first streamed token, queue wait included
+        self.streams = 0
+        self.replicas = 1  # Healthy replicas behind the backend; the in-flight limit scales with them
+
+# Process-wide admission control for LLM calls with fair queuing across requests.
+# Backends are keyed by the endpoints serving a model, so models served by the same replicas share one limit.
+class LLMScheduler:
+    def __init__(self, max_inflight=llm_max_inflight, max_queue=llm_max_queue, endpoints=model_endpoints):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.endpoints = endpoints
+        self.backends = {}
+        self.models = {}  # backend key -> models it serves
+
+    def backend_key(self, model):
+        urls = self.endpoints.get(model)
+        if not urls:
+            return model
+        return ",".join(sorted({url.strip().rstrip("/") for url in urls.split(",") if url.strip()}))
+
+    def _backend(self, model):
+        key = self.backend_key(model)
+        models = self.models.setdefault(key, [])
+        if model not in models:
+            models.append(model)
+        return self.backends.setdefault(key, _Backend())
+
+    def limit(self, backend):
+        return self.max_inflight * backend.replicas
+
+    def retry_after(self, backend):
+        return max(1, math.ceil((backend.queued + 1) * backend.latency_ewma / self.limit(backend)))
+
+    # Scale a backend's in-flight limit to its number of healthy replicas
+    def set_replicas(self, model, replicas):
+        backend = self._backend(model)
+        backend.replicas = max(1, replicas)
+        self._grant(backend)
+
+    def admit(self, model):
+        """Reject a new request with 429 when the backend's queue is saturated."""
+        backend = self.backends.get(self.backend_key(model))
+        if backend is not None and backend.queued >= self.max_queue:
+            backend.rejected += 1
+            retry_after = self.retry_after(backend)
+            logger.warning(f"LLM queue for {model} saturated ({backend.queued} waiting), rejecting request")
+            raise HTTPException(
+                status_code=429,
+                detail=f"Model {model} is busy, please retry later",
+                headers={"Retry-After": str(retry_after)}
+            )
+
+    async def acquire(self, model):
+        backend = self._backend(model)
+        if backend.inflight < self.limit(backend) and backend.queued == 0:
+            backend.inflight += 1
+            return
+        flow = llm_flow.get()
+        waiter = asyncio.get_running_loop().create_future()
+        backend.flows.setdefault(flow, deque()).append(waiter)
+        backend.queued += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            queue = backend.flows.get(flow)
+            if queue is not None and waiter in queue:
+                queue.remove(waiter)
+                backend.queued -= 1
+                if not queue:
+                    del backend.flows[flow]
+            elif waiter.done() and not waiter.cancelled():
+                # Slot was granted before the cancellation landed; hand it on
+                self.release(model)
+            raise
+
+    def release(self, model):
+        backend = self._backend(model)
+        backend.inflight -= 1
+        self._grant(backend)
+
+    # Hand free slots to waiting flows, round-robin
+    def _grant(self, backend):
+        while backend.inflight < self.limit(backend) and backend.flows:
+            flow, queue = backend.flows.popitem(last=False)
+            waiter = queue.popleft()
+            if queue:
+                backend.flows[flow] = queue  # Back of the line until every other flow has had a turn
+            backend.queued -= 1
+            if waiter.done():
+                continue
+            waiter.set_result(None)
+            backend.inflight += 1
+
+    @asynccontextmanager
+    async def slot(self, model):
+        """Hold one in-flight LLM call slot for the given backend."""
+        await self.acquire(model)
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            backend = self._backend(model)
+            backend.latency_ewma = 0.8 * backend.latency_ewma + 0.2 * (time.monotonic() - start_time)
+            backend.completed += 1
+            self.release(model)
+
+    # Time to first token of a streamed answer
+    def record_ttft(self, model, seconds):
+        backend = self._backend(model)
+        backend.ttft_ewma = seconds if backend.ttft_ewma is None else 0.8 * backend.ttft_ewma + 0.2 * seconds
+        backend.streams += 1
+
+    def stats(self):
+        return {
+            key: {
+                "models": self.models.get(key, []),
+                "inflight": backend.inflight,
+                "queued": backend.queued,
+                "flows": len(backend.flows),
+                "max_inflight": self.limit(backend),
+                "replicas": backend.replicas,
+                "max_queue": self.max_queue,
+                "latency_ewma": round(backend.latency_ewma, 3),
+                "completed": backend.completed,
+                "rejected": backend.rejected,
+                "ttft_ewma": round(backend.ttft_ewma, 3) if backend.ttft_ewma is not None else None,
+                "streams": backend.streams
+            }
+            for key, backend in self.backends.items()
+        }
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,70 @@
+# File: services/page_filter.py
+from PIL import Image, ImageChops, ImageStat
+import logging
+from server.constants import blank_page_max_stddev, duplicate_page_max_hamming, duplicate_page_max_pixel_diff
+
+logger = logging.getLogger(__name__)
+
+def page_fingerprint(image, hash_size=16, thumb_size=(64, 64)):
+    """Pixel spread, difference hash and thumbnail of a page, for blank and duplicate detection."""
+    gray = image.convert("L")
+    small = gray.copy()
+    small.thumbnail((256, 256))
+    stddev = ImageStat.Stat(small).stddev[0]
+
+    pixels = gray.resize((hash_size + 1, hash_size)).tobytes()
+    dhash = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            dhash = (dhash << 1) | (left > right)
+    return {"stddev": stddev, "dhash": dhash, "thumb": gray.resize(thumb_size).tobytes()}
+
+class PageFilter:
+    """Drops blank pages and routes near-identical pages to one extraction."""
+
+    thumb_size = (64, 64)
+
+    def __init__(self):
+        self.blank_pages = []
+        self.duplicates = {}  # duplicate page -> page it was extracted from
+        self.originals = []  # (page, fingerprint) of every page sent for extraction
+
+    def _thumb_diff(self, a, b):
+        """Mean absolute pixel difference between two thumbnails."""
+        diff = ImageChops.difference(Image.frombytes("L", self.thumb_size, a), Image.frombytes("L", self.thumb_size, b))
+        return ImageStat.Stat(diff).mean[0]
+
+    def check(self, page_num, fingerprint):
+        """Return "blank" or "duplicate" when the page should not be sent, else None."""
+        if fingerprint["stddev"] <= blank_page_max_stddev:
+            self.blank_pages.append(page_num)
+            return "blank"
+        for original, seen in self.originals:
+            if (fingerprint["dhash"] ^ seen["dhash"]).bit_count() > duplicate_page_max_hamming:
+                continue
+            # Hash collisions between pages with the same layout are confirmed on pixels
+            if self._thumb_diff(fingerprint["thumb"], seen["thumb"]) <= duplicate_page_max_pixel_diff:
+                self.duplicates[page_num] = original
+                return "duplicate"
+        self.originals.append((page_num, fingerprint))
+        return None
+
+    def apply(self, results):
+        """Copy each original's text to its duplicates; returns duplicates whose original failed."""
+        failed = []
+        for page_num, original in self.duplicates.items():
+            if str(original) in results:
+                results[str(page_num)] = results[str(original)]
+            else:
+                failed.append(page_num)
+        if self.blank_pages or self.duplicates:
+            logger.info(f"Skipped {len(self.blank_pages)} blank and {len(self.duplicates)} duplicate pages")
+        return failed
+
+    def report(self):
+        return {
+            "blank_pages": sorted(self.blank_pages),
+            "duplicate_pages": {str(page_num): original for page_num, original in sorted(self.duplicates.items())}
+        }
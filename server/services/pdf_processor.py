@@ -0,0 +1,601 @@
+# File: services/pdf_processor.py
+import asyncio
+import base64
+import json
+import re
+import time
+from io import BytesIO
+from fastapi import HTTPException
+from openai import BadRequestError
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import features
+import logging
+from server.constants import (
+    text_layer_enabled, text_layer_min_chars, text_layer_min_alnum_ratio, text_layer_scan_min_coverage, render_window_pages,
+    render_profiles, default_render_profile, model_render_profiles, guided_decoding_enabled
+)
+from server.services.ai_client import clean_response
+from server.services.extraction_cache import extraction_cache
+from server.services.render_pool import render_pool
+from server.services.llm_retry import RetryBudget, call_with_backoff
+from server.services.json_salvage import ParseStats, parse_stats, salvage_json_object
+from server.services.single_flight import extraction_flights
+from server.services.batch_planner import BatchPlanner
+from server.services.page_filter import PageFilter, page_fingerprint
+
+logger = logging.getLogger(__name__)
+
+def encode_image(image: BytesIO) -> str:
+    """Encode image bytes to base64 string."""
+    return base64.b64encode(image.read()).decode("utf-8")
+
+# Models whose backend rejected response_format; their extraction calls rely on the prompt alone
+guided_decoding_unsupported = set()
+
+# Phrases a 400 carries when the backend cannot honour response_format, as opposed to a bad batch
+response_format_errors = ("response_format", "json_schema", "guided", "structured output")
+
+def rejects_response_format(error):
+    """Whether a rejected request was rejected for its response_format rather than its content."""
+    message = str(error).lower()
+    return any(phrase in message for phrase in response_format_errors)
+
+def page_response_format(page_numbers):
+    """JSON schema that allows exactly the given page-number keys, each with a text value."""
+    keys = [str(p) for p in page_numbers]
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "page_text",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {key: {"type": "string"} for key in keys},
+                "required": keys,
+                "additionalProperties": False
+            }
+        }
+    }
+
+def page_messages(images, page_numbers):
+    """Image parts plus the extraction instruction for one call over the given pages."""
+    messages = [{"type": "image_url", "image_url": {"url": images[page_num]}} for page_num in page_numbers]
+    if len(page_numbers) == 1:
+        page_idx = page_numbers[0]
+        text = (
+            f"Extract plain text from this single PDF page (page number {page_idx}). "
+            "Return the result as a valid JSON object where the key is the page number "
+            f"({page_idx}) and the value is the extracted text. "
+            "Ensure the response is strictly JSON-formatted and does not include markdown code blocks."
+        )
+    else:
+        page_list = ", ".join(str(p) for p in page_numbers)
+        text = (
+            f"Extract plain text from these {len(page_numbers)} PDF pages (pages {page_list}). "
+            "Return the results as a valid JSON object where keys are page numbers "
+            f"({page_list}, in the order the images are given) and values are the extracted text for each page. "
+            "Ensure the response is strictly JSON-formatted."
+        )
+    messages.append({"type": "text", "text": text})
+    return messages
+
+async def process_single_batch(client, model, batch_messages, page_numbers, max_tokens, budget, stats):
+    """Process a single batch of pages; returns (results, failed pages).
+
+    Transport errors are retried with backoff and re-raised once retries or the budget run out.
+    """
+    page_start, page_end = page_numbers[0], page_numbers[-1]
+    label = f"batch {page_start}-{page_end}"
+    # Retries are ours to count against the budget, not the SDK's
+    call_client = client.with_options(max_retries=0)
+
+    def request(guided):
+        # vLLM turns the schema into guided decoding, so the answer cannot stray from the expected keys
+        extra = {"response_format": page_response_format(page_numbers)} if guided else {}
+        return lambda: call_client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": batch_messages}],
+            temperature=0.2,
+            max_tokens=max_tokens,
+            **extra
+        )
+
+    guided = guided_decoding_enabled and model not in guided_decoding_unsupported
+    try:
+        try:
+            response = await call_with_backoff(model, request(guided), budget, label)
+        except BadRequestError as e:
+            # Backends without guided decoding reject response_format; if the plain request works, stop sending it.
+            # Any other 400 (context overflow, a bad image) says nothing about the schema and fails the batch as before.
+            # The plain request is one more call for the batch, so it is paid from the budget like any retry
+            if not guided or not rejects_response_format(e) or not budget.take():
+                raise
+            response = await call_with_backoff(model, request(False), budget, label)
+            guided_decoding_unsupported.add(model)
+            logger.warning(f"Backend for {model} rejected response_format, falling back to prompt-only JSON: {str(e)}")
+    except BadRequestError as e:
+        # Typically the batch overflowing the context; a smaller batch can still succeed
+        logger.error(f"API request rejected for batch {page_start}-{page_end}: {str(e)}")
+        return None, list(page_numbers)
+    except Exception as e:
+        logger.error(f"API request failed for batch {page_start}-{page_end}: {str(e)}")
+        raise
+    raw_response = response.choices[0].message.content
+    logger.debug(f"Raw response for batch {page_start}-{page_end}: {raw_response}")
+
+    cleaned_response = clean_response(raw_response)
+    if not cleaned_response:
+        logger.warning(f"Empty response for batch {page_start}-{page_end}")
+        stats.record("failed", 0, len(page_numbers))
+        return None, list(page_numbers)
+
+    outcome = "clean"
+    try:
+        batch_results = json.loads(cleaned_response)
+    except json.JSONDecodeError as e:
+        # Truncated by max_tokens or slightly malformed: keep every page that came through whole
+        batch_results, closed = salvage_json_object(cleaned_response)
+        if not batch_results:
+            logger.error(f"JSON parsing failed for batch {page_start}-{page_end}: {str(e)}")
+            stats.record("failed", 0, len(page_numbers))
+            return None, list(page_numbers)
+        outcome = "salvaged"
+        logger.warning(
+            f"Salvaged {len(batch_results)} pages from {'malformed' if closed else 'truncated'} JSON "
+            f"for batch {page_start}-{page_end}: {str(e)}"
+        )
+    if not isinstance(batch_results, dict):
+        logger.warning(f"Response is not a JSON object for batch {page_start}-{page_end}")
+        stats.record("failed", 0, len(page_numbers))
+        return None, list(page_numbers)
+    # Pages the model left out are failed too, so they get recovered instead of silently dropped
+    results = {str(p): batch_results[str(p)] for p in page_numbers if str(p) in batch_results}
+    failed = [p for p in page_numbers if str(p) not in batch_results]
+    stats.record(outcome, len(results), len(failed))
+    return results, failed
+
+async def run_poppler(args, fallback):
+    """Run a poppler utility and return its stdout, or None when it is missing or fails."""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await proc.communicate()
+    except OSError as e:
+        logger.warning(f"{args[0]} unavailable, {fallback}: {str(e)}")
+        return None
+    if proc.returncode != 0:
+        logger.warning(f"{args[0]} failed, {fallback}: {stderr.decode(errors='ignore')}")
+        return None
+    return stdout
+
+async def extract_text_layer(pdf_path, num_pages):
+    """Read the embedded text layer of every page with poppler's pdftotext."""
+    stdout = await run_poppler(["pdftotext", "-enc", "UTF-8", pdf_path, "-"], "using vision extraction for all pages")
+    if stdout is None:
+        return []
+
+    # pdftotext terminates every page with a form feed
+    pages = stdout.decode("utf-8", errors="replace").split("\f")[:-1]
+    if len(pages) != num_pages:
+        logger.warning(f"pdftotext returned {len(pages)} pages for a {num_pages}-page PDF, ignoring text layer")
+        return []
+    return pages
+
+async def find_scanned_pages(pdf_path, num_pages):
+    """Pages drawn mostly as one image, i.e. scans, found with poppler's pdfimages and pdfinfo.
+
+    The text layer of a scan is OCR output of unknown quality, so only the other, born-digital
+    pages may skip vision extraction. Returns None when the PDF could not be inspected.
+    """
+    fallback = "not trusting the text layer"
+    image_list, info = await asyncio.gather(
+        run_poppler(["pdfimages", "-list", pdf_path], fallback),
+        run_poppler(["pdfinfo", "-f", "1", "-l", str(num_pages), pdf_path], fallback)
+    )
+    if image_list is None or info is None:
+        return None
+
+    # "Page    1 size: 612 x 792 pts (letter)"
+    page_areas = {
+        int(page): float(width) * float(height)
+        for page, width, height in re.findall(r"^Page\s+(\d+) size: ([\d.]+) x ([\d.]+) pts", info.decode(errors="replace"), re.M)
+    }
+    scanned = set()
+    # After two header lines: page num type width height color comp bpc enc interp object ID x-ppi y-ppi size ratio
+    for line in image_list.decode(errors="replace").splitlines()[2:]:
+        fields = line.split()
+        if len(fields) < 14 or fields[2] != "image":
+            continue
+        try:
+            page, width, height = int(fields[0]), int(fields[3]), int(fields[4])
+            x_ppi, y_ppi = float(fields[12]), float(fields[13])
+        except ValueError:
+            continue
+        page_area = page_areas.get(page)
+        if not page_area or not x_ppi or not y_ppi:
+            continue
+        # Pixels at the resolution the image is drawn at give its size on the page, in points
+        coverage = (width / x_ppi * 72) * (height / y_ppi * 72) / page_area
+        if coverage >= text_layer_scan_min_coverage:
+            scanned.add(page)
+    return scanned
+
+def has_usable_text(text):
+    """Decide whether a page's text layer can replace vision extraction."""
+    stripped = "".join(text.split())
+    if len(stripped) < text_layer_min_chars:
+        return False
+    # Scanned pages with junk OCR layers or broken font encodings are mostly non-alphanumeric
+    alnum = sum(1 for c in stripped if c.isalnum())
+    return alnum / len(stripped) >= text_layer_min_alnum_ratio
+
+def render_page_range(pdf_path, page_numbers, dpi=200, grayscale=False):
+    """Render the given PDF pages, one contiguous run at a time, keyed by 1-based page number."""
+    images = {}
+    run_start = None
+    for i, page_num in enumerate(page_numbers):
+        if run_start is None:
+            run_start = page_num
+        if i + 1 == len(page_numbers) or page_numbers[i + 1] != page_num + 1:
+            run_images = convert_from_path(pdf_path, dpi=dpi, grayscale=grayscale, first_page=run_start, last_page=page_num)
+            for offset, image in enumerate(run_images):
+                images[run_start + offset] = image
+            run_start = None
+    return images
+
+def page_ink_ratio(image):
+    """Share of dark pixels on a downscaled grayscale copy, a cheap proxy for text density."""
+    gray = image.convert("L")
+    gray.thumbnail((256, 256))
+    histogram = gray.histogram()
+    return sum(histogram[:128]) / max(1, sum(histogram))
+
+def autocrop_whitespace(image, threshold=245, margin=16):
+    """Trim near-white page margins, keeping a small border around the content."""
+    # Anything darker than the threshold counts as content
+    mask = image.convert("L").point(lambda value: 255 if value < threshold else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return image
+    left, top, right, bottom = bbox
+    return image.crop((
+        max(0, left - margin), max(0, top - margin),
+        min(image.width, right + margin), min(image.height, bottom + margin)
+    ))
+
+def render_and_encode(pdf_path, page_numbers, profile):
+    """Render pages with a render profile and encode them as data URLs. Runs in a render pool worker process."""
+    image_format = profile["format"]
+    if image_format == "WEBP" and not features.check("webp"):
+        image_format = "JPEG"
+    encoded = {}
+    for page_num, image in render_page_range(pdf_path, page_numbers, profile["dpi"], profile["grayscale"]).items():
+        try:
+            # Measure density on the full page so cropping margins does not inflate the output estimate
+            ink_ratio = page_ink_ratio(image)
+            fingerprint = page_fingerprint(image)
+            if profile["autocrop"]:
+                image = autocrop_whitespace(image)
+            if profile["max_long_edge"]:
+                image.thumbnail((profile["max_long_edge"], profile["max_long_edge"]))
+            image_bytes_io = BytesIO()
+            image.save(image_bytes_io, format=image_format, quality=profile["quality"])
+            image_bytes_io.seek(0)
+            image_base64 = encode_image(image_bytes_io)
+            encoded[page_num] = {
+                "image_url": f"data:image/{image_format.lower()};base64,{image_base64}",
+                "bytes": len(image_base64),
+                "width": image.width,
+                "height": image.height,
+                "ink_ratio": ink_ratio,
+                "fingerprint": fingerprint
+            }
+        except Exception as e:
+            logger.error(f"Image processing failed for page {page_num}: {str(e)}")
+    return encoded
+
+def resolve_render_profile(model, render_profile=None):
+    """Pick the request's render profile, else the model's default."""
+    name = render_profile or model_render_profiles.get(model, default_render_profile)
+    if name not in render_profiles:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown render profile {name}. Choose from: {', '.join(render_profiles)}"
+        )
+    return name
+
+async def render_pdf_to_png(pdf_path, page_numbers, profile):
+    """Render and encode the given PDF pages in the render pool, keyed by 1-based page number."""
+    try:
+        return await render_pool.run(render_and_encode, pdf_path, page_numbers, profile)
+    except Exception as e:
+        logger.error(f"PDF conversion failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to convert PDF to images: {str(e)}")
+
+async def process_page_batch(client, model, images, batch_pages, max_tokens, progress, budget, stats):
+    """Extract one rendered batch, bisecting failed pages while their images are still held."""
+    results = {}
+    # Pages that failed to render or encode have no image to send
+    skipped_pages = [page_num for page_num in batch_pages if page_num not in images]
+    sent_pages = [page_num for page_num in batch_pages if page_num in images]
+    if not sent_pages:
+        logger.warning(f"Skipping batch {batch_pages[0]}-{batch_pages[-1]}: No valid images")
+        return results, skipped_pages
+
+    async def extract(pages, retry):
+        try:
+            batch_data, failed = await process_single_batch(client, model, page_messages(images, pages), pages, max_tokens, budget, stats)
+        except Exception:
+            # The backend is unreachable or refuses the request; splitting it further won't help
+            skipped_pages.extend(pages)
+            return
+        if batch_data:
+            results.update(batch_data)
+            progress.add_pages(batch_data, "vlm", retry=retry)
+        if not failed:
+            return
+        if len(pages) == 1:
+            skipped_pages.extend(failed)
+            return
+        # Halving isolates a bad page in O(log n) calls instead of one call per page
+        halves = [failed[:len(failed) // 2], failed[len(failed) // 2:]] if len(failed) > 1 else [failed]
+        retries = []
+        for half in halves:
+            if budget.take():
+                retries.append(extract(half, True))
+            else:
+                skipped_pages.extend(half)
+        await asyncio.gather(*retries)
+
+    await extract(sent_pages, False)
+    return results, sorted(skipped_pages)
+
+class ExtractionProgress:
+    """Per-page state of one extraction, readable while it is still running."""
+
+    def __init__(self):
+        self.total_pages = None
+        self.results = {}
+        self.page_engines = {}
+        self.blank_pages = []
+        self.skipped_pages = []
+        self.started = time.monotonic()
+        self.listeners = []
+
+    def subscribe(self):
+        """Queue that receives an (event, data) pair for every later change."""
+        queue = asyncio.Queue()
+        self.listeners.append(queue)
+        return queue
+
+    def emit(self, event, **data):
+        if not self.listeners:
+            return
+        data.update(
+            total_pages=self.total_pages,
+            completed_pages=self.completed_pages(),
+            skipped_pages=sorted(set(self.skipped_pages)),
+            elapsed=round(time.monotonic() - self.started, 3)
+        )
+        for queue in self.listeners:
+            queue.put_nowait((event, data))
+
+    def start(self, total_pages):
+        self.total_pages = total_pages
+        self.emit("start")
+
+    def add_pages(self, results, engine, retry=False):
+        for page_num, text in results.items():
+            self.results[str(page_num)] = text
+            self.page_engines[str(page_num)] = engine
+        if results:
+            self.emit("pages", pages=results, engine=engine, retry=retry)
+
+    def add_blank(self, page_num):
+        self.blank_pages.append(page_num)
+        self.emit("blank", page=page_num)
+
+    def add_skipped(self, page_numbers):
+        self.skipped_pages.extend(page_numbers)
+        if page_numbers:
+            self.emit("skipped", pages=page_numbers)
+
+    def completed_pages(self):
+        return len(set(self.results) | {str(p) for p in self.blank_pages} | {str(p) for p in self.skipped_pages})
+
+    def snapshot(self):
+        return {
+            "total_pages": self.total_pages,
+            "completed_pages": self.completed_pages(),
+            "page_engines": self.page_engines,
+            "blank_pages": sorted(self.blank_pages),
+            "skipped_pages": sorted(set(self.skipped_pages))
+        }
+
+async def extract_vision_pages(client, model, pdf_path, vision_pages, profile, progress):
+    """Render and extract pages as a pipeline, keeping at most render_window_pages rendered pages in flight."""
+    planner = BatchPlanner(model)
+    render_chunk = 4
+    window = asyncio.Semaphore(max(render_window_pages, planner.max_pages + render_chunk))
+    batch_plan = []
+    bytes_per_page = {}
+    page_filter = PageFilter()
+    batch_tasks = []
+    skipped_pages = []
+    budget = RetryBudget(len(vision_pages))
+
+    async def run_batch(batch, plan_entry):
+        stats = ParseStats(parent=parse_stats)
+        try:
+            batch_data, batch_skipped = await process_page_batch(
+                client, model, batch["images"], batch["pages"], batch["max_tokens"], progress, budget, stats
+            )
+            progress.add_skipped(batch_skipped)
+            return batch_data, batch_skipped
+        finally:
+            plan_entry["parse"] = stats.report()
+            batch["images"].clear()
+            for _ in batch["pages"]:
+                window.release()
+
+    def submit(batch):
+        plan_entry = BatchPlanner.describe(batch)
+        batch_plan.append(plan_entry)
+        batch_tasks.append(asyncio.create_task(run_batch(batch, plan_entry)))
+
+    try:
+        for chunk_idx in range(0, len(vision_pages), render_chunk):
+            chunk_pages = vision_pages[chunk_idx:chunk_idx + render_chunk]
+            for _ in chunk_pages:
+                await window.acquire()
+            try:
+                rendered = await render_pdf_to_png(pdf_path, chunk_pages, profile)
+            except Exception:
+                for _ in chunk_pages:
+                    window.release()
+                raise
+            for page_num in chunk_pages:
+                if page_num not in rendered:
+                    skipped_pages.append(page_num)
+                    progress.add_skipped([page_num])
+                    window.release()
+                    continue
+                page = rendered.pop(page_num)
+                # Blank and repeated pages never reach the model
+                verdict = page_filter.check(page_num, page.pop("fingerprint"))
+                if verdict:
+                    if verdict == "blank":
+                        progress.add_blank(page_num)
+                    window.release()
+                    continue
+                bytes_per_page[str(page_num)] = page["bytes"]
+                # Submit each batch as soon as it is packed instead of after the whole document
+                for batch in planner.add(page_num, page):
+                    submit(batch)
+        for batch in planner.flush():
+            submit(batch)
+    except BaseException:
+        # Also on cancellation, so a cancelled job stops its in-flight model calls
+        for task in batch_tasks:
+            task.cancel()
+        await asyncio.gather(*batch_tasks, return_exceptions=True)
+        raise
+
+    all_results = {}
+    batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
+    for batch_result in batch_results:
+        if isinstance(batch_result, Exception):
+            logger.error(f"Batch processing failed: {str(batch_result)}")
+            continue
+        batch_data, batch_skipped = batch_result
+        all_results.update(batch_data)
+        skipped_pages.extend(batch_skipped)
+    failed_duplicates = page_filter.apply(all_results)
+    skipped_pages.extend(failed_duplicates)
+    progress.add_pages({str(p): all_results[str(p)] for p in page_filter.duplicates if str(p) in all_results}, "duplicate")
+    progress.add_skipped(failed_duplicates)
+    return all_results, skipped_pages, {
+        "batch_plan": batch_plan,
+        "bytes_per_page": bytes_per_page,
+        "recovery": budget.report(),
+        **page_filter.report()
+    }
+
+async def extract_text_from_pdf(client, model, pdf_path, profile_name, progress=None):
+    """Extract text from PDF using the text layer where usable, else batches and retries."""
+    all_results = {}
+    skipped_pages = []
+    page_engines = {}
+    progress = progress or ExtractionProgress()
+
+    try:
+        num_pages = (await render_pool.run(pdfinfo_from_path, pdf_path))["Pages"]
+    except Exception as e:
+        logger.error(f"PDF inspection failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to convert PDF to images: {str(e)}")
+    progress.start(num_pages)
+
+    text_pages, scanned_pages = [], set()
+    if text_layer_enabled:
+        text_pages, scanned_pages = await asyncio.gather(
+            extract_text_layer(pdf_path, num_pages), find_scanned_pages(pdf_path, num_pages)
+        )
+        if scanned_pages is None:
+            # A scan cannot be told from a born-digital page, so no text layer is trusted
+            text_pages, scanned_pages = [], set()
+    vision_pages = []
+    for page_num in range(1, num_pages + 1):
+        if text_pages and page_num not in scanned_pages and has_usable_text(text_pages[page_num - 1]):
+            all_results[str(page_num)] = text_pages[page_num - 1].strip()
+            page_engines[str(page_num)] = "text_layer"
+        else:
+            vision_pages.append(page_num)
+    logger.info(f"{num_pages - len(vision_pages)} pages from text layer, {len(vision_pages)} pages for vision extraction ({len(scanned_pages)} scanned)")
+    progress.add_pages(all_results, "text_layer")
+
+    vision_results, skipped_pages, vision_info = await extract_vision_pages(
+        client, model, pdf_path, vision_pages, render_profiles[profile_name], progress
+    )
+    all_results.update(vision_results)
+
+    for page_num in vision_pages:
+        if str(page_num) in all_results:
+            page_engines[str(page_num)] = "duplicate" if str(page_num) in vision_info["duplicate_pages"] else "vlm"
+
+    return all_results, skipped_pages, {
+        "page_engines": page_engines,
+        "blank_pages": vision_info["blank_pages"],
+        "duplicate_pages": vision_info["duplicate_pages"],
+        "batch_plan": vision_info["batch_plan"],
+        "recovery": vision_info["recovery"],
+        "render": {
+            "profile": profile_name,
+            **render_profiles[profile_name],
+            "bytes_per_page": vision_info["bytes_per_page"],
+            "bytes_total": sum(vision_info["bytes_per_page"].values())
+        }
+    }
+
+async def extract_document(client, model, document, profile_name, filename, progress=None):
+    """Extract a staged PDF, serving and filling the extraction cache.
+
+    Concurrent requests for the same document, model and render profile share one extraction.
+    """
+    cache_key = extraction_cache.make_key(document.sha256, model, profile_name)
+    cached = await asyncio.to_thread(extraction_cache.get, cache_key)
+    if cached:
+        logger.info(f"Extraction cache hit for {filename}")
+        if progress:
+            replay_progress(progress, cached, "cache")
+        return cached
+
+    async def extract():
+        all_results, skipped_pages, extraction_info = await extract_text_from_pdf(client, model, document.path, profile_name, progress)
+        # Only cache complete extractions so failed pages get another chance next upload
+        if not skipped_pages:
+            await asyncio.to_thread(extraction_cache.set, cache_key, all_results, skipped_pages, extraction_info)
+        return all_results, skipped_pages, extraction_info
+
+    def start():
+        # The shared extraction can outlive the request that started it, so it holds the scratch copy too
+        document.retain()
+        return extract()
+
+    result, joined = await extraction_flights.run(cache_key, start, on_done=document.cleanup)
+    if joined:
+        logger.info(f"Joined in-flight extraction of {filename}")
+        if progress:
+            replay_progress(progress, result, "shared")
+    return result
+
+def replay_progress(progress, result, engine):
+    """Fill a progress tracker at once from an extraction that finished elsewhere."""
+    results, skipped_pages, info = result
+    progress.start(len(results) + len(info.get("blank_pages", [])) + len(skipped_pages))
+    progress.add_pages(results, engine)
+    for page_num in info.get("blank_pages", []):
+        progress.add_blank(page_num)
+    progress.add_skipped(skipped_pages)
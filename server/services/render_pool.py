@@ -0,0 +1,79 @@
+# File: services/render_pool.py
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import logging
+from server.constants import render_pool_workers
+
+logger = logging.getLogger(__name__)
+
+def _warm_worker():
+    return os.getpid()
+
+# Process pool for CPU-bound page rendering and image encoding, kept off the event loop
+class RenderPool:
+    def __init__(self, workers=render_pool_workers):
+        self.workers = workers
+        self.executor = None
+        self.pending = 0
+        self.completed = 0
+        self.restarts = 0
+
+    def start(self):
+        if self.executor is not None:
+            return
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        # Spawn every worker now so the first upload doesn't pay process start-up cost
+        for _ in range(self.workers):
+            self.executor.submit(_warm_worker)
+        logger.info(f"Render pool started with {self.workers} workers")
+
+    def stop(self):
+        if self.executor is None:
+            return
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.executor = None
+        logger.info("Render pool stopped")
+
+    def _replace(self, executor):
+        # Calls that saw the same broken executor replace it once
+        if self.executor is not executor:
+            return
+        logger.warning("Render pool worker died; starting a new pool")
+        executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = None
+        self.restarts += 1
+        self.start()
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in a worker process and await its result.
+
+        A worker that dies (killed for memory, or crashed in the renderer) breaks the whole executor. It is
+        replaced and the call retried once, so only a call that breaks the new pool as well fails.
+        """
+        self.start()
+        self.pending += 1
+        try:
+            for attempt in range(2):
+                executor = self.executor
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+                except BrokenProcessPool:
+                    self._replace(executor)
+                    if attempt:
+                        raise
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "queue_depth": max(0, self.pending - self.workers),
+            "completed": self.completed,
+            "restarts": self.restarts
+        }
+
+render_pool = RenderPool()
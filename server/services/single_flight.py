@@ -0,0 +1,55 @@
+# File: services/single_flight.py
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Lets concurrent callers asking for the same key share one run of the work."""
+
+    def __init__(self):
+        self.flights = {}  # key -> [task, waiters]
+        self.started = 0
+        self.joined = 0
+
+    async def run(self, key, start, on_done=None):
+        """Await the running call for key, or start one; returns (result, whether an existing call was joined).
+
+        start and on_done are only used by the caller that starts the call.
+        """
+        flight = self.flights.get(key)
+        joined = flight is not None
+        if flight is None:
+            # A task of its own, so the caller that started it can go away without cancelling it for the rest
+            flight = [asyncio.create_task(start()), 0]
+            self.flights[key] = flight
+            flight[0].add_done_callback(lambda _: self._finished(key, flight, on_done))
+            self.started += 1
+        else:
+            self.joined += 1
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task), joined
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not task.done():
+                # Every caller gave up; later callers start afresh instead of joining a cancelled call
+                logger.info("Cancelling in-flight call nobody is waiting for")
+                self._forget(key, flight)
+                task.cancel()
+
+    def _forget(self, key, flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def _finished(self, key, flight, on_done):
+        self._forget(key, flight)
+        if on_done:
+            on_done()
+
+    def stats(self):
+        return {"in_flight": len(self.flights), "started": self.started, "joined": self.joined}
+
+extraction_flights = SingleFlight()  # Keyed by extraction cache key: document hash, model and render profile
+answer_flights = SingleFlight()  # Keyed by a hash of model, prompts and extracted text
@@ -0,0 +1,17 @@
+# conftest.py
+import os
+import shutil
+import sys
+import tempfile
+
+# Importing the services creates their data directories from these settings, so point them at scratch space first
+scratch_dir = tempfile.mkdtemp(prefix="server-tests-")
+os.environ.setdefault("EXTRACTION_CACHE_DIR", os.path.join(scratch_dir, "extraction_cache"))
+os.environ.setdefault("DOCUMENT_REGISTRY_DIR", os.path.join(scratch_dir, "documents"))
+os.environ.setdefault("SESSION_DB", os.path.join(scratch_dir, "sessions.db"))
+os.environ.setdefault("SESSION_FILE", os.path.join(scratch_dir, "sessions.json"))
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(scratch_dir, ignore_errors=True)
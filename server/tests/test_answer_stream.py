@@ -0,0 +1,92 @@
+# test_answer_stream.py
+import json
+from types import SimpleNamespace
+import pytest
+from fastapi.testclient import TestClient
+
+def chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+class FakeAnswerStream:
+    def __init__(self, chunks, fail_after=None):
+        self.chunks = list(chunks)
+        self.fail_after = fail_after
+        self.sent = 0
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.closed = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.sent == self.fail_after:
+            raise ConnectionError("replica went away")
+        if not self.chunks:
+            raise StopAsyncIteration
+        self.sent += 1
+        return self.chunks.pop(0)
+
+class FakeCompletions:
+    def __init__(self):
+        self.streams = []
+        self.fail_after = None
+
+    async def create(self, model, messages, stream=False, **kwargs):
+        assert stream
+        # The role-only first delta and the usage-only last chunk carry no text
+        answer = FakeAnswerStream([chunk(None), chunk("The total "), chunk("is 42."), SimpleNamespace(choices=[])], self.fail_after)
+        self.streams.append(answer)
+        return answer
+
+@pytest.fixture
+def app(monkeypatch):
+    import server.main as main
+    completions = FakeCompletions()
+    monkeypatch.setattr(main, "get_openai_client", lambda model: SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    return main, completions
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event_line, data_line = block.split("\n")
+        events.append((event_line.removeprefix("event: "), json.loads(data_line.removeprefix("data: "))))
+    return events
+
+def ask(main, session_id):
+    # Leaving the client stops the app, which writes pending session updates
+    with TestClient(main.app) as client:
+        response = client.post("/process_message", data={
+            "prompt": "What is the total?", "extracted_text": json.dumps({"1": "Total: 42"}), "sessionId": session_id, "stream": "true"
+        })
+    session = main.session_store.store.get(f"sessions.{session_id}")
+    return response, parse_events(response.text), [message["content"] for message in session["chatHistory"]]
+
+def test_answer_is_relayed_token_by_token(app):
+    main, completions = app
+    response, events, history = ask(main, "session_streamed")
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert [event for event, _ in events] == ["token", "token", "done"]
+    assert [data["delta"] for _, data in events[:2]] == ["The total ", "is 42."]
+    done = events[-1][1]
+    assert done["response"] == "The total is 42."
+    assert done["extracted_text"] == {"1": "Total: 42"}
+    assert done["sessionId"] == "session_streamed"
+    assert len(done["documentIds"]) == 1
+    assert done["ttft"] is not None
+    assert history == ["What is the total?", "The total is 42."]
+    assert completions.streams[-1].closed
+
+def test_failed_stream_ends_with_an_error_event(app):
+    main, completions = app
+    completions.fail_after = 2
+    response, events, history = ask(main, "session_failed")
+    assert [event for event, _ in events] == ["token", "error"]
+    assert events[-1][1] == {"detail": "Final API request failed: replica went away", "sessionId": "session_failed"}
+    # The partial answer is not recorded as if it were complete
+    assert history == ["What is the total?", "⚠️ Error processing question: replica went away"]
+    assert completions.streams[-1].closed
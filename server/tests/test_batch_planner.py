@@ -0,0 +1,62 @@
+# test_batch_planner.py
+from server.services.batch_planner import BatchPlanner
+
+def page(ink_ratio, width=896, height=896):
+    return {"width": width, "height": height, "ink_ratio": ink_ratio, "image_url": "data:image/jpeg;base64,"}
+
+def planner(max_pages=8, context=8192, max_output=4096):
+    batch_planner = BatchPlanner("gemma3")
+    batch_planner.max_pages, batch_planner.context, batch_planner.max_output = max_pages, context, max_output
+    return batch_planner
+
+def plan(batch_planner, pages):
+    batches = []
+    for page_num, rendered in enumerate(pages, start=1):
+        batches += batch_planner.add(page_num, rendered)
+    return batches + batch_planner.flush()
+
+def test_estimate_counts_patches_and_ink():
+    batch_planner = planner()
+    image_tokens, sparse_output = batch_planner.estimate(page(0.0, width=280, height=140))
+    assert image_tokens == 10 * 5
+    _, dense_output = batch_planner.estimate(page(0.5))
+    assert sparse_output < dense_output
+    # Ink beyond a densely printed page does not raise the estimate further
+    assert batch_planner.estimate(page(0.12))[1] == dense_output
+
+def test_sparse_pages_are_packed_up_to_the_page_cap():
+    batches = plan(planner(max_pages=4), [page(0.0, 280, 280)] * 10)
+    assert [batch["pages"] for batch in batches] == [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10]]
+    assert all(set(batch["images"]) == set(batch["pages"]) for batch in batches)
+
+def test_dense_pages_are_split_by_expected_output():
+    batch_planner = planner(max_output=4096)
+    batches = plan(batch_planner, [page(0.2, 280, 280)] * 8)
+    _, per_page = batch_planner.estimate(page(0.2, 280, 280))
+    assert len(batches) > 1
+    for batch in batches:
+        assert batch["expected_output_tokens"] <= 4096
+        assert len(batch["pages"]) == batch["expected_output_tokens"] // per_page
+
+def test_batches_fit_the_context_window():
+    batch_planner = planner(context=4096, max_output=4096)
+    batches = plan(batch_planner, [page(0.05)] * 12)
+    assert [p for batch in batches for p in batch["pages"]] == list(range(1, 13))
+    for batch in batches:
+        input_tokens = batch_planner.prompt_tokens + batch["image_tokens"]
+        assert input_tokens + batch["expected_output_tokens"] <= 4096 - batch_planner.context_margin_tokens
+        assert batch["expected_output_tokens"] <= batch["max_tokens"] <= 4096 - input_tokens - batch_planner.context_margin_tokens
+
+def test_oversized_page_still_gets_a_batch_of_its_own():
+    batches = plan(planner(context=2048, max_output=512), [page(0.5), page(0.5)])
+    assert [batch["pages"] for batch in batches] == [[1], [2]]
+    assert all(batch["max_tokens"] >= 256 for batch in batches)
+
+def test_describe_leaves_out_the_images():
+    batch = plan(planner(), [page(0.01)])[0]
+    assert BatchPlanner.describe(batch) == {
+        "pages": [1],
+        "image_tokens": batch["image_tokens"],
+        "expected_output_tokens": batch["expected_output_tokens"],
+        "max_tokens": batch["max_tokens"]
+    }
@@ -0,0 +1,45 @@
+# test_client_registry.py
+import asyncio
+import pytest
+from server.services import ai_client, backend_pool
+from server.services.ai_client import ClientRegistry
+from server.services.llm_scheduler import LLMScheduler
+
+def registry_for(monkeypatch, endpoints):
+    scheduler = LLMScheduler(max_inflight=4, max_queue=100, endpoints=endpoints)
+    monkeypatch.setattr(ai_client, "llm_scheduler", scheduler)
+    monkeypatch.setattr(backend_pool, "llm_scheduler", scheduler)
+    monkeypatch.setattr(ai_client, "model_endpoints", endpoints)
+    return ClientRegistry()
+
+def test_each_model_reuses_its_pool(monkeypatch):
+    registry = registry_for(monkeypatch, {"gemma3": "http://gemma/v1", "gpt-oss": "http://gpt-oss/v1"})
+    gemma = registry.get("gemma3")
+    assert registry.get("gemma3") is gemma
+    assert registry.get("gpt-oss") is not gemma
+    assert [replica.base_url for replica in gemma.replicas] == ["http://gemma/v1"]
+    assert set(registry.stats()) == {"http://gemma/v1", "http://gpt-oss/v1"}
+    asyncio.run(registry.close())
+
+def test_models_on_the_same_replicas_share_one_pool(monkeypatch):
+    registry = registry_for(monkeypatch, {"gemma3": "http://a/v1, http://b/v1", "gpt-oss": "http://b/v1/,http://a/v1"})
+    pool = registry.get("gemma3")
+    assert registry.get("gpt-oss") is pool
+    assert [replica.base_url for replica in pool.replicas] == ["http://a/v1", "http://b/v1"]
+    stats = registry.stats()
+    assert list(stats) == ["http://a/v1,http://b/v1"]
+    assert stats["http://a/v1,http://b/v1"]["models"] == ["gemma3", "gpt-oss"]
+
+    async def main():
+        registry.start()
+        assert pool.probe_task is not None
+        await registry.close()
+
+    asyncio.run(main())
+    assert pool.probe_task is None
+    assert registry.stats() == {}
+
+def test_unknown_model_is_rejected(monkeypatch):
+    registry = registry_for(monkeypatch, {"gemma3": "http://gemma/v1"})
+    with pytest.raises(ValueError):
+        registry.get("llama")
@@ -0,0 +1,87 @@
+# test_extraction_cache.py
+import asyncio
+import os
+import pytest
+from server.services import pdf_processor
+from server.services.extraction_cache import ExtractionCache
+from server.services.ingestion import stage_file
+
+@pytest.fixture
+def cache(tmp_path):
+    return ExtractionCache(cache_dir=str(tmp_path / "cache"), max_bytes=1024 * 1024)
+
+def test_key_covers_document_model_and_profile(cache):
+    key = cache.make_key("a" * 64, "qwen", "fidelity")
+    assert key == cache.make_key("a" * 64, "qwen", "fidelity")
+    assert len({
+        key,
+        cache.make_key("b" * 64, "qwen", "fidelity"),
+        cache.make_key("a" * 64, "gemma3", "fidelity"),
+        cache.make_key("a" * 64, "qwen", "compact")
+    }) == 4
+
+def test_entries_round_trip_and_count_hits(cache):
+    key = cache.make_key("a" * 64, "qwen", "fidelity")
+    assert cache.get(key) is None
+    cache.set(key, {"1": "first page"}, [], {"page_engines": {"1": "vlm"}})
+    assert cache.get(key) == ({"1": "first page"}, [], {"page_engines": {"1": "vlm"}})
+    # Another cache over the same directory, as another worker, shares the entry
+    assert ExtractionCache(cache_dir=cache.cache_dir).get(key)[0] == {"1": "first page"}
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 1, 1)
+
+def test_unreadable_entry_is_a_miss(cache):
+    key = cache.make_key("a" * 64, "qwen", "fidelity")
+    with open(cache._path(key), "w") as f:
+        f.write("{not json")
+    assert cache.get(key) is None
+    assert cache.stats()["misses"] == 1
+
+def test_least_recently_used_entries_are_evicted(cache):
+    keys = [cache.make_key(str(i) * 64, "qwen", "fidelity") for i in range(3)]
+    for age, key in enumerate(keys):
+        cache.set(key, {"1": "x" * 1000}, [], {})
+        # Oldest first, whatever the filesystem's mtime resolution
+        os.utime(cache._path(key), (1000 + age, 1000 + age))
+    cache.get(keys[0])
+    cache.max_bytes = sum(os.path.getsize(cache._path(key)) for key in (keys[0], keys[2]))
+    cache.evict()
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+    assert cache.stats()["evictions"] == 1
+
+def test_purge_removes_every_entry(cache):
+    for i in range(3):
+        cache.set(cache.make_key(str(i) * 64, "qwen", "fidelity"), {"1": "text"}, [], {})
+    assert cache.purge() == 3
+    assert cache.stats()["entries"] == 0
+
+def test_second_upload_of_a_document_is_served_from_cache(cache, tmp_path, monkeypatch):
+    calls = []
+
+    async def extract_text_from_pdf(client, model, pdf_path, profile_name, progress=None):
+        calls.append(pdf_path)
+        return {"1": "first page"}, ([2] if model == "flaky" else []), {"page_engines": {"1": "vlm"}}
+
+    monkeypatch.setattr(pdf_processor, "extraction_cache", cache)
+    monkeypatch.setattr(pdf_processor, "extract_text_from_pdf", extract_text_from_pdf)
+    source = tmp_path / "report.pdf"
+    source.write_bytes(b"%PDF-1.4 report")
+
+    async def upload(model):
+        document = await stage_file(str(source))
+        try:
+            return await pdf_processor.extract_document(None, model, document, "fidelity", "report.pdf")
+        finally:
+            document.cleanup()
+
+    first = asyncio.run(upload("qwen"))
+    second = asyncio.run(upload("qwen"))
+    assert first == second == ({"1": "first page"}, [], {"page_engines": {"1": "vlm"}})
+    assert len(calls) == 1
+    # Extractions with skipped pages are not cached, so the next upload retries them
+    asyncio.run(upload("flaky"))
+    asyncio.run(upload("flaky"))
+    assert len(calls) == 3
+    assert cache.stats()["entries"] == 1
@@ -0,0 +1,84 @@
+# test_ingestion.py
+import asyncio
+import errno
+import hashlib
+import io
+import os
+import tempfile
+import pytest
+from fastapi import UploadFile
+from server.services import ingestion
+from server.services.ingestion import stage_file, stage_upload
+
+PDF_BYTES = b"%PDF-1.4\n" + bytes(range(256)) * 40
+
+@pytest.fixture
+def scratch(tmp_path, monkeypatch):
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+    monkeypatch.setattr(ingestion, "scratch_dir", str(scratch))
+    # Several chunks per upload
+    monkeypatch.setattr(ingestion, "ingest_chunk_bytes", 1000)
+    return scratch
+
+def upload(data):
+    spooled = tempfile.SpooledTemporaryFile()
+    spooled.write(data)
+    return UploadFile(file=spooled, filename="report.pdf")
+
+def test_upload_is_copied_once_into_its_own_scratch_directory(scratch):
+    document = asyncio.run(stage_upload(upload(PDF_BYTES)))
+    assert os.path.dirname(document.scratch) == str(scratch)
+    assert document.path == os.path.join(document.scratch, "document.pdf")
+    assert (document.sha256, document.size) == (hashlib.sha256(PDF_BYTES).hexdigest(), len(PDF_BYTES))
+    with open(document.path, "rb") as f:
+        assert f.read() == PDF_BYTES
+
+    other = asyncio.run(stage_upload(upload(PDF_BYTES)))
+    assert other.scratch != document.scratch
+    with document:
+        pass
+    assert not os.path.exists(document.scratch)
+    assert os.path.exists(other.path)
+    other.cleanup()
+    assert os.listdir(scratch) == []
+
+def test_retained_copy_outlives_the_first_cleanup(scratch):
+    document = asyncio.run(stage_upload(upload(PDF_BYTES)))
+    document.retain()
+    document.cleanup()
+    assert os.path.exists(document.path)
+    document.cleanup()
+    assert not os.path.exists(document.scratch)
+
+def test_local_files_are_staged_like_uploads(scratch, tmp_path):
+    source = tmp_path / "report.pdf"
+    source.write_bytes(PDF_BYTES)
+    with asyncio.run(stage_file(str(source))) as document:
+        assert document.sha256 == hashlib.sha256(PDF_BYTES).hexdigest()
+        assert os.path.dirname(document.scratch) == str(scratch)
+
+def test_full_scratch_space_falls_back_to_the_temp_dir(scratch, monkeypatch):
+    copy_into_scratch = ingestion._copy_into_scratch
+
+    def full_tmpfs(source, suffix, scratch_root):
+        if scratch_root == str(scratch):
+            source.read(1000)
+            raise OSError(errno.ENOSPC, "No space left on device")
+        return copy_into_scratch(source, suffix, scratch_root)
+
+    monkeypatch.setattr(ingestion, "_copy_into_scratch", full_tmpfs)
+    with asyncio.run(stage_upload(upload(PDF_BYTES))) as document:
+        assert os.path.dirname(document.scratch) == tempfile.gettempdir()
+        assert document.sha256 == hashlib.sha256(PDF_BYTES).hexdigest()
+
+def test_failed_copy_leaves_nothing_behind(scratch):
+    class BrokenSource(io.BytesIO):
+        def read(self, size=-1):
+            if self.tell():
+                raise ValueError("client went away")
+            return super().read(size)
+
+    with pytest.raises(ValueError):
+        ingestion._stage(BrokenSource(PDF_BYTES), ".pdf")
+    assert os.listdir(scratch) == []
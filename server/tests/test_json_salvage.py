@@ -0,0 +1,35 @@
+# test_json_salvage.py
+from server.services.json_salvage import ParseStats, salvage_json_object
+
+def test_truncated_answer_keeps_complete_pages():
+    text = '{"1": "first page", "2": "second page", "3": "third pa'
+    assert salvage_json_object(text) == ({"1": "first page", "2": "second page"}, False)
+
+def test_closed_object_with_stray_commas():
+    text = '```json\n{"1": "a",, "2": "b",}\n```'
+    assert salvage_json_object(text) == ({"1": "a", "2": "b"}, True)
+
+def test_raw_newlines_inside_strings_are_accepted():
+    assert salvage_json_object('{"1": "line one\nline two"}') == ({"1": "line one\nline two"}, True)
+
+def test_scanning_stops_at_the_first_malformed_pair():
+    assert salvage_json_object('{"1": "a", 2: "b", "3": "c"}') == ({"1": "a"}, False)
+    assert salvage_json_object('{"1": "a", "2" "b"}') == ({"1": "a"}, False)
+
+def test_number_at_the_very_end_may_be_cut_off():
+    assert salvage_json_object('{"1": "a", "2": 12') == ({"1": "a"}, False)
+    assert salvage_json_object('{"1": "a", "2": 12}') == ({"1": "a", "2": 12}, True)
+
+def test_text_without_an_object():
+    assert salvage_json_object("I could not read these pages.") == ({}, False)
+    assert salvage_json_object('{"1": "unterminated') == ({}, False)
+
+def test_parse_stats_roll_up_to_the_parent():
+    parent = ParseStats()
+    stats = ParseStats(parent)
+    stats.record("clean", 3, 0)
+    stats.record("salvaged", 2, 1)
+    stats.record("failed", 0, 4)
+    expected = {"responses": 3, "clean": 1, "salvaged": 1, "failed": 1, "pages_salvaged": 2, "pages_missing": 5}
+    assert stats.report() == expected
+    assert parent.report() == expected
@@ -0,0 +1,113 @@
+# test_llm_retry.py
+import asyncio
+import json
+import math
+from types import SimpleNamespace
+import pytest
+from openai import APIConnectionError
+try:
+    import httpx2 as httpx  # openai>=3 is built on httpx2
+except ImportError:
+    import httpx
+from server.constants import retry_budget_min_calls, retry_budget_per_page
+from server.services import llm_retry
+from server.services.json_salvage import ParseStats
+from server.services.llm_retry import RetryBudget, call_with_backoff
+from server.services.pdf_processor import ExtractionProgress, process_page_batch
+
+def connection_error():
+    return APIConnectionError(request=httpx.Request("POST", "http://replica/v1/chat/completions"))
+
+@pytest.fixture(autouse=True)
+def no_backoff_sleep(monkeypatch):
+    monkeypatch.setattr(llm_retry, "backoff_delay", lambda attempt: 0)
+
+class FakeClient:
+    """Answers extraction calls with every requested page, except that a batch holding a poisoned page gets garbage."""
+
+    def __init__(self, poisoned=(), down=False):
+        self.poisoned = set(poisoned)
+        self.down = down
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def with_options(self, **options):
+        return self
+
+    async def create(self, **kwargs):
+        pages = [int(part["image_url"]["url"].rsplit(",", 1)[1]) for part in kwargs["messages"][0]["content"] if part["type"] == "image_url"]
+        self.calls.append(pages)
+        if self.down:
+            raise connection_error()
+        content = "not json" if self.poisoned & set(pages) else json.dumps({str(p): f"text {p}" for p in pages})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+def extract(client, pages, budget):
+    images = {p: f"data:image/jpeg;base64,{p}" for p in pages}
+    return asyncio.run(process_page_batch(client, "gemma3", images, pages, 1024, ExtractionProgress(), budget, ParseStats()))
+
+def test_budget_scales_with_pages_above_a_floor():
+    assert RetryBudget(1).limit == retry_budget_min_calls
+    assert RetryBudget(1000).limit == math.ceil(1000 * retry_budget_per_page)
+
+def test_budget_denies_calls_once_spent():
+    budget = RetryBudget(1)
+    assert all(budget.take() for _ in range(budget.limit))
+    assert not budget.take()
+    assert budget.report() == {"limit": budget.limit, "spent": budget.limit, "denied": 1}
+
+def test_transient_errors_are_retried_from_the_budget():
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise connection_error()
+        return "answer"
+
+    budget = RetryBudget(1)
+    assert asyncio.run(call_with_backoff("gemma3", call, budget, "test")) == "answer"
+    assert len(attempts) == 3
+    assert budget.spent == 2
+
+def test_retries_stop_when_the_budget_is_spent():
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise connection_error()
+
+    budget = RetryBudget(1)
+    budget.limit = 1
+    with pytest.raises(APIConnectionError):
+        asyncio.run(call_with_backoff("gemma3", call, budget, "test"))
+    assert len(attempts) == 2
+    assert budget.denied == 1
+
+def test_bisection_isolates_a_bad_page():
+    client = FakeClient(poisoned=[4])
+    budget = RetryBudget(100)
+    results, skipped = extract(client, list(range(1, 9)), budget)
+    assert sorted(results, key=int) == ["1", "2", "3", "5", "6", "7", "8"]
+    assert skipped == [4]
+    # 1-8, then halves 1-4 and 5-8, 1-2 and 3-4, 3 and 4: far fewer calls than one per page after the first failure
+    assert client.calls[0] == list(range(1, 9))
+    assert len(client.calls) == 7
+    assert budget.spent == 6
+
+def test_bisection_stops_when_the_budget_is_spent():
+    client = FakeClient(poisoned=[4])
+    budget = RetryBudget(100)
+    budget.limit = 2
+    results, skipped = extract(client, list(range(1, 9)), budget)
+    assert sorted(results, key=int) == ["5", "6", "7", "8"]
+    assert skipped == [1, 2, 3, 4]
+    assert budget.denied == 2
+
+def test_unreachable_backend_fails_the_batch_without_bisecting(monkeypatch):
+    monkeypatch.setattr(llm_retry, "llm_retry_max_attempts", 2)
+    client = FakeClient(down=True)
+    results, skipped = extract(client, [1, 2, 3, 4], RetryBudget(100))
+    assert results == {}
+    assert skipped == [1, 2, 3, 4]
+    assert client.calls == [[1, 2, 3, 4]] * 2
@@ -0,0 +1,64 @@
+# test_multi_worker.py
+import asyncio
+import json
+import multiprocessing
+import os
+import pytest
+from server.services.session_store import RedisStore, SqliteStore, Store, WriteBehindStore, append_turns, create_session_store
+
+# Separate processes, as uvicorn workers are, each with its own connection to one database file
+fork = multiprocessing.get_context("fork")
+
+def write_behind_worker(db_path, worker, turns):
+    async def main():
+        sessions = WriteBehindStore(SqliteStore(db_path, legacy_path=None), interval=0.005)
+        sessions.start()
+        for i in range(turns):
+            session_id = f"sessions.shared-{i % 2}"
+            sessions.update(session_id, append_turns({"content": f"q {worker}-{i}"}, {"content": f"a {worker}-{i}"}))
+            await asyncio.sleep(0.001)
+        await sessions.stop()
+
+    asyncio.run(main())
+
+def open_worker(db_path, legacy_path):
+    store = SqliteStore(db_path, legacy_path=legacy_path)
+    store.update_batch({"sessions.opened": [append_turns({"content": str(os.getpid())})]})
+    store.close()
+
+def run_workers(target, args_per_worker):
+    processes = [fork.Process(target=target, args=args) for args in args_per_worker]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+    assert [process.exitcode for process in processes] == [0] * len(processes)
+
+def test_workers_writing_the_same_sessions_lose_no_turns(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    run_workers(write_behind_worker, [(db_path, worker, 30) for worker in range(4)])
+    store = SqliteStore(db_path, legacy_path=None)
+    turns = [message["content"] for name in ("shared-0", "shared-1") for message in store.get(f"sessions.{name}")["chatHistory"]]
+    assert len(turns) == 4 * 30 * 2
+    # Each question is still followed by its own answer
+    assert all(answer == "a" + question[1:] for question, answer in zip(turns[::2], turns[1::2]))
+    store.close()
+
+def test_workers_starting_together_migrate_the_legacy_file_once(tmp_path):
+    db_path, json_path = str(tmp_path / "sessions.db"), str(tmp_path / "sessions.json")
+    with open(json_path, "w") as f:
+        json.dump({"sessions": {"old": {"chatHistory": [{"content": "hello"}], "timestamp": 1.0}}}, f)
+    run_workers(open_worker, [(db_path, json_path) for _ in range(6)])
+    store = SqliteStore(db_path, legacy_path=json_path)
+    assert store.get("sessions.old")["chatHistory"] == [{"content": "hello"}]
+    assert len(store.get("sessions.opened")["chatHistory"]) == 6
+    assert not os.path.exists(json_path)
+    assert os.path.exists(json_path + ".migrated")
+    store.close()
+
+def test_backend_is_chosen_by_setting():
+    assert isinstance(create_session_store("json"), Store)
+    assert isinstance(create_session_store("sqlite"), SqliteStore)
+    assert isinstance(create_session_store("redis"), RedisStore)
+    with pytest.raises(ValueError):
+        create_session_store("memcached")
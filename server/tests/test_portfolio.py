@@ -0,0 +1,121 @@
+# test_portfolio.py
+import asyncio
+import io
+import json
+import zipfile
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from server.services import portfolio
+from server.services.llm_retry import RetryBudget
+from server.services.portfolio import PortfolioSummary, analyze_pair, parse_verdict, plan_pairs, read_archive, read_profile
+
+COMPANY_XML = "<Unternehmensprofil><Stammdaten><Firmierung>Muster GmbH</Firmierung></Stammdaten></Unternehmensprofil>".encode("utf-8")
+COUNTRY_XML = "<Landesprofil><AllgemeineDaten><Land>Österreich</Land></AllgemeineDaten></Landesprofil>".encode("utf-8")
+
+def test_profiles_are_recognised_by_their_root():
+    company = read_profile("companies/muster.xml", COMPANY_XML)
+    assert (company.kind, company.name) == ("company", "Muster GmbH")
+    country = read_profile("at.xml", COUNTRY_XML)
+    assert (country.kind, country.name) == ("country", "Österreich")
+    # JSON profiles are named after their file
+    profile = read_profile("de.json", json.dumps({"Landesprofil": {"Land": "Deutschland"}}).encode("utf-8"))
+    assert (profile.kind, profile.name) == ("country", "de")
+    assert read_profile("notes.xml", b"<Notizen/>") is None
+
+def test_profile_of_the_wrong_kind_or_size_is_refused(monkeypatch):
+    with pytest.raises(HTTPException) as error:
+        read_profile("at.xml", COUNTRY_XML, "company")
+    assert error.value.status_code == 400
+    # An unrecognised file given as a company profile is taken as one
+    assert read_profile("acme.txt", b"ACME Ltd, Hamburg", "company").name == "acme"
+    monkeypatch.setattr(portfolio, "portfolio_max_profile_bytes", 16)
+    with pytest.raises(HTTPException) as error:
+        read_profile("muster.xml", COMPANY_XML, "company")
+    assert error.value.status_code == 413
+
+def archive_of(files):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    data.seek(0)
+    return data
+
+def test_archive_profiles_are_sorted_by_content():
+    profiles, ignored = read_archive(archive_of({
+        "portfolio/muster.xml": COMPANY_XML,
+        "portfolio/laender/at.xml": COUNTRY_XML,
+        "portfolio/readme.txt": b"read me",
+        "portfolio/notes.xml": b"<Notizen/>",
+        "portfolio/.DS_Store": b"",
+        "__MACOSX/portfolio/._muster.xml": b"",
+    }))
+    assert [(profile.kind, profile.name) for profile in profiles] == [("company", "Muster GmbH"), ("country", "Österreich")]
+    assert ignored == ["portfolio/readme.txt", "portfolio/notes.xml"]
+
+def test_bad_or_oversized_archives_are_refused(monkeypatch):
+    with pytest.raises(HTTPException) as error:
+        read_archive(io.BytesIO(b"not a zip"))
+    assert error.value.status_code == 400
+    monkeypatch.setattr(portfolio, "portfolio_max_profile_bytes", 1024)
+    with pytest.raises(HTTPException) as error:
+        read_archive(archive_of({"huge.xml": b"<Unternehmensprofil>" + b" " * 100000 + b"</Unternehmensprofil>"}))
+    assert error.value.status_code == 413
+
+def test_pairs_are_grouped_by_country(monkeypatch):
+    companies = [read_profile(f"c{i}.txt", b"company", "company") for i in range(3)]
+    countries = [read_profile(f"l{i}.txt", b"country", "country") for i in range(2)]
+    pairs = plan_pairs(companies, countries)
+    assert [(company.name, country.name) for company, country in pairs] == [
+        ("c0", "l0"), ("c1", "l0"), ("c2", "l0"), ("c0", "l1"), ("c1", "l1"), ("c2", "l1")
+    ]
+    with pytest.raises(HTTPException):
+        plan_pairs(companies, [])
+    monkeypatch.setattr(portfolio, "portfolio_max_pairs", 5)
+    with pytest.raises(HTTPException) as error:
+        plan_pairs(companies, countries)
+    assert error.value.status_code == 400
+
+@pytest.mark.parametrize("answer, verdict", [
+    ("Begründung ...\nVERDICT: AFFECTED", "affected"),
+    ("Begründung ...\nverdict: not affected", "unaffected"),
+    ("VERDICT: AFFECTED?\nOn reflection, VERDICT: UNDETERMINED", "undetermined"),
+    ("Ergebnis: Das Unternehmen ist nicht betroffen.", "unaffected"),
+    ("Ergebnis: Das Unternehmen ist betroffen.", "affected"),
+    ("Ergebnis: Eine Beurteilung ist nicht möglich.", "undetermined"),
+    ("No conclusion at all.", "undetermined"),
+])
+def test_verdicts_are_parsed_from_the_answer(answer, verdict):
+    assert parse_verdict(answer) == verdict
+
+def test_pair_analysis_reports_verdicts_and_failures():
+    company = read_profile("muster.xml", COMPANY_XML)
+    country = read_profile("at.xml", COUNTRY_XML)
+    answers = ["Die Anforderungen greifen.\nVERDICT: AFFECTED"]
+    prompts = []
+
+    async def create(model, messages, **kwargs):
+        prompts.append(messages[1]["content"][0]["text"])
+        if not answers:
+            raise ValueError("context length exceeded")
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=answers.pop()))])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    async def main():
+        budget = RetryBudget(2)
+        return [await analyze_pair(client, "gemma3", "Betroffen?", "system", company, country, budget) for _ in range(2)]
+
+    records = asyncio.run(main())
+    assert (records[0]["verdict"], records[0]["company"], records[0]["country"]) == ("affected", "Muster GmbH", "Österreich")
+    assert (records[1]["verdict"], records[1]["error"]) == ("failed", "context length exceeded")
+    # The country profile leads, so pairs of one country share a prompt prefix
+    assert prompts[0].startswith("Country profile (at.xml):")
+
+    summary = PortfolioSummary(2)
+    for record in records:
+        summary.add(record)
+    report = summary.report()
+    assert (report["pairs"], report["completed"], report["affected"], report["failed"]) == (2, 2, 1, 1)
+    assert "response" not in report["results"][0]
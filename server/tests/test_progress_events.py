@@ -0,0 +1,88 @@
+# test_progress_events.py
+import asyncio
+import json
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from server.services.pdf_processor import ExtractionProgress
+
+def test_listeners_get_every_change_with_running_counts():
+    async def main():
+        progress = ExtractionProgress()
+        events = progress.subscribe()
+        progress.start(4)
+        progress.add_pages({"1": "first page"}, "text_layer")
+        progress.add_pages({}, "vlm")
+        progress.add_blank(2)
+        progress.add_skipped([4])
+        progress.add_pages({"3": "third page"}, "vlm", retry=True)
+        return [events.get_nowait() for _ in range(events.qsize())], progress.snapshot()
+
+    events, snapshot = asyncio.run(main())
+    assert [event for event, _ in events] == ["start", "pages", "blank", "skipped", "pages"]
+    assert [data["completed_pages"] for _, data in events] == [0, 1, 2, 3, 4]
+    assert all(data["total_pages"] == 4 for _, data in events)
+    assert events[1][1]["pages"] == {"1": "first page"}
+    assert (events[4][1]["engine"], events[4][1]["retry"]) == ("vlm", True)
+    assert events[4][1]["skipped_pages"] == [4]
+    assert snapshot["page_engines"] == {"1": "text_layer", "3": "vlm"}
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event_line, data_line = block.split("\n")
+        events.append((event_line.removeprefix("event: "), json.loads(data_line.removeprefix("data: "))))
+    return events
+
+@pytest.fixture
+def app(monkeypatch):
+    import server.main as main
+    monkeypatch.setattr(main, "get_openai_client", lambda model: SimpleNamespace())
+    with TestClient(main.app) as client:
+        yield client, main, monkeypatch
+
+def stream_file(client):
+    return client.post("/process_file_stream", files={"file": ("report.pdf", b"%PDF-1.4 report", "application/pdf")})
+
+def test_pages_are_streamed_as_they_complete(app):
+    client, main, monkeypatch = app
+
+    async def extract_document(client, model, document, profile_name, filename, progress=None):
+        progress.start(3)
+        progress.add_pages({"1": "first page"}, "text_layer")
+        progress.add_blank(2)
+        progress.add_pages({"3": "third page"}, "vlm")
+        return {"1": "first page", "3": "third page"}, [], {"page_engines": {"1": "text_layer", "3": "vlm"}}
+
+    monkeypatch.setattr(main, "extract_document", extract_document)
+    response = stream_file(client)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["x-accel-buffering"] == "no"
+    events = parse_events(response.text)
+    assert [event for event, _ in events] == ["start", "pages", "blank", "pages", "done"]
+    done = events[-1][1]
+    assert done["extracted_text"] == {"1": "first page", "3": "third page"}
+    assert done["page_engines"] == {"1": "text_layer", "3": "vlm"}
+    assert done["completed_pages"] == 3
+    assert main.document_registry.get(done["documentId"]).extracted_text == done["extracted_text"]
+
+def test_failed_extraction_ends_with_an_error_event(app):
+    client, main, monkeypatch = app
+
+    async def extract_document(client, model, document, profile_name, filename, progress=None):
+        progress.start(2)
+        progress.add_skipped([1])
+        raise HTTPException(status_code=500, detail="Failed to convert PDF to images")
+
+    monkeypatch.setattr(main, "extract_document", extract_document)
+    events = parse_events(stream_file(client).text)
+    assert [event for event, _ in events] == ["start", "skipped", "error"]
+    assert events[-1][1]["detail"] == "Failed to convert PDF to images"
+    assert events[-1][1]["skipped_pages"] == [1]
+
+def test_only_pdfs_can_be_streamed(app):
+    client, main, monkeypatch = app
+    response = client.post("/process_file_stream", files={"file": ("notes.txt", b"notes", "text/plain")})
+    assert response.status_code == 400
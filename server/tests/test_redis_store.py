@@ -0,0 +1,80 @@
+# test_redis_store.py
+import json
+from types import SimpleNamespace
+import pytest
+from server.services import session_store
+from server.services.session_store import RedisStore, append_turns
+
+fakeredis = pytest.importorskip("fakeredis")
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+def redis_store(server):
+    # One client per store, like separate workers sharing the server
+    return RedisStore(prefix="test:", client=fakeredis.FakeRedis(server=server, decode_responses=True))
+
+def history(store, key):
+    return [message["content"] for message in store.get(key)["chatHistory"]]
+
+def test_batches_write_entries_and_index(server):
+    store = redis_store(server)
+    store.update_batch({
+        "sessions.a": [append_turns({"content": "q1"}), append_turns({"content": "a1"})],
+        "sessions.b": [append_turns({"content": "b"})]
+    })
+    assert history(store, "sessions.a") == ["q1", "a1"]
+    assert store.count("sessions") == 2
+    assert json.loads(store.client.get("test:entry:sessions:b"))["chatHistory"] == [{"content": "b"}]
+    assert store.get("sessions.missing", "default") == "default"
+
+def test_conflicting_update_is_retried_on_the_new_value(server):
+    store, other = redis_store(server), redis_store(server)
+    store.set("sessions.a", {"chatHistory": [{"content": "q1"}]})
+    calls = []
+
+    def answer(value):
+        calls.append(value)
+        if len(calls) == 1:
+            # Another worker appends between this transaction's read and its write
+            other.update_batch({"sessions.a": [append_turns({"content": "from another worker"})]})
+        return append_turns({"content": "a1"})(value)
+
+    store.update_batch({"sessions.a": [answer]})
+    # The first attempt's write was refused, so the update ran again on the other worker's value
+    assert len(calls) == 2
+    assert history(store, "sessions.a") == ["q1", "from another worker", "a1"]
+
+def test_failed_batch_writes_nothing(server):
+    store = redis_store(server)
+    store.set("sessions.a", {"chatHistory": []})
+
+    def fail(value):
+        raise ValueError("bad update")
+
+    with pytest.raises(ValueError):
+        store.update_batch({"sessions.a": [append_turns({"content": "q"})], "sessions.b": [fail]})
+    assert store.get("sessions.a") == {"chatHistory": []}
+    assert store.get("sessions.b") is None
+    assert store.count("sessions") == 1
+
+def test_eviction_drops_idle_entries_then_the_oldest(server, monkeypatch):
+    pytest.importorskip("lupa")  # fakeredis runs Lua scripts through lupa
+    store = redis_store(server)
+    for i in range(5):
+        monkeypatch.setattr(session_store, "time", SimpleNamespace(time=lambda i=i: 100.0 + i))
+        store.set(f"sessions.s{i}", {"chatHistory": [{"content": str(i)}]})
+    store.set("other.kept", {"v": 1})
+
+    # s0 and s1 were idle since before 101.5; of the three left, the oldest goes to fit two
+    assert store.evict("sessions", 101.5, 2) == (2, 1)
+    assert [name for name in (f"s{i}" for i in range(5)) if store.get(f"sessions.{name}")] == ["s3", "s4"]
+    assert store.client.zrange("test:index:sessions", 0, -1) == ["s3", "s4"]
+    assert store.count("sessions") == 2
+    # Other namespaces are untouched
+    assert store.get("other.kept") == {"v": 1}
+
+    # Without an idle cut-off only the limit applies
+    assert store.evict("sessions", None, 1) == (0, 1)
+    assert store.client.zrange("test:index:sessions", 0, -1) == ["s4"]
@@ -0,0 +1,50 @@
+# test_render_pool.py
+import asyncio
+import os
+import signal
+import time
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+from server.services.render_pool import RenderPool
+
+# Only builtins run in the workers, so nothing from the tests has to be importable there
+
+@pytest.fixture
+def pool():
+    pool = RenderPool(workers=1)
+    yield pool
+    pool.stop()
+
+def test_work_runs_in_a_worker_process(pool):
+    async def run():
+        return await pool.run(pow, 2, 10), await pool.run(os.getpid)
+
+    result, pid = asyncio.run(run())
+    assert result == 1024
+    assert pid != os.getpid()
+    stats = pool.stats()
+    assert (stats["completed"], stats["pending"], stats["restarts"]) == (2, 0, 0)
+
+def test_killed_worker_is_replaced_and_the_call_retried(pool):
+    async def run():
+        pid = await pool.run(os.getpid)
+        sleeping = asyncio.create_task(pool.run(time.sleep, 0.5))
+        await asyncio.sleep(0.2)
+        # As the kernel's OOM killer would
+        os.kill(pid, signal.SIGKILL)
+        await sleeping
+        return pid, await pool.run(os.getpid)
+
+    pid, new_pid = asyncio.run(run())
+    assert new_pid != pid
+    assert pool.stats()["restarts"] == 1
+
+def test_call_that_breaks_the_new_pool_too_fails(pool):
+    async def run():
+        with pytest.raises(BrokenProcessPool):
+            await pool.run(os._exit, 1)
+        # The pool left behind still works
+        return await pool.run(pow, 2, 3)
+
+    assert asyncio.run(run()) == 8
+    assert pool.stats()["restarts"] == 2
@@ -0,0 +1,50 @@
+# test_render_window.py
+import asyncio
+import random
+from server.services import batch_planner, pdf_processor
+from server.services.pdf_processor import ExtractionProgress, extract_vision_pages, render_page_range
+
+def test_pages_are_rendered_one_contiguous_run_at_a_time(monkeypatch):
+    runs = []
+
+    def convert_from_path(pdf_path, dpi, grayscale, first_page, last_page):
+        runs.append((first_page, last_page))
+        return [f"image of page {page_num}" for page_num in range(first_page, last_page + 1)]
+
+    monkeypatch.setattr(pdf_processor, "convert_from_path", convert_from_path)
+    images = render_page_range("doc.pdf", [1, 2, 3, 7, 8, 10])
+    assert runs == [(1, 3), (7, 8), (10, 10)]
+    assert images == {page_num: f"image of page {page_num}" for page_num in (1, 2, 3, 7, 8, 10)}
+
+def test_rendered_pages_held_never_exceed_the_window(monkeypatch):
+    monkeypatch.setattr(pdf_processor, "render_window_pages", 6)
+    monkeypatch.setattr(batch_planner, "max_pages_per_batch", 2)
+    fingerprints = random.Random(0)
+    held = {"now": 0, "max": 0}
+    render_calls = []
+
+    async def render_pdf_to_png(pdf_path, page_numbers, profile):
+        render_calls.append(page_numbers)
+        held["now"] += len(page_numbers)
+        held["max"] = max(held["max"], held["now"])
+        return {page_num: {
+            "image_url": f"data:image/jpeg;base64,{page_num}", "bytes": 100, "width": 1000, "height": 1300, "ink_ratio": 0.1,
+            "fingerprint": {"stddev": 60.0, "dhash": fingerprints.getrandbits(256), "thumb": b""}
+        } for page_num in page_numbers}
+
+    async def process_page_batch(client, model, images, batch_pages, max_tokens, progress, budget, stats):
+        # A slow model, so rendering would run ahead of extraction without the window
+        await asyncio.sleep(0.01)
+        held["now"] -= len(batch_pages)
+        return {str(page_num): f"text of page {page_num}" for page_num in batch_pages}, []
+
+    monkeypatch.setattr(pdf_processor, "render_pdf_to_png", render_pdf_to_png)
+    monkeypatch.setattr(pdf_processor, "process_page_batch", process_page_batch)
+    pages = list(range(1, 31))
+    results, skipped_pages, info = asyncio.run(extract_vision_pages(None, "qwen", "doc.pdf", pages, {}, ExtractionProgress()))
+
+    assert results == {str(page_num): f"text of page {page_num}" for page_num in pages}
+    assert skipped_pages == []
+    assert render_calls == [pages[i:i + 4] for i in range(0, 30, 4)]
+    assert [entry["pages"] for entry in info["batch_plan"]] == [pages[i:i + 2] for i in range(0, 30, 2)]
+    assert held["max"] <= 6
@@ -0,0 +1,103 @@
+# test_session_store.py
+import json
+import os
+import threading
+import time
+import pytest
+from server.services.session_store import SqliteStore, append_turns, replace_with
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteStore(str(tmp_path / "sessions.db"), legacy_path=None)
+    yield store
+    store.close()
+
+def history(store, key):
+    return [message["content"] for message in store.get(key)["chatHistory"]]
+
+def test_set_and_get(store):
+    assert store.get("sessions.a", "missing") == "missing"
+    store.set("sessions.a", {"chatHistory": [], "timestamp": 1.0})
+    store.set("sessions.dotted.name", {"v": 1})
+    assert store.get("sessions.a") == {"chatHistory": [], "timestamp": 1.0}
+    assert store.get("sessions.dotted.name") == {"v": 1}
+    # An emptied entry reads as missing, as in the JSON store
+    store.set("sessions.a", {})
+    assert store.get("sessions.a", "missing") == "missing"
+
+def test_updates_apply_in_order_to_the_stored_value(store):
+    store.update_batch({
+        "sessions.a": [append_turns({"content": "q1"}), append_turns({"content": "a1"})],
+        "sessions.b": [replace_with({"chatHistory": [{"content": "b"}]})]
+    })
+    store.update_batch({"sessions.a": [append_turns({"content": "q2"})]})
+    assert history(store, "sessions.a") == ["q1", "a1", "q2"]
+    assert history(store, "sessions.b") == ["b"]
+    assert store.count("sessions") == 2
+
+def test_failed_batch_writes_nothing(store):
+    store.set("sessions.a", {"chatHistory": []})
+
+    def fail(value):
+        raise ValueError("bad update")
+
+    with pytest.raises(ValueError):
+        store.update_batch({"sessions.a": [append_turns({"content": "q"})], "sessions.b": [fail]})
+    assert store.get("sessions.a") == {"chatHistory": []}
+    assert store.get("sessions.b") is None
+
+def test_concurrent_updates_are_all_kept(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    # One store per thread, like separate worker processes sharing the file
+    stores = [SqliteStore(db_path, legacy_path=None) for _ in range(4)]
+
+    def worker(store, n):
+        for i in range(25):
+            store.update_batch({"sessions.shared": [append_turns({"content": f"{n}-{i}"})]})
+
+    threads = [threading.Thread(target=worker, args=(store, n)) for n, store in enumerate(stores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(history(stores[0], "sessions.shared")) == 100
+    for store in stores:
+        store.close()
+
+def test_evict_idle_then_least_recently_written(store):
+    for name in ["old", "a", "b", "c"]:
+        store.set(f"sessions.{name}", {"v": name})
+        time.sleep(0.01)
+    store.set("other.kept", {"v": 1})
+    store.conn.execute("UPDATE entries SET updated = 0 WHERE name = 'old'")
+    assert store.evict("sessions", time.time() - 60, 2) == (1, 1)
+    assert store.get("sessions.old") is None
+    assert store.get("sessions.a") is None
+    assert [store.get(f"sessions.{name}")["v"] for name in ["b", "c"]] == ["b", "c"]
+    assert store.get("other.kept") == {"v": 1}
+
+def test_legacy_json_is_migrated_once(tmp_path):
+    db_path, json_path = str(tmp_path / "sessions.db"), str(tmp_path / "sessions.json")
+    existing = SqliteStore(db_path, legacy_path=None)
+    existing.set("sessions.newer", {"chatHistory": [{"content": "written since"}]})
+    existing.close()
+    with open(json_path, "w") as f:
+        json.dump({"sessions": {
+            "old": {"chatHistory": [{"content": "hello"}], "timestamp": 1.0},
+            "newer": {"chatHistory": [{"content": "stale snapshot"}], "timestamp": 2.0}
+        }}, f)
+
+    store = SqliteStore(db_path, legacy_path=json_path)
+    assert history(store, "sessions.old") == ["hello"]
+    # Entries written since the snapshot win over it
+    assert history(store, "sessions.newer") == ["written since"]
+    assert not os.path.exists(json_path)
+    assert os.path.exists(json_path + ".migrated")
+    # The imported session keeps its own age, so eviction sees it as long idle
+    assert store.evict("sessions", time.time() - 60, 0) == (1, 0)
+    store.close()
+
+    # A second open has nothing left to import
+    reopened = SqliteStore(db_path, legacy_path=json_path)
+    assert reopened.count("sessions") == 1
+    reopened.close()
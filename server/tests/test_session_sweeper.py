@@ -0,0 +1,65 @@
+# test_session_sweeper.py
+import asyncio
+import time
+import pytest
+from server.services.session_store import SessionSweeper, SqliteStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteStore(str(tmp_path / "sessions.db"), legacy_path=None)
+    yield store
+    store.close()
+
+def add_sessions(store, ages):
+    now = time.time()
+    for name, age in ages.items():
+        store.set(f"sessions.{name}", {"chatHistory": [], "timestamp": now - age})
+        store.conn.execute("UPDATE entries SET updated = ? WHERE name = ?", (now - age, name))
+
+def live(store):
+    return sorted(row[0] for row in store.conn.execute("SELECT name FROM entries WHERE namespace = 'sessions'"))
+
+def test_idle_sessions_expire_then_the_least_recently_used_go(store):
+    add_sessions(store, {"idle": 7200, "a": 300, "b": 200, "c": 100, "d": 0})
+    store.set("jobs.kept", {"status": "running"})
+    sweeper = SessionSweeper(store, ttl_seconds=3600, max_sessions=3)
+    assert sweeper.sweep() == 2
+    assert live(store) == ["b", "c", "d"]
+    assert store.get("jobs.kept") == {"status": "running"}
+    stats = sweeper.stats()
+    assert (stats["live_sessions"], stats["evicted_expired"], stats["evicted_lru"], stats["sweeps"]) == (3, 1, 1, 1)
+    assert stats["backend"] == "SqliteStore"
+    # Nothing left to do
+    assert sweeper.sweep() == 0
+
+def test_ttl_of_zero_keeps_idle_sessions(store):
+    add_sessions(store, {"idle": 10 ** 6, "recent": 0})
+    sweeper = SessionSweeper(store, ttl_seconds=0, max_sessions=10)
+    assert sweeper.sweep() == 0
+    assert live(store) == ["idle", "recent"]
+
+def test_background_sweeps_survive_a_failing_store(store):
+    add_sessions(store, {"idle": 7200})
+
+    class FlakyStore:
+        def __init__(self):
+            self.calls = 0
+
+        def evict(self, namespace, idle_before, max_entries):
+            self.calls += 1
+            if self.calls == 1:
+                raise OSError("database is locked")
+            return store.evict(namespace, idle_before, max_entries)
+
+    sweeper = SessionSweeper(FlakyStore(), ttl_seconds=3600, max_sessions=10, interval=0.01)
+
+    async def main():
+        sweeper.start()
+        while sweeper.sweeps == 0:
+            await asyncio.sleep(0.01)
+        await sweeper.stop()
+
+    asyncio.run(main())
+    assert sweeper.task is None
+    assert sweeper.evicted_expired == 1
+    assert live(store) == []
@@ -0,0 +1,96 @@
+# test_single_flight.py
+import asyncio
+import pytest
+from server.services.single_flight import SingleFlight
+
+def test_concurrent_callers_share_one_run():
+    flights = SingleFlight()
+    runs = []
+    done = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flights.run("key", work, on_done=lambda: done.append(1)) for _ in range(5)))
+
+    outcomes = asyncio.run(main())
+    assert len(runs) == 1
+    assert sorted(outcomes, key=lambda outcome: outcome[1]) == [("result", False)] + [("result", True)] * 4
+    assert done == [1]
+    assert flights.stats() == {"in_flight": 0, "started": 1, "joined": 4}
+
+def test_finished_call_is_not_reused():
+    flights = SingleFlight()
+    runs = []
+
+    async def work():
+        runs.append(1)
+        return len(runs)
+
+    async def main():
+        return [await flights.run("key", work) for _ in range(2)]
+
+    assert asyncio.run(main()) == [(1, False), (2, False)]
+
+def test_errors_reach_every_caller():
+    flights = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("extraction failed")
+
+    async def main():
+        return await asyncio.gather(*(flights.run("key", work) for _ in range(3)), return_exceptions=True)
+
+    outcomes = asyncio.run(main())
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert flights.stats()["in_flight"] == 0
+
+def test_call_survives_the_caller_that_started_it():
+    flights = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return "result"
+
+    async def main():
+        leader = asyncio.create_task(flights.run("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.run("key", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == ("result", True)
+
+def test_call_is_cancelled_once_every_caller_left():
+    flights = SingleFlight()
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def quick():
+        return "fresh"
+
+    async def main():
+        callers = [asyncio.create_task(flights.run("key", work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        # A later caller starts afresh rather than joining the cancelled call
+        return await flights.run("key", quick)
+
+    assert asyncio.run(main()) == ("fresh", False)
+    assert cancelled == [1]
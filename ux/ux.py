@@ -6,7 +6,7 @@ import os
 import json
 import concurrent.futures
 from typing import List, Dict, Tuple, Optional
-from time import time
+from time import time, sleep
 import argparse
 import hashlib
 
@@ -21,10 +21,13 @@ logger = logging.getLogger(__name__)
 # Configuration
 DWANI_API_BASE_URL = os.getenv('DWANI_API_BASE_URL', 'http://localhost')
 API_URL_FILE = f"{DWANI_API_BASE_URL}/process_file"
+API_URL_JOBS = f"{DWANI_API_BASE_URL}/jobs"
 API_URL_MESSAGE = f"{DWANI_API_BASE_URL}/process_message"
 API_URL_HEALTH = f"{DWANI_API_BASE_URL}/health"
 MAX_FILE_SIZE_MB = 10  # Max file size in MB
 MAX_CONCURRENT_FILES = 5  # Max files to process concurrently
+JOB_POLL_INTERVAL = 2  # Seconds between extraction job status checks
+JOB_TIMEOUT = int(os.getenv('JOB_TIMEOUT', '1800'))  # Give up on an extraction job after this many seconds
 
 
 MAX_FILE_SIZE_MB = 10
@@ -150,12 +153,14 @@ Kriterium C (Mitarbeiter): Nicht erfüllt. (Grund: Profil gibt '150 Mitarbeiter'
 oder
 "Basierend auf der Analyse ist das Unternehmen betroffen von der neuen Anforderung, da alle relevanten Kriterien erfüllt sind. Die resultierende Pflicht ist [kurze Beschreibung der Pflicht], welche bis zum [Datum] zu erfüllen ist." """
             }
-            response = requests.post(API_URL_FILE, files=files, data=data, timeout=90)
+            # Extraction runs as a background job so large PDFs are not cut off by request timeouts
+            response = requests.post(API_URL_JOBS, files=files, data=data, timeout=90)
             response.raise_for_status()
-            result = response.json()
+            result = wait_for_job(response.json()['jobId'])
             return {
                 'extracted_text': result.get('extracted_text', {}),
                 'skipped_pages': result.get('skipped_pages', []),
+                'documentId': result.get('documentId'),
                 'sessionId': result.get('sessionId', session_id)
             }
     except requests.RequestException as e:
@@ -165,29 +170,47 @@ oder
         logger.error(f"Unexpected error extracting text from {file_path}: {str(e)}")
         return {'extracted_text': {}, 'skipped_pages': [], 'sessionId': session_id}
 
+def wait_for_job(job_id: str) -> Dict:
+    """Poll an extraction job until it finishes and return its result."""
+    deadline = time() + JOB_TIMEOUT
+    while time() < deadline:
+        response = requests.get(f"{API_URL_JOBS}/{job_id}", timeout=30)
+        response.raise_for_status()
+        job = response.json()
+        if job['status'] == 'completed':
+            return job['result']
+        if job['status'] in ('failed', 'cancelled'):
+            raise requests.RequestException(f"Job {job_id} {job['status']}: {job.get('error', '')}")
+        progress = job.get('progress', {})
+        logger.info(f"Job {job_id}: {progress.get('completed_pages', 0)}/{progress.get('total_pages') or '?'} pages")
+        sleep(JOB_POLL_INTERVAL)
+    requests.delete(f"{API_URL_JOBS}/{job_id}", timeout=30)
+    raise requests.RequestException(f"Job {job_id} did not finish within {JOB_TIMEOUT}s")
+
 def extract_texts(file_paths: List[str], session_id: str) -> Tuple[str, str]:
-    """Extract text from multiple files in parallel and return combined JSON-serialized text and session ID."""
+    """Extract text from multiple files in parallel and return the JSON list of server document IDs and session ID.
+
+    The server keeps the extracted text; chat turns send these IDs instead of the text itself.
+    """
     valid_paths = [p for p in file_paths if validate_file(p)]
     if not valid_paths:
-        return "{}", session_id
+        return "[]", session_id
 
     # Extract texts in parallel
     with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(valid_paths), MAX_CONCURRENT_FILES)) as executor:
         results = list(executor.map(lambda p: extract_single_file(p, session_id), valid_paths))
 
-    # Combine texts into a nested dict {filename: extracted_dict} and update session ID
-    combined_extracted = {}
+    # The server combines several documents into {filename: extracted_dict} itself
+    document_ids = []
     final_session_id = session_id
     for path, result in zip(valid_paths, results):
-        extracted_dict = result['extracted_text']
-        if extracted_dict:
-            basename = os.path.splitext(os.path.basename(path))[0]  # Remove extension
-            combined_extracted[basename] = extracted_dict
+        if result['extracted_text'] and result.get('documentId'):
+            document_ids.append(result['documentId'])
         if result['skipped_pages']:
             logger.warning(f"Skipped pages in {path}: {result['skipped_pages']}")
         final_session_id = result['sessionId']  # Update with the latest session ID from server
 
-    return json.dumps(combined_extracted), final_session_id
+    return json.dumps(document_ids), final_session_id
 
 def process_message(history: List[Dict], message: str, file_input: Optional[List[str]], session_id: str, language: str, extracted_text_state: str, system_prompt: str) -> Tuple[List[Dict], str, str, str, str, str]:
     """Handle chat messages, using server session management. Extracts text only on first query if not already stored."""
@@ -201,10 +224,10 @@ def process_message(history: List[Dict], message: str, file_input: Optional[List
     if not current_paths and not extracted_text_state:
         return history + [{"role": "user", "content": message}, {"role": "assistant", "content": "⚠️ Please upload at least one document first!"}], "", session_id, language, extracted_text_state, system_prompt
 
-    # Extract if not already done
+    # Extract if not already done; the state holds the server's document IDs
     if not extracted_text_state and current_paths:
         extracted_json, new_session_id = extract_texts(current_paths, session_id)
-        if not extracted_json or extracted_json == "{}":
+        if not extracted_json or extracted_json == "[]":
             return history + [{"role": "user", "content": message}, {"role": "assistant", "content": "⚠️ No text could be extracted from the provided documents!"}], "", new_session_id, language, "", system_prompt
         text_for_api = extracted_json
         update_extracted_state = extracted_json
@@ -219,11 +242,14 @@ def process_message(history: List[Dict], message: str, file_input: Optional[List
         # Send query to API
         data = {
             "prompt": f"Answer in {language}: {message}",
-            "extracted_text": text_for_api,
+            "documentId": json.loads(text_for_api),
             "sessionId": new_session_id,
             "system_prompt": system_prompt
         }
         response = requests.post(API_URL_MESSAGE, data=data, timeout=90)
+        if response.status_code == 404:
+            # The server evicted the documents; clearing the state extracts them again on the next question
+            return history + [{"role": "user", "content": message}, {"role": "assistant", "content": "⚠️ The documents expired on the server. Please ask again to re-process them."}], "", new_session_id, language, "", system_prompt
         response.raise_for_status()
         result = response.json()
 